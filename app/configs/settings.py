@@ -29,6 +29,10 @@ class Settings(BaseSettings):
     TAG_ALPHA_DIST: float = 0.25
     TAG_ALPHA_ANGLE: float = 0.25
 
+    # MJPEG thô: decode thẳng sang gray (bỏ decode màu + cvtColor), có thể ở size 1/2, 1/4, 1/8
+    TAG_RAW_MJPEG: bool = False
+    TAG_GRAY_REDUCE: int = 1
+
     # ---------- MQTT ----------
     MQTT_HOST: str = "127.0.0.1"
     MQTT_PORT: int = 1883
@@ -46,11 +50,67 @@ class Settings(BaseSettings):
     RGB_CAM_FPS: int = 30
     RGB_USE_MJPEG: bool = True         # <— bật MJPG nếu cam hỗ trợ
     RGB_BUFFERSIZE: int = 2 
+    RGB_THREADED_CAPTURE: bool = False  # capture thread chỉ giữ frame mới nhất
+    RGB_WAIT_TIMEOUT_S: float = 0.1     # get_frames() chờ frame mới tối đa (threaded)
+    RGB_DECODE_WORKERS: int = 2         # số thread decode MJPEG thô (raw_mjpeg)
+
+    # ---------- Frame bus: 1 capture / thiết bị, fan-out cho nhiều engine ----------
+    FRAME_BUS_ENABLED: bool = False    # bật -> counter/tagdata/unphysics chạy song song trên 1 camera
+    FRAME_BUS_QUEUE: int = 2           # độ sâu queue mỗi subscriber
+    FRAME_BUS_DROP_POLICY: str = "drop_oldest"   # drop_oldest | drop_newest
+
+    # ---------- Warm camera pool (giữ thiết bị mở khi đổi method) ----------
+    CAMERA_WARM_POOL: bool = True
+    CAMERA_WARM_LINGER_S: float = 30.0    # thiết bị rảnh quá lâu mới đóng thật
+    CAMERA_LEASE_TIMEOUT_S: float = 5.0   # chờ owner cũ nhả thiết bị tối đa
+
+    # ---------- Camera watchdog (stall -> reopen tại chỗ, không reload model) ----------
+    CAMERA_WATCHDOG: bool = True
+    CAMERA_STALL_MIN_S: float = 1.0       # ngưỡng stall tối thiểu
+    CAMERA_STALL_FACTOR: float = 10.0     # ngưỡng = max(min, factor * p95 khoảng cách frame)
+    CAMERA_REOPEN_BACKOFF_S: float = 0.5
+    CAMERA_REOPEN_BACKOFF_MAX_S: float = 10.0
 
     # ---------- RealSense (3D) ----------
     RS_WIDTH: int = 640
     RS_HEIGHT: int = 480
     RS_FPS: int = 30
+    RS_THREADED: bool = True      # capture thread + frame_queue, consumer không chờ sensor
+    RS_QUEUE_DEPTH: int = 2       # dung lượng rs.frame_queue
+    RS_DEPTH_MODE: str = "align"  # align: rs.align cả frame | roi: chỉ map depth trong box cần tra
+    # Post-processing depth theo thứ tự, vd "decimation,threshold,spatial,temporal,hole_filling"
+    # (rỗng = depth thô). Chỉ áp cho consumer yêu cầu (follow-me dùng FOLLOWME_DEPTH_FILTERS).
+    RS_FILTERS: str = ""
+    RS_DECIMATION: int = 2
+    RS_THRESHOLD_MIN_M: float = 0.15
+    RS_THRESHOLD_MAX_M: float = 6.0
+    RS_SPATIAL_ALPHA: float = 0.5
+    RS_SPATIAL_DELTA: float = 20.0
+    RS_TEMPORAL_ALPHA: float = 0.4
+    RS_TEMPORAL_DELTA: float = 20.0
+    RS_HOLE_FILLING: int = 1      # 0 fill_from_left | 1 farest_from_around | 2 nearest_from_around
+    FOLLOWME_DEPTH_FILTERS: bool = True
+
+    # ---------- Model registry (model dùng chung toàn process) ----------
+    MODEL_BUDGET_MB: float = 0.0       # > 0: vượt thì LRU evict model không ai giữ; 0 = không giới hạn
+    MODEL_WARMUP: bool = True          # chạy 1 inference giả khi load
+    MODEL_PRELOAD: str = ""            # nạp nền lúc startup, vd "yolo,insightface,mp_hands"; rỗng = lazy
+
+    # ---------- Detector backend: torch (ultralytics) | onnx | onnx_int8 (ONNX Runtime CPU), chọn theo method ----------
+    COUNTER_BACKEND: str = "torch"
+    COUNTER_ONNX_WEIGHTS: str = "yolo11s.onnx"
+    COUNTER_INT8_WEIGHTS: str = "yolo11s.int8.onnx"     # python -m app.tools.quantize_int8
+    FOLLOWME_BACKEND: str = "torch"
+    FOLLOWME_ONNX_WEIGHTS: str = "yolo11s.onnx"
+    FOLLOWME_INT8_WEIGHTS: str = "yolo11s.int8.onnx"
+    ONNX_INTRA_OP_THREADS: int = 0     # 0 = để ORT tự chọn (số core vật lý)
+    ONNX_INTER_OP_THREADS: int = 1
+    ONNX_SHARE_SESSION: bool = True    # 1 session dùng chung giữa các method (run() thread-safe)
+
+    # ---------- Inference server: gom request detect của mọi method thành micro-batch ----------
+    INFERENCE_SERVER: bool = False
+    INFERENCE_MAX_BATCH: int = 8
+    INFERENCE_MAX_WAIT_MS: float = 5.0  # chờ tối đa kể từ request đầu tiên của batch
 
     # ---------- Counter defaults ----------
     COUNTER_YOLO_WEIGHTS: str = "yolo11s.pt"
@@ -62,6 +122,26 @@ class Settings(BaseSettings):
     COUNTER_LOG_INTERVAL: float = 2.0
     COUNTER_MIN_DIST: float = 0.2
     COUNTER_MAX_DIST: float = 6.0
+    # Nhiều camera cửa trong 1 service (1 model YOLO dùng chung, detect theo batch). JSON list, vd:
+    # [{"name":"door1","device":"/dev/video0","line_x":0.5,"camera_side":"left"},{"device":"/dev/video2"}]
+    # Rỗng -> 1 camera RGB_CAM_DEVICE như cũ.
+    COUNTER_CAMERAS: str = ""
+    # Keyframe: YOLO mỗi N frame, giữa các keyframe dời box bằng optical flow LK (1 = detect mọi frame)
+    COUNTER_KEYFRAME_INTERVAL: int = 1
+    COUNTER_KEYFRAME_MIN_CONF: float = 0.5   # tỉ lệ điểm LK bám tốt tối thiểu / box
+    # Motion gate: cửa tĩnh (không chuyển động trong dải quanh line) -> không chạy YOLO
+    COUNTER_MOTION_GATE: bool = False
+    COUNTER_MOTION_METHOD: str = "diff"      # diff (sai khác frame) | mog2
+    COUNTER_MOTION_BAND: float = 0.3         # bề rộng dải quanh line (tỉ lệ width), 1.0 = cả frame
+    COUNTER_MOTION_REDUCE: int = 4           # xét trên gray thu nhỏ 1/N
+    COUNTER_MOTION_MIN_AREA: float = 0.005   # tỉ lệ pixel đổi tối thiểu để tính là có chuyển động
+    COUNTER_MOTION_HOLD_S: float = 1.0       # giữ detect thêm N giây sau chuyển động cuối
+    # ROI detect: "" = cả frame | "band" = dải quanh line | JSON polygon tỉ lệ 0..1, vd
+    # [[0.3,0],[0.7,0],[0.8,1],[0.2,1]]. Camera trong COUNTER_CAMERAS có thể đặt "roi" riêng.
+    COUNTER_ROI: str = ""
+    COUNTER_ROI_BAND: float = 0.4            # bề rộng dải (tỉ lệ width) khi COUNTER_ROI=band
+    # >0: kích thước inference cho crop ROI (ultralytics imgsz=; ONNX cần export dynamic H/W), 0 = mặc định model
+    COUNTER_ROI_IMGSZ: int = 0
 
     # ---------- Unphysics defaults (riêng, không ảnh hưởng counter) ----------
     # -> để bạn không phải gửi overrides
@@ -0,0 +1,14 @@
+import logging
+from fastapi import APIRouter
+from app.core.preload import model_preloader
+from app.schemas.health import HealthResponse
+
+log = logging.getLogger("vision.controller")
+router = APIRouter(prefix="", tags=["health"])
+
+@router.get("/health", response_model=HealthResponse)
+def health():
+    # live: process phục vụ được HTTP; ready: model preload đã nạp xong (orchestrator chờ cờ này)
+    resp = {"live": True, **model_preloader.status()}
+    log.debug("GET /health -> %s", resp)
+    return resp
@@ -0,0 +1,217 @@
+# app/core/camera_pool.py
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+from app.hardware.frame_bus import device_key
+
+log = logging.getLogger("vision.campool")
+
+
+_MODE_ATTRS = ("width", "height", "fps")
+
+
+def _camera_config(camera) -> Tuple[Any, ...]:
+    return (type(camera).__name__,) + tuple(
+        getattr(camera, a, None) for a in _MODE_ATTRS + ("use_mjpg", "threaded", "raw_mjpeg", "decode_mode")
+    )
+
+
+def _mode_only_diff(a: Tuple[Any, ...], b: Tuple[Any, ...]) -> bool:
+    """2 cấu hình chỉ khác width/height/fps (vd counter 1280x720 -> unphysics 640x480)."""
+    n = 1 + len(_MODE_ATTRS)
+    return len(a) == len(b) and a[:1] == b[:1] and a[n:] == b[n:]
+
+
+class _Entry:
+    def __init__(self, key: str):
+        self.key = key
+        self.cond = threading.Condition(threading.Lock())
+        self.camera = None
+        self.config: Tuple[Any, ...] = ()
+        self.owner: Optional[str] = None
+        self.released_at: float = 0.0
+
+
+class LeasedCamera:
+    """
+    Proxy camera do CameraLeaseManager cấp. Mọi thuộc tính/method chuyển tiếp tới
+    camera thật; close()/stop() KHÔNG đóng thiết bị mà trả lease về pool (giữ warm).
+    """
+    warm_handoff = True
+
+    def __init__(self, mgr: "CameraLeaseManager", key: str, camera, owner: str, warm: bool):
+        self._mgr = mgr
+        self._key = key
+        self._camera = camera
+        self._owner = owner
+        self._released = False
+        self.warm = warm   # True nếu thiết bị đã mở sẵn từ owner trước
+
+    def __getattr__(self, name: str):
+        return getattr(self._camera, name)
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._mgr.release(self._key, self._owner)
+
+    stop = close
+
+
+class CameraLeaseManager:
+    """
+    Giữ thiết bị camera mở (warm) qua các lần đổi method và trao tay cho engine kế
+    tiếp qua Condition (không poll, không sleep grace). Thiết bị rảnh quá linger_s
+    mới thực sự đóng. Ghi nhận latency handoff (release owner cũ -> lease owner mới).
+    """
+
+    def __init__(self, linger_s: float = 30.0):
+        self.linger_s = float(linger_s)
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._reaper_stop = threading.Event()
+        self.warm_hits = 0
+        self.cold_opens = 0
+        self.timeouts = 0
+        self.reconfigures = 0   # warm hit nhờ đổi mode trên thiết bị đang mở
+        self.handoff_ms: deque = deque(maxlen=50)
+
+    def _entry(self, key: str) -> _Entry:
+        with self._lock:
+            e = self._entries.get(key)
+            if e is None:
+                e = self._entries[key] = _Entry(key)
+            return e
+
+    def lease(self, camera, owner: str, timeout: float = 5.0) -> Optional[LeasedCamera]:
+        """
+        Lấy quyền dùng thiết bị của `camera` cho `owner`. Nếu pool đang giữ cùng thiết bị
+        với cùng cấu hình thì dùng lại (camera truyền vào bị bỏ, chưa từng mở); chỉ khác
+        độ phân giải / fps thì đổi mode ngay trên capture đang mở (camera.reconfigure).
+        Trả None nếu owner hiện tại không nhả trong `timeout`.
+        """
+        key = device_key(getattr(camera, "device", id(camera)))
+        cfg = _camera_config(camera)
+        e = self._entry(key)
+        t0 = time.monotonic()
+        stale = None
+        with e.cond:
+            if not e.cond.wait_for(lambda: e.owner is None, timeout=timeout):
+                self.timeouts += 1
+                log.warning("Camera %s: %s chờ lease quá %.1fs (owner=%s)", key, owner, timeout, e.owner)
+                return None
+            e.owner = owner
+            warm = e.camera is not None and e.config == cfg
+            if not warm and e.camera is not None and _mode_only_diff(e.config, cfg):
+                warm = self._reconfigure(e.camera, camera)
+                if warm:
+                    e.config = cfg
+                    self.reconfigures += 1
+            if not warm:
+                stale, e.camera, e.config = e.camera, camera, cfg
+                self.cold_opens += 1
+            else:
+                self.warm_hits += 1
+            now = time.monotonic()
+            handoff = (now - e.released_at) * 1000.0 if e.released_at else 0.0
+            cam = e.camera
+        bind = getattr(cam, "bind_owners", None)
+        if callable(bind):   # watchdog publish theo owner hiện tại, không phải người tạo camera
+            bind(lambda: [e.owner] if e.owner else [])
+        if stale is not None:
+            self._close(stale)
+        self.handoff_ms.append(handoff)
+        log.info("Camera %s -> %s (%s, wait=%.1fms, handoff=%.1fms)",
+                 key, owner, "warm" if warm else "cold", (now - t0) * 1000.0, handoff)
+        self._ensure_reaper()
+        return LeasedCamera(self, key, cam, owner, warm)
+
+    @staticmethod
+    def _reconfigure(held, wanted) -> bool:
+        fn = getattr(held, "reconfigure", None)
+        if not callable(fn):
+            return False
+        try:
+            return bool(fn(*(getattr(wanted, a) for a in _MODE_ATTRS)))
+        except Exception as ex:
+            log.warning("Camera reconfigure error: %s", ex)
+            return False
+
+    def release(self, key: str, owner: str) -> None:
+        e = self._entry(key)
+        with e.cond:
+            if e.owner != owner:
+                return
+            e.owner = None
+            e.released_at = time.monotonic()
+            e.cond.notify_all()
+
+    # ---------- đóng thiết bị rảnh ----------
+    @staticmethod
+    def _close(camera) -> None:
+        try:
+            fn = getattr(camera, "close", None) or getattr(camera, "stop", None)
+            if callable(fn):
+                fn()
+        except Exception as ex:
+            log.warning("Camera close error: %s", ex)
+
+    def _ensure_reaper(self) -> None:
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+        self._reaper_stop.clear()
+        self._reaper = threading.Thread(target=self._reap_loop, name="campool-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap_loop(self) -> None:
+        while not self._reaper_stop.wait(1.0):
+            self.close_idle(self.linger_s)
+
+    def close_idle(self, older_than_s: float = 0.0) -> int:
+        now = time.monotonic()
+        closed = 0
+        with self._lock:
+            entries = list(self._entries.values())
+        for e in entries:
+            cam = None
+            with e.cond:
+                if e.owner is None and e.camera is not None and now - e.released_at >= older_than_s:
+                    cam, e.camera, e.config = e.camera, None, ()
+            if cam is not None:
+                self._close(cam)
+                closed += 1
+                log.info("Camera %s closed (idle)", e.key)
+        return closed
+
+    def shutdown(self) -> None:
+        self._reaper_stop.set()
+        self.close_idle(0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            devices = {k: {"owner": e.owner, "open": e.camera is not None} for k, e in self._entries.items()}
+        hs = list(self.handoff_ms)
+        return {
+            "devices": devices,
+            "warm_hits": self.warm_hits,
+            "cold_opens": self.cold_opens,
+            "timeouts": self.timeouts,
+            "reconfigures": self.reconfigures,
+            "last_handoff_ms": round(hs[-1], 2) if hs else None,
+            "max_handoff_ms": round(max(hs), 2) if hs else None,
+        }
+
+
+def _make_manager() -> CameraLeaseManager:
+    from app.configs.settings import settings
+    return CameraLeaseManager(linger_s=float(getattr(settings, "CAMERA_WARM_LINGER_S", 30.0)))
+
+
+camera_leases = _make_manager()
@@ -2,26 +2,32 @@
 from __future__ import annotations
 import threading
 
+from app.configs.settings import settings
+
 class _Container:
     def __init__(self):
         # Hai lock tách biệt cho camera 2D (RGB) và 3D (RealSense)
         self.camera_lock_rgb = threading.RLock()
         self.camera_lock_rs  = threading.RLock()
 
+        # Frame bus: thiết bị RGB được mở 1 lần và chia sẻ -> service RGB không giữ lock độc quyền
+        self.frame_bus_enabled = bool(getattr(settings, "FRAME_BUS_ENABLED", False))
+        rgb_lock = None if self.frame_bus_enabled else self.camera_lock_rgb
+
         # --- Counter (RGB) ---
         from app.services.counter_service import CounterService
         self.counter = CounterService()
-        self.counter.set_camera_lock(self.camera_lock_rgb)
+        self.counter.set_camera_lock(rgb_lock)
 
         # --- Control Unphysics (RGB) ---
         from app.services.unphysics_service import UnphysicsService
         self.unphysics = UnphysicsService()
-        self.unphysics.set_camera_lock(self.camera_lock_rgb)
+        self.unphysics.set_camera_lock(rgb_lock)
 
         # --- TagData (AprilTag, RGB) ---
         from app.services.tag_service import TagService
         self.tag = TagService()
-        self.tag.set_camera_lock(self.camera_lock_rgb)
+        self.tag.set_camera_lock(rgb_lock)
 
         # --- Follow Me (RealSense 3D) ---
         from app.services.followme_service import FollowMeService
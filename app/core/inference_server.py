@@ -0,0 +1,296 @@
+# app/core/inference_server.py
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.model_registry import model_registry, ModelHandle
+
+log = logging.getLogger("vision.inference")
+
+_DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32)
+
+
+def _depth_bucket(n: int) -> str:
+    for b in _DEPTH_BUCKETS:
+        if n <= b:
+            return str(b)
+    return f">{_DEPTH_BUCKETS[-1]}"
+
+
+def _as_numpy(x) -> np.ndarray:
+    if hasattr(x, "cpu"):
+        x = x.cpu().numpy()
+    return np.asarray(x).reshape(-1)
+
+
+def filter_result(res: Any, conf: float, classes: Optional[Tuple[int, ...]]) -> Any:
+    """Lọc 1 kết quả detect (ultralytics Results / Detections) theo conf / classes của request."""
+    boxes = getattr(res, "boxes", None)
+    if boxes is None or len(boxes) == 0:
+        return res
+    keep = _as_numpy(boxes.conf) >= conf
+    if classes is not None:
+        keep &= np.isin(_as_numpy(boxes.cls).astype(np.int64), classes)
+    if keep.all():
+        return res
+    return res[np.flatnonzero(keep).tolist()]
+
+
+class _Request:
+    __slots__ = ("frame", "conf", "classes", "imgsz", "future", "t_submit")
+
+    def __init__(self, frame: np.ndarray, conf: float, classes: Optional[Tuple[int, ...]],
+                 imgsz: Optional[int] = None):
+        self.frame = frame
+        self.conf = conf
+        self.classes = classes
+        self.imgsz = imgsz
+        self.future: Future = Future()
+        self.t_submit = time.monotonic()
+
+
+class InferenceServer:
+    """
+    Server detect trong process cho 1 model (handle từ model registry): mọi engine / camera
+    submit() frame và nhận Future; worker gom request (mọi conf / classes) thành micro-batch
+    tối đa max_batch, chờ tối đa max_wait_ms kể từ request đầu tiên, chạy 1 lần forward với
+    conf nhỏ nhất của batch, không lọc class, rồi lọc lại conf / classes cho từng request.
+    Request khác imgsz (vd crop ROI) không chung được tensor -> vào batch sau.
+    stats(): histogram độ sâu queue (lúc submit) và kích thước batch, thời gian chờ / infer.
+    """
+
+    def __init__(self, model: ModelHandle, *, name: str = "", max_batch: int = 8, max_wait_ms: float = 5.0):
+        self.model = model
+        self.name = name or "/".join(map(str, getattr(model, "key", ("model",))))
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+        self._q: Deque[_Request] = deque()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._t = threading.Thread(target=self._loop, name=f"infer-{self.name}", daemon=True)
+        self.requests = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.batch_hist: Counter = Counter()
+        self.depth_hist: Counter = Counter()
+        self.wait_ms_avg = 0.0
+        self.infer_ms_avg = 0.0
+        self._t.start()
+
+    # ---------- client ----------
+    def submit(self, frame: np.ndarray, *, conf: float,
+               classes: Optional[Sequence[int]] = None, imgsz: Optional[int] = None) -> Future:
+        req = _Request(frame, float(conf), None if classes is None else tuple(int(c) for c in classes),
+                       None if imgsz is None else int(imgsz))
+        with self._cond:
+            if self._stop:
+                raise RuntimeError(f"inference server {self.name} stopped")
+            depth = len(self._q)
+            self._q.append(req)
+            self.requests += 1
+            self.max_depth = max(self.max_depth, depth + 1)
+            self.depth_hist[_depth_bucket(depth)] += 1
+            self._cond.notify()
+        return req.future
+
+    # ---------- worker ----------
+    def _take_batch(self) -> List[_Request]:
+        with self._cond:
+            while not self._q and not self._stop:
+                self._cond.wait()
+            if not self._q:
+                return []
+            first = self._q[0]
+            deadline = first.t_submit + self.max_wait_s
+            while len(self._q) < self.max_batch and not self._stop:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            batch: List[_Request] = []
+            rest: Deque[_Request] = deque()
+            while self._q:
+                r = self._q.popleft()
+                if r.imgsz == first.imgsz and len(batch) < self.max_batch:
+                    batch.append(r)
+                else:
+                    rest.append(r)
+            self._q = rest
+            return batch
+
+    def _infer(self, frames: List[np.ndarray], conf: float, imgsz: Optional[int]) -> List[Any]:
+        m = self.model
+        if hasattr(m, "detect"):   # DetectorBackend (onnx)
+            return list(m.detect(frames, conf=conf, imgsz=imgsz))
+        kw: Dict[str, Any] = {} if imgsz is None else {"imgsz": imgsz}
+        return list(m(frames, conf=conf, verbose=False, **kw))   # ultralytics: list ảnh -> 1 batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                if self._stop:
+                    return
+                continue
+            t0 = time.monotonic()
+            try:
+                results = self._infer([r.frame for r in batch], min(r.conf for r in batch), batch[0].imgsz)
+                if len(results) != len(batch):
+                    raise RuntimeError(f"inference server {self.name}: {len(results)} kết quả cho {len(batch)} frame")
+            except Exception as e:
+                for r in batch:
+                    r.future.set_exception(e)
+                continue
+            infer_ms = (time.monotonic() - t0) * 1000.0
+            wait_ms = sum(t0 - r.t_submit for r in batch) * 1000.0 / len(batch)
+            self.batches += 1
+            self.batch_hist[len(batch)] += 1
+            self.wait_ms_avg = wait_ms if self.batches == 1 else 0.9 * self.wait_ms_avg + 0.1 * wait_ms
+            self.infer_ms_avg = infer_ms if self.batches == 1 else 0.9 * self.infer_ms_avg + 0.1 * infer_ms
+            for r, res in zip(batch, results):
+                try:
+                    r.future.set_result(filter_result(res, r.conf, r.classes))
+                except Exception as e:
+                    r.future.set_exception(e)
+
+    def close(self) -> None:
+        with self._cond:
+            self._stop = True
+            pending, self._q = list(self._q), deque()
+            self._cond.notify_all()
+        for r in pending:
+            r.future.set_exception(RuntimeError(f"inference server {self.name} stopped"))
+        if self._t is not threading.current_thread():
+            self._t.join(timeout=2.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            depth = len(self._q)
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch": round(self.requests / self.batches, 2) if self.batches else None,
+            "queue_depth": depth,
+            "max_queue_depth": self.max_depth,
+            "queue_depth_hist": dict(self.depth_hist),
+            "batch_size_hist": {str(k): v for k, v in sorted(self.batch_hist.items())},
+            "wait_ms_avg": round(self.wait_ms_avg, 2),
+            "infer_ms_avg": round(self.infer_ms_avg, 2),
+            "max_batch": self.max_batch,
+            "max_wait_ms": round(self.max_wait_s * 1000.0, 2),
+        }
+
+
+class InferenceClient:
+    """
+    Phía engine của InferenceServer, cùng giao diện detector đang dùng:
+    detect_person(frame) / detect_persons(frames) / model(frames, conf=, classes=) / track().
+    conf=None luôn thay bằng conf của client (ngưỡng của engine), không để backend tự chọn.
+    release() trả client (server dừng khi hết client).
+    """
+
+    def __init__(self, pool: "InferenceServers", server: InferenceServer, owner: str, conf: float = 0.35):
+        self._pool = pool
+        self.server = server
+        self.owner = owner
+        self.conf = float(conf)
+        self._released = False
+
+    def _conf(self, conf: Optional[float]) -> float:
+        return self.conf if conf is None else float(conf)
+
+    def detect_person(self, frame: np.ndarray, conf: Optional[float] = None):
+        return self.server.submit(frame, conf=self._conf(conf), classes=(0,)).result()
+
+    def detect_persons(self, frames: Sequence[np.ndarray], conf: Optional[float] = None,
+                       imgsz: Optional[int] = None) -> List[Any]:
+        futs = [self.server.submit(f, conf=self._conf(conf), classes=(0,), imgsz=imgsz)
+                for f in frames]   # cùng micro-batch
+        return [f.result() for f in futs]
+
+    def __call__(self, source, conf: Optional[float] = None, classes: Optional[Sequence[int]] = None,
+                 imgsz: Optional[int] = None, **_kw) -> List[Any]:
+        frames = [source] if isinstance(source, np.ndarray) else list(source)
+        futs = [self.server.submit(f, conf=self._conf(conf), classes=classes, imgsz=imgsz) for f in frames]
+        return [f.result() for f in futs]
+
+    predict = __call__
+    track = __call__   # server không giữ tracker theo stream -> như predict
+
+    def stats(self) -> Dict[str, Any]:
+        return self.server.stats()
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._pool._release(self.server)
+
+
+class InferenceServers:
+    """1 InferenceServer / model key (weights, device, backend), dùng chung mọi method; đếm client."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servers: Dict[Tuple[str, str, str], Tuple[InferenceServer, int]] = {}
+
+    def client(self, weights: str, *, device: Optional[str] = "auto", backend: str = "yolo", owner: str = "",
+               conf: float = 0.35, max_batch: int = 8, max_wait_ms: float = 5.0) -> InferenceClient:
+        handle = model_registry.acquire(weights, device=device, backend=backend, owner=f"infer:{owner}")
+        with self._lock:
+            got = self._servers.get(handle.key)
+            if got is None:
+                srv = InferenceServer(handle, max_batch=max_batch, max_wait_ms=max_wait_ms)
+                self._servers[handle.key] = (srv, 1)
+                log.info("Inference server %s start (max_batch=%d, max_wait=%.1fms)", srv.name, max_batch, max_wait_ms)
+            else:
+                srv, n = got
+                self._servers[handle.key] = (srv, n + 1)
+        if got is not None:
+            handle.release()   # server đã giữ 1 reference model
+        return InferenceClient(self, srv, owner, conf=conf)
+
+    def _release(self, srv: InferenceServer) -> None:
+        key = srv.model.key
+        with self._lock:
+            got = self._servers.get(key)
+            if got is None:
+                return
+            n = got[1] - 1
+            if n > 0:
+                self._servers[key] = (srv, n)
+                return
+            del self._servers[key]
+        srv.close()
+        srv.model.release()
+        log.info("Inference server %s stop | %s", srv.name, srv.stats())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            items = list(self._servers.values())
+        return {s.name: {**s.stats(), "clients": n} for s, n in items}
+
+
+inference_servers = InferenceServers()
+
+
+def acquire_detector(weights: str, *, device: Optional[str] = "auto", backend: str = "yolo", owner: str = "",
+                     conf: float = 0.35):
+    """
+    Detector cho engine: INFERENCE_SERVER=True -> client của server dùng chung (micro-batch
+    giữa các method, conf = ngưỡng mặc định của engine); False -> handle model registry như
+    trước. Cả 2 đều có release().
+    """
+    from app.configs.settings import settings
+    if bool(getattr(settings, "INFERENCE_SERVER", False)):
+        return inference_servers.client(weights, device=device, backend=backend, owner=owner, conf=conf,
+                                        max_batch=int(getattr(settings, "INFERENCE_MAX_BATCH", 8)),
+                                        max_wait_ms=float(getattr(settings, "INFERENCE_MAX_WAIT_MS", 5.0)))
+    return model_registry.acquire(weights, device=device, backend=backend, owner=owner)
@@ -9,6 +9,10 @@ from fastapi import FastAPI
 
 from app.configs.settings import settings
 from app.core.container import container
+from app.core.camera_pool import camera_leases
+from app.core.model_registry import model_registry
+from app.core.preload import model_preloader
+from app.core.inference_server import inference_servers
 from app.usecases.counter_usecases import (
     start_counter_uc, stop_counter_uc, status_uc as status_counter_uc
 )
@@ -33,6 +37,7 @@ def register_lifecycle(app: FastAPI):
     METHOD_LOCK_KIND = {
         "counter": "rgb",
         "control_unphysics": "rgb",
+        "tagdata": "rgb",
         "follow_me": "rs",
     }
 
@@ -44,14 +49,16 @@ def register_lifecycle(app: FastAPI):
         return None
 
     def _service_lock(svc) -> object:
-        # các service đã có set_camera_lock(self, lock) -> self._cam_lock
-        return getattr(svc, "_cam_lock", None)
+        # các service đã có set_camera_lock(self, lock) -> self._cam_lock (TagService: self._lock)
+        return getattr(svc, "_cam_lock", None) or getattr(svc, "_lock", None)
 
     def _is_running(method: str) -> bool:
         if method == "counter":
             return container.counter.is_running()
         if method == "control_unphysics":
             return container.unphysics.is_running()
+        if method == "tagdata":
+            return container.tag.is_running()
         if method == "follow_me":
             return container.followme.is_running()
         return False
@@ -62,6 +69,8 @@ def register_lifecycle(app: FastAPI):
                 if container.counter.is_running(): stop_counter_uc(container.counter)
             elif method == "control_unphysics":
                 if container.unphysics.is_running(): stop_unphysics_uc(container.unphysics)
+            elif method == "tagdata":
+                if container.tag.is_running(): stop_tag_uc(container.tag)
             elif method == "follow_me":
                 if container.followme.is_running(): stop_followme_uc(container.followme)
         except Exception as e:
@@ -82,6 +91,7 @@ def register_lifecycle(app: FastAPI):
         pairs = [
             ("counter", container.counter),
             ("control_unphysics", container.unphysics),
+            ("tagdata", container.tag),
             ("follow_me", container.followme),
         ]
         for m, svc in pairs:
@@ -96,7 +106,7 @@ def register_lifecycle(app: FastAPI):
                 log.warning("Preempt stop %s failed: %s", m, e)
 
     def _stop_all():
-        for m in ("counter", "control_unphysics", "follow_me"):
+        for m in ("counter", "control_unphysics", "tagdata", "follow_me"):
             _stop_service(m)
 
     # --------- helpers về chờ lock ---------
@@ -124,15 +134,30 @@ def register_lifecycle(app: FastAPI):
                 return status_counter_uc(container.counter)
             if target_method == "control_unphysics":
                 return status_unphysics_uc(container.unphysics)
+            if target_method == "tagdata":
+                return status_tag_uc(container.tag)
             if target_method == "follow_me":
                 return status_followme_uc(container.followme)
             return {"ok": True, "running": True}
 
         # dừng xung đột theo loại camera
-        _stop_all()
+        t_switch = time.monotonic()
+        kind = METHOD_LOCK_KIND.get(target_method, None)
+        if container.frame_bus_enabled and kind == "rgb":
+            # frame bus: các engine RGB dùng chung 1 capture -> không preempt nhau
+            _stop_conflicts(target_method)
+        elif getattr(settings, "CAMERA_WARM_POOL", True) and kind == "rgb":
+            # warm pool: vẫn 1 method tại 1 thời điểm (dừng hết như cũ), nhưng thiết bị giữ
+            # mở và được trao tay qua lease (Condition) -> không cần poll lock / grace sleep / retry
+            _stop_all()
+            res = start_callable()
+            log.info("Switch -> %s in %.1f ms (camera handoff %s ms)", target_method,
+                     (time.monotonic() - t_switch) * 1000.0, camera_leases.stats().get("last_handoff_ms"))
+            return res if isinstance(res, dict) else {}
+        else:
+            _stop_all()
 
         # chờ đúng loại lock
-        kind = METHOD_LOCK_KIND.get(target_method, None)
         lock = _get_lock_by_kind(kind) if kind else None
         _wait_lock(lock, timeout=5.0)
 
@@ -151,21 +176,37 @@ def register_lifecycle(app: FastAPI):
     def on_startup():
         from app.mqtt.client import mqtt_bus
 
+        # nạp model trên thread nền -> HTTP/MQTT sẵn sàng ngay, /health báo ready khi xong
+        model_preloader.start(settings)
+
         def _snapshot():
-            return {
+            snap = {
                 "running": any([
                     container.counter.is_running(),
                     container.unphysics.is_running(),
+                    container.tag.is_running(),
                     container.followme.is_running()
                 ]),
                 "counter": status_counter_uc(container.counter),
                 "unphysics": status_unphysics_uc(container.unphysics),
+                "tagdata": status_tag_uc(container.tag),
                 "follow_me": status_followme_uc(container.followme),
                 "current_method":
                     "counter" if container.counter.is_running() else
                     ("control_unphysics" if container.unphysics.is_running() else
-                     ("follow_me" if container.followme.is_running() else "idle"))
+                     ("tagdata" if container.tag.is_running() else
+                      ("follow_me" if container.followme.is_running() else "idle")))
             }
+            if container.frame_bus_enabled:
+                from app.hardware.frame_bus import frame_buses
+                snap["frame_bus"] = frame_buses.stats()
+            if getattr(settings, "CAMERA_WARM_POOL", True):
+                snap["camera_pool"] = camera_leases.stats()
+            snap["models"] = model_registry.stats()
+            if getattr(settings, "INFERENCE_SERVER", False):
+                snap["inference"] = inference_servers.stats()
+            snap["ready"] = model_preloader.ready
+            return snap
 
         def _dispatch(mtype: str, method: str, overrides: Optional[Dict[str, Any]]):
             """
@@ -233,6 +274,7 @@ def register_lifecycle(app: FastAPI):
     @app.on_event("shutdown")
     def on_shutdown():
         _stop_all()
+        camera_leases.shutdown()
         try:
             from app.mqtt.client import mqtt_bus
             mqtt_bus.stop()
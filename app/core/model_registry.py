@@ -0,0 +1,355 @@
+# app/core/model_registry.py
+from __future__ import annotations
+
+import copy
+import gc
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+log = logging.getLogger("vision.models")
+
+BACKEND_YOLO = "yolo"
+BACKEND_INSIGHTFACE = "insightface"
+BACKEND_MP_HANDS = "mp_hands"
+BACKEND_ONNX = "onnx"
+
+try:
+    import psutil
+    _PROC = psutil.Process(os.getpid())
+except Exception:
+    _PROC = None
+
+
+def resolve_device(device: Optional[str]) -> str:
+    """"auto" -> cuda:0 nếu torch thấy GPU, ngược lại cpu (để key registry không phụ thuộc chữ 'auto')."""
+    d = str(device or "auto")
+    if d != "auto":
+        return d
+    try:
+        import torch
+        return "cuda:0" if torch.cuda.is_available() else "cpu"
+    except Exception:
+        return "cpu"
+
+
+def _rss_mb() -> float:
+    if _PROC is not None:
+        return _PROC.memory_info().rss / 1e6
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except Exception:
+        return 0.0
+
+
+def _param_mb(model: Any) -> float:
+    net = getattr(model, "model", model)
+    params = getattr(net, "parameters", None)
+    if not callable(params):
+        return 0.0
+    try:
+        return sum(p.numel() * p.element_size() for p in params()) / 1e6
+    except Exception:
+        return 0.0
+
+
+# ---------- loaders (import lazy: thư viện nặng chỉ nạp khi thật sự cần) ----------
+def _load_yolo(weights: str, device: str, warmup: bool):
+    from ultralytics import YOLO
+    m = YOLO(weights)
+    if warmup:
+        m.predict(np.zeros((640, 640, 3), dtype=np.uint8), device=device, verbose=False)
+    return m
+
+
+def _view_yolo(model):
+    # dùng chung nn.Module (weights) nhưng predictor / tracker / callbacks riêng mỗi handle:
+    # counter (predict) và follow-me (track persist=True) chạy song song không giẫm state nhau
+    v = copy.copy(model)
+    v.predictor = None
+    v.callbacks = {k: list(cbs) for k, cbs in getattr(model, "callbacks", {}).items()}
+    return v
+
+
+def _onnx_options() -> Dict[str, Any]:
+    from app.configs.settings import settings
+    return {
+        "intra_op_threads": int(getattr(settings, "ONNX_INTRA_OP_THREADS", 0)),
+        "inter_op_threads": int(getattr(settings, "ONNX_INTER_OP_THREADS", 1)),
+    }
+
+
+def _load_onnx(path: str, _device: str, warmup: bool):
+    from app.hardware.detector import OnnxDetector
+    det = OnnxDetector(path, **_onnx_options())
+    if warmup:
+        det.detect([np.zeros((480, 640, 3), dtype=np.uint8)])
+    return det
+
+
+def _view_onnx(det):
+    # ONNX_SHARE_SESSION=False: mỗi handle 1 session riêng (so sánh latency khi 2 method chạy song song)
+    from app.configs.settings import settings
+    if bool(getattr(settings, "ONNX_SHARE_SESSION", True)):
+        return det
+    from app.hardware.detector import OnnxDetector
+    return OnnxDetector(det.path, **_onnx_options())
+
+
+def detector_spec(settings, prefix: str, weights: str, device: Optional[str] = "auto",
+                  overrides: Optional[Dict[str, Any]] = None) -> Tuple[str, str, str]:
+    """
+    (weights, device, backend) của detector 1 method theo <prefix>_BACKEND:
+    torch (ultralytics, `weights`) | onnx (<prefix>_ONNX_WEIGHTS, ONNX Runtime CPU)
+    | onnx_int8 (<prefix>_INT8_WEIGHTS, output của app.tools.quantize_int8).
+    """
+    o = overrides or {}
+    kind = str(o.get("backend", getattr(settings, f"{prefix}_BACKEND", "torch")) or "torch").lower()
+    if kind == BACKEND_ONNX:
+        path = o.get("onnx_weights", getattr(settings, f"{prefix}_ONNX_WEIGHTS", "yolo11s.onnx"))
+        return str(path), "cpu", BACKEND_ONNX
+    if kind == "onnx_int8":
+        path = o.get("int8_weights", getattr(settings, f"{prefix}_INT8_WEIGHTS", "yolo11s.int8.onnx"))
+        return str(path), "cpu", BACKEND_ONNX
+    if kind not in ("torch", BACKEND_YOLO):
+        raise ValueError(f"unknown detector backend for {prefix}: {kind}")
+    return str(weights), resolve_device(device), BACKEND_YOLO
+
+
+def _load_insightface(name: str, device: str, warmup: bool):
+    from insightface.app import FaceAnalysis
+    fa = FaceAnalysis(name=name, allowed_modules=['detection', 'recognition'])
+    # Jetson thường dùng CPU provider; PC x86 có thể dùng CUDA nếu onnxruntime-gpu sẵn sàng.
+    ctx = -1 if device == "cpu" else 0
+    try:
+        fa.prepare(ctx_id=ctx, det_size=(640, 640))
+    except Exception:
+        fa.prepare(ctx_id=0 if ctx < 0 else -1, det_size=(640, 640))
+    if warmup:
+        fa.get(np.zeros((640, 640, 3), dtype=np.uint8))
+    return fa
+
+
+def _load_mp_hands(_name: str, _device: str, warmup: bool):
+    import mediapipe as mp
+    hands = mp.solutions.hands.Hands(max_num_hands=2, min_detection_confidence=0.5)
+    if warmup:
+        hands.process(np.zeros((240, 240, 3), dtype=np.uint8))
+    return hands
+
+
+class _Entry:
+    def __init__(self, key: Tuple[str, str, str]):
+        self.key = key
+        self.model: Any = None
+        self.ready = threading.Event()
+        self.error: Optional[BaseException] = None
+        self.refs = 0
+        self.hits = 0
+        self.last_used = time.monotonic()
+        self.size_mb = 0.0
+        self.load_ms = 0.0
+
+
+class ModelHandle:
+    """
+    Proxy tới model dùng chung do ModelRegistry cấp. Thuộc tính / gọi hàm chuyển tiếp
+    tới model; release() trả reference (gọi nhiều lần không sao) -> model hết người dùng
+    mới được LRU evict.
+    """
+
+    def __init__(self, registry: "ModelRegistry", entry: _Entry, model: Any, owner: str):
+        self._registry = registry
+        self._entry = entry
+        self._model = model
+        self.owner = owner
+        self._released = False
+
+    def __getattr__(self, name: str):
+        return getattr(self._model, name)
+
+    def __call__(self, *args, **kwargs):
+        return self._model(*args, **kwargs)
+
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def key(self) -> Tuple[str, str, str]:
+        return self._entry.key
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._registry._release(self._entry)
+
+
+class ModelRegistry:
+    """
+    Cache model toàn process theo key (weights, device, backend):
+    - acquire() trả ModelHandle dùng chung (đã warm-up), đếm reference; load 1 lần kể cả khi
+      nhiều service acquire cùng lúc (thread khác chờ load xong).
+    - budget_mb > 0: vượt budget thì evict model ít dùng gần nhất đang KHÔNG có ai giữ.
+    - stats(): hits / misses / evictions, kích thước & thời gian load từng model.
+    """
+
+    def __init__(self, budget_mb: float = 0.0, warmup: bool = True):
+        self.budget_mb = float(budget_mb)
+        self.warmup = bool(warmup)
+        self._entries: Dict[Tuple[str, str, str], _Entry] = {}
+        self._lock = threading.Lock()
+        self._loaders: Dict[str, Tuple[Callable, Optional[Callable]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.register_loader(BACKEND_YOLO, _load_yolo, view=_view_yolo)
+        self.register_loader(BACKEND_INSIGHTFACE, _load_insightface)
+        self.register_loader(BACKEND_MP_HANDS, _load_mp_hands)
+        self.register_loader(BACKEND_ONNX, _load_onnx, view=_view_onnx)
+
+    def register_loader(self, backend: str, loader: Callable[[str, str, bool], Any], *,
+                        view: Optional[Callable[[Any], Any]] = None) -> None:
+        """loader(weights, device, warmup) -> model; view(model) -> object riêng cho mỗi handle (tuỳ chọn)."""
+        self._loaders[backend] = (loader, view)
+
+    # ---------- acquire / release ----------
+    def acquire(self, weights: str, *, device: Optional[str] = "auto", backend: str = BACKEND_YOLO,
+                owner: str = "") -> ModelHandle:
+        if backend not in self._loaders:
+            raise ValueError(f"unknown model backend: {backend}")
+        loader, view = self._loaders[backend]
+        key = (str(weights), resolve_device(device), backend)
+        with self._lock:
+            e = self._entries.get(key)
+            load = e is None
+            if load:
+                e = self._entries[key] = _Entry(key)
+                self.misses += 1
+            else:
+                self.hits += 1
+                e.hits += 1
+            e.refs += 1
+            e.last_used = time.monotonic()
+        if load:
+            self._load(e, loader)
+        else:
+            e.ready.wait()
+        if e.error is not None:
+            self._release(e)
+            raise RuntimeError(f"load model {key} failed: {e.error}") from e.error
+        log.info("Model %s -> %s (%s, refs=%d)", key, owner or "?", "load" if load else "hit", e.refs)
+        model = view(e.model) if view is not None else e.model
+        return ModelHandle(self, e, model, owner)
+
+    def _load(self, e: _Entry, loader: Callable) -> None:
+        weights, device, backend = e.key
+        rss0 = _rss_mb()
+        t0 = time.perf_counter()
+        try:
+            e.model = loader(weights, device, self.warmup)
+        except BaseException as ex:
+            e.error = ex
+            with self._lock:
+                self._entries.pop(e.key, None)
+            log.warning("Load model %s failed: %s", e.key, ex)
+        else:
+            e.load_ms = (time.perf_counter() - t0) * 1000.0
+            e.size_mb = max(_param_mb(e.model), _rss_mb() - rss0)
+            log.info("Loaded model %s in %.0f ms (~%.0f MB)", e.key, e.load_ms, e.size_mb)
+        finally:
+            e.ready.set()
+        if e.error is None:
+            self._enforce_budget(keep=e.key)
+
+    def _release(self, e: _Entry) -> None:
+        with self._lock:
+            e.refs = max(0, e.refs - 1)
+            e.last_used = time.monotonic()
+        self._enforce_budget()
+
+    # ---------- eviction ----------
+    def _enforce_budget(self, keep: Optional[Tuple[str, str, str]] = None) -> None:
+        if self.budget_mb <= 0:
+            return
+        victims = []
+        with self._lock:
+            total = sum(e.size_mb for e in self._entries.values())
+            idle = sorted((e for e in self._entries.values()
+                           if e.refs == 0 and e.key != keep and e.ready.is_set()),
+                          key=lambda e: e.last_used)
+            for e in idle:
+                if total <= self.budget_mb:
+                    break
+                del self._entries[e.key]
+                total -= e.size_mb
+                victims.append(e)
+            self.evictions += len(victims)
+        for e in victims:
+            self._drop(e)
+        if victims:
+            log.info("Model registry: evicted %s (budget %.0f MB, now ~%.0f MB)",
+                     [v.key for v in victims], self.budget_mb, total)
+        elif total > self.budget_mb and keep is not None:   # chỉ cảnh báo lúc load model mới
+            log.warning("Model registry ~%.0f MB > budget %.0f MB (model đang dùng, không evict được)",
+                        total, self.budget_mb)
+
+    @staticmethod
+    def _drop(e: _Entry) -> None:
+        m, e.model = e.model, None
+        close = getattr(m, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception:
+                pass
+        del m
+        gc.collect()
+
+    def evict_idle(self) -> int:
+        """Bỏ mọi model không còn ai giữ (vd trước khi chạy tác vụ nặng RAM)."""
+        with self._lock:
+            victims = [e for e in self._entries.values() if e.refs == 0 and e.ready.is_set()]
+            for e in victims:
+                del self._entries[e.key]
+            self.evictions += len(victims)
+        for e in victims:
+            self._drop(e)
+        return len(victims)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {
+                f"{k[2]}:{k[0]}@{k[1]}": {
+                    "refs": e.refs,
+                    "hits": e.hits,
+                    "size_mb": round(e.size_mb, 1),
+                    "load_ms": round(e.load_ms, 1),
+                    "ready": e.ready.is_set(),
+                }
+                for k, e in self._entries.items()
+            }
+            total = sum(e.size_mb for e in self._entries.values())
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "budget_mb": self.budget_mb,
+            "total_mb": round(total, 1),
+            "models": models,
+        }
+
+
+def _make_registry() -> ModelRegistry:
+    from app.configs.settings import settings
+    return ModelRegistry(budget_mb=float(getattr(settings, "MODEL_BUDGET_MB", 0.0)),
+                         warmup=bool(getattr(settings, "MODEL_WARMUP", True)))
+
+
+model_registry = _make_registry()
@@ -0,0 +1,126 @@
+# app/core/preload.py
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.model_registry import model_registry, detector_spec, BACKEND_INSIGHTFACE, BACKEND_MP_HANDS
+
+log = logging.getLogger("vision.preload")
+
+PRELOAD_NAMES = ("yolo", "insightface", "mp_hands")
+
+
+def preload_targets(settings) -> List[Tuple[str, str, str]]:
+    """(weights, device, backend) cần nạp trước theo MODEL_PRELOAD (vd "yolo,insightface,mp_hands")."""
+    names = [n.strip().lower() for n in str(getattr(settings, "MODEL_PRELOAD", "") or "").split(",") if n.strip()]
+    targets: List[Tuple[str, str, str]] = []
+    for n in names:
+        if n == "yolo":
+            # counter + follow-me: cùng weights/device/backend -> registry gộp thành 1 model
+            for t in (detector_spec(settings, "COUNTER", getattr(settings, "COUNTER_YOLO_WEIGHTS", "yolo11s.pt"),
+                                    getattr(settings, "COUNTER_DEVICE", "auto")),
+                      detector_spec(settings, "FOLLOWME", getattr(settings, "YOLO_MODEL", "yolo11s.pt"), "auto")):
+                if t not in targets:
+                    targets.append(t)
+        elif n == "insightface":
+            targets.append(("buffalo_s", "cpu", BACKEND_INSIGHTFACE))
+        elif n == "mp_hands":
+            targets.append(("hands", "cpu", BACKEND_MP_HANDS))
+        else:
+            log.warning("MODEL_PRELOAD: bỏ qua '%s' (hỗ trợ: %s)", n, ", ".join(PRELOAD_NAMES))
+    return targets
+
+
+def _missing_module(exc: BaseException) -> Optional[str]:
+    """Tên module nếu lỗi load (kể cả bọc trong RuntimeError của registry) là do backend chưa cài."""
+    while exc is not None:
+        if isinstance(exc, ImportError):
+            return getattr(exc, "name", None) or str(exc)
+        exc = exc.__cause__
+    return None
+
+
+class ModelPreloader:
+    """
+    Nạp model trên thread nền lúc startup (registry warm-up bằng inference giả) để lệnh
+    start đầu tiên không phải chờ load. ready=True khi mọi model đã nạp xong không lỗi
+    (backend chưa cài -> "skipped", không chặn ready);
+    status() trả thời gian load từng model cho /health.
+    """
+
+    def __init__(self):
+        self._t: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def start(self, settings) -> None:
+        with self._lock:
+            if self._t is not None:
+                return
+            targets = preload_targets(settings)
+            self._models = {self._name(t): {"state": "pending"} for t in targets}
+            self.started_at = time.monotonic()
+            self._t = threading.Thread(target=self._run, args=(targets,), name="model-preload", daemon=True)
+            self._t.start()
+        log.info("Preload %d model(s): %s", len(targets), list(self._models))
+
+    @staticmethod
+    def _name(t: Tuple[str, str, str]) -> str:
+        w, d, b = t
+        return f"{b}:{w}@{d}"
+
+    def _run(self, targets: List[Tuple[str, str, str]]) -> None:
+        for t in targets:
+            name = self._name(t)
+            t0 = time.perf_counter()
+            with self._lock:
+                self._models[name] = {"state": "loading"}
+            try:
+                h = model_registry.acquire(t[0], device=t[1], backend=t[2], owner="preload")
+                h.release()   # chỉ làm nóng cache; service acquire lại khi start
+                info: Dict[str, Any] = {"state": "ready"}
+            except Exception as e:
+                missing = _missing_module(e)
+                if missing is not None:
+                    # backend chưa cài trên máy này (vd insightface / mediapipe) -> bỏ qua, không tính lỗi
+                    info = {"state": "skipped", "error": f"not installed: {missing}"}
+                    log.info("Preload %s bỏ qua: chưa cài %s", name, missing)
+                else:
+                    info = {"state": "error", "error": str(e)}
+                    log.warning("Preload %s lỗi: %s", name, e)
+            info["load_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+            with self._lock:
+                self._models[name] = info
+        self.finished_at = time.monotonic()
+        log.info("Preload xong trong %.1fs | %s", self.finished_at - (self.started_at or self.finished_at),
+                 {k: v["state"] for k, v in self._models.items()})
+
+    @property
+    def done(self) -> bool:
+        return self._t is not None and self.finished_at is not None
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return self.done and all(m.get("state") in ("ready", "skipped") for m in self._models.values())
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {k: dict(v) for k, v in self._models.items()}
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.monotonic()) - self.started_at, 3)
+        return {
+            "ready": self.ready,
+            "preload_done": self.done,
+            "preload_s": elapsed,
+            "models": models,
+        }
+
+
+model_preloader = ModelPreloader()
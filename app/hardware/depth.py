@@ -0,0 +1,280 @@
+# app/hardware/depth.py
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+@dataclass
+class Intrinsics:
+    """Bản sao thuần Python của rs.intrinsics (không giữ object librealsense)."""
+    width: int
+    height: int
+    fx: float
+    fy: float
+    ppx: float
+    ppy: float
+    model: str = "none"
+    coeffs: List[float] = field(default_factory=lambda: [0.0] * 5)
+
+    @classmethod
+    def from_rs(cls, intr) -> "Intrinsics":
+        return cls(
+            width=int(intr.width), height=int(intr.height),
+            fx=float(intr.fx), fy=float(intr.fy),
+            ppx=float(intr.ppx), ppy=float(intr.ppy),
+            model=str(getattr(intr, "model", "none")).split(".")[-1],
+            coeffs=[float(c) for c in getattr(intr, "coeffs", [0.0] * 5)],
+        )
+
+
+class DepthFrame:
+    """
+    Depth z16 đã copy ra khỏi frame pool của librealsense (giữ bao lâu cũng được,
+    không làm cạn pool). Giữ API tối thiểu của rs.depth_frame mà engine đang dùng:
+    get_distance(x, y), get_data(), get_width(), get_height(), get_units().
+
+    Tra cứu vector hoá (thay vòng get_distance từng pixel): box_distances, median,
+    percentile, valid_ratio cho 1 box; batch_stats / batch_mean cho nhiều box.
+    Box là (x1, y1, x2, y2) nửa mở, toạ độ pixel; lo/hi là khoảng hợp lệ (m, mở 2 đầu).
+    """
+
+    def __init__(self, z16: np.ndarray, depth_scale: float, intrinsics: Optional[Intrinsics] = None,
+                 timestamp: float = 0.0, frame_number: int = 0):
+        self.z16 = z16
+        self.depth_scale = float(depth_scale)
+        self.intrinsics = intrinsics
+        self.timestamp = float(timestamp)        # ms, domain của thiết bị
+        self.frame_number = int(frame_number)
+        self._src = None                         # giữ rs.frame sống khi z16 là view zero-copy
+        self._m: Optional[np.ndarray] = None
+        self._integrals: Dict[Tuple[float, float], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __bool__(self) -> bool:
+        return self.z16 is not None
+
+    def get_distance(self, x: int, y: int) -> float:
+        h, w = self.z16.shape[:2]
+        if not (0 <= x < w and 0 <= y < h):
+            raise IndexError(f"pixel ({x},{y}) ngoài depth {w}x{h}")
+        return float(self.z16[int(y), int(x)]) * self.depth_scale
+
+    def get_data(self) -> np.ndarray:
+        return self.z16
+
+    def get_width(self) -> int:
+        return int(self.z16.shape[1])
+
+    def get_height(self) -> int:
+        return int(self.z16.shape[0])
+
+    def get_units(self) -> float:
+        return self.depth_scale
+
+    # ---------- tra cứu vector hoá ----------
+    def meters(self) -> np.ndarray:
+        """Depth (m) float32 cả frame, tính 1 lần cho mỗi frame."""
+        if self._m is None:
+            self._m = self.z16.astype(np.float32) * np.float32(self.depth_scale)
+        return self._m
+
+    def _clip_box(self, box) -> Tuple[int, int, int, int]:
+        h, w = self.z16.shape[:2]
+        x1, y1, x2, y2 = (int(v) for v in box)
+        # kẹp cả 4 cạnh vào [0, w] x [0, h]: box lệch hẳn ra ngoài -> rỗng, không IndexError
+        x1, x2 = min(max(x1, 0), w), min(max(x2, 0), w)
+        y1, y2 = min(max(y1, 0), h), min(max(y2, 0), h)
+        return x1, y1, x2, y2
+
+    def _roi_samples(self, box, step: int = 1) -> Tuple[np.ndarray, int]:
+        """(khoảng cách (m) các mẫu depth > 0 trong box, tổng số mẫu đã lấy)."""
+        x1, y1, x2, y2 = self._clip_box(box)
+        if x2 <= x1 or y2 <= y1:
+            return np.empty(0, dtype=np.float32), 0
+        z = self.z16[y1:y2:step, x1:x2:step]
+        v = z[z > 0]
+        return v.astype(np.float32) * np.float32(self.depth_scale), int(z.size)
+
+    def box_distances(self, box, step: int = 1) -> np.ndarray:
+        return self._roi_samples(box, step)[0]
+
+    @staticmethod
+    def _in_range(d: np.ndarray, lo: float, hi: float) -> np.ndarray:
+        return d[(d > lo) & (d < hi)]
+
+    def percentile(self, box, q: float = 50.0, lo: float = 0.0, hi: float = np.inf, step: int = 1) -> float:
+        d = self._in_range(self.box_distances(box, step), lo, hi)
+        return float(np.percentile(d, q)) if d.size else 0.0
+
+    def median(self, box, lo: float = 0.0, hi: float = np.inf, step: int = 1) -> float:
+        d = self._in_range(self.box_distances(box, step), lo, hi)
+        return float(np.median(d)) if d.size else 0.0
+
+    def valid_ratio(self, box, lo: float = 0.0, hi: float = np.inf, step: int = 1) -> float:
+        d, n = self._roi_samples(box, step)
+        return float(self._in_range(d, lo, hi).size) / n if n else 0.0
+
+    def batch_stats(self, boxes: Sequence, q: float = 50.0, lo: float = 0.0, hi: float = np.inf,
+                    step: int = 1) -> Dict[str, np.ndarray]:
+        """Percentile q + valid ratio cho nhiều box; mỗi box là 1 phép mảng."""
+        n = len(boxes)
+        pq = np.zeros(n, dtype=np.float32)
+        vr = np.zeros(n, dtype=np.float32)
+        for i, box in enumerate(boxes):
+            d, total = self._roi_samples(box, step)
+            d = self._in_range(d, lo, hi)
+            if d.size:
+                pq[i] = np.percentile(d, q)
+            vr[i] = d.size / total if total else 0.0
+        return {"percentile": pq, "valid_ratio": vr}
+
+    def _integral(self, lo: float, hi: float) -> Tuple[np.ndarray, np.ndarray]:
+        key = (float(lo), float(hi))
+        got = self._integrals.get(key)
+        if got is None:
+            import cv2
+            m = self.meters()
+            ok = (m > lo) & (m < hi)
+            s = cv2.integral(np.where(ok, m, np.float32(0)).astype(np.float32), sdepth=cv2.CV_64F)
+            c = cv2.integral(ok.astype(np.uint8), sdepth=cv2.CV_32S)
+            got = self._integrals[key] = (s, c)
+        return got
+
+    def batch_mean(self, boxes: Sequence, lo: float = 0.0, hi: float = np.inf) -> Dict[str, np.ndarray]:
+        """
+        Trung bình depth hợp lệ + valid ratio cho rất nhiều box: 1 lần integral image
+        cả frame (memo theo lo/hi) rồi O(1) mỗi box. Dùng khi số box lớn và mean đủ tốt.
+        """
+        if not len(boxes):
+            return {"mean": np.zeros(0, np.float32), "valid_ratio": np.zeros(0, np.float32)}
+        s, c = self._integral(lo, hi)
+        b = np.array([self._clip_box(bx) for bx in boxes], dtype=np.int64)
+        x1, y1, x2, y2 = b[:, 0], b[:, 1], np.maximum(b[:, 2], b[:, 0]), np.maximum(b[:, 3], b[:, 1])
+        tot = s[y2, x2] - s[y1, x2] - s[y2, x1] + s[y1, x1]
+        cnt = (c[y2, x2] - c[y1, x2] - c[y2, x1] + c[y1, x1]).astype(np.float64)
+        area = ((x2 - x1) * (y2 - y1)).astype(np.float64)
+        mean = np.divide(tot, cnt, out=np.zeros_like(tot), where=cnt > 0)
+        ratio = np.divide(cnt, area, out=np.zeros_like(cnt), where=area > 0)
+        return {"mean": mean.astype(np.float32), "valid_ratio": ratio.astype(np.float32)}
+
+
+def as_depth(frame) -> Optional[DepthFrame]:
+    """
+    Adapter: DepthFrame giữ nguyên; rs.depth_frame được bọc thành DepthFrame với z16 là
+    view zero-copy vào buffer librealsense (giữ tham chiếu frame cho tới khi bỏ adapter).
+    """
+    if frame is None or isinstance(frame, DepthFrame):
+        return frame
+    if not (hasattr(frame, "get_data") and hasattr(frame, "get_units")):
+        return None
+    z16 = np.asanyarray(frame.get_data())
+    df = DepthFrame(z16, float(frame.get_units()),
+                    timestamp=float(getattr(frame, "get_timestamp", lambda: 0.0)()),
+                    frame_number=int(getattr(frame, "get_frame_number", lambda: 0)()))
+    df._src = frame
+    return df
+
+
+@dataclass
+class Extrinsics:
+    """Phép biến đổi điểm 3D depth -> color: p_color = R @ p_depth + t (mét)."""
+    rotation: np.ndarray
+    translation: np.ndarray
+
+    @classmethod
+    def from_rs(cls, ext) -> "Extrinsics":
+        # rs.extrinsics.rotation là ma trận 3x3 lưu column-major
+        R = np.asarray(ext.rotation, dtype=np.float64).reshape(3, 3).T
+        t = np.asarray(ext.translation, dtype=np.float64).reshape(3)
+        return cls(R, t)
+
+    def inverse(self) -> "Extrinsics":
+        Rt = self.rotation.T
+        return Extrinsics(Rt, -Rt @ self.translation)
+
+
+class RoiDepthFrame(DepthFrame):
+    """
+    Depth CHƯA align (toạ độ camera depth) + intrinsics 2 stream + extrinsics depth->color.
+    Thay vì rs.align cả frame, chỉ map các pixel depth nằm quanh box được hỏi sang
+    toạ độ color (vector hoá NumPy) rồi giữ những điểm rơi vào box.
+    get_distance(x, y) nhận toạ độ pixel COLOR như depth đã align.
+    Bỏ qua méo ống kính (D4xx: depth không méo, color méo rất nhỏ).
+    """
+
+    def __init__(self, z16: np.ndarray, depth_scale: float, depth_intr: Intrinsics,
+                 color_intr: Intrinsics, depth_to_color: Extrinsics,
+                 timestamp: float = 0.0, frame_number: int = 0,
+                 near_m: float = 0.15, far_m: float = 10.0):
+        super().__init__(z16, depth_scale, depth_intr, timestamp, frame_number)
+        self.color_intrinsics = color_intr
+        self.d2c = depth_to_color
+        self.c2d = depth_to_color.inverse()
+        self.near_m = float(near_m)
+        self.far_m = float(far_m)
+
+    def _depth_window(self, box) -> Tuple[int, int, int, int]:
+        """Vùng pixel depth chắc chắn chứa mọi điểm chiếu vào box color (xét near..far)."""
+        x1, y1, x2, y2 = (float(v) for v in box)
+        ci, di = self.color_intrinsics, self.intrinsics
+        us = np.array([x1, x2, x1, x2], dtype=np.float64)
+        vs = np.array([y1, y1, y2, y2], dtype=np.float64)
+        pts = []
+        for z in (self.near_m, self.far_m):
+            pc = np.stack([(us - ci.ppx) / ci.fx * z, (vs - ci.ppy) / ci.fy * z, np.full(4, z)])
+            pts.append(self.c2d.rotation @ pc + self.c2d.translation[:, None])
+        pd = np.concatenate(pts, axis=1)
+        zd = np.maximum(pd[2], 1e-6)
+        ud = pd[0] / zd * di.fx + di.ppx
+        vd = pd[1] / zd * di.fy + di.ppy
+        h, w = self.z16.shape[:2]
+        x0 = int(np.clip(np.floor(ud.min()), 0, w)); x1d = int(np.clip(np.ceil(ud.max()) + 1, 0, w))
+        y0 = int(np.clip(np.floor(vd.min()), 0, h)); y1d = int(np.clip(np.ceil(vd.max()) + 1, 0, h))
+        return x0, y0, x1d, y1d
+
+    def _roi_samples(self, box, step: int = 1) -> Tuple[np.ndarray, int]:
+        """Khoảng cách (m) các điểm depth hợp lệ chiếu vào box color + số mẫu ước lượng của box."""
+        x0, y0, x1, y1 = self._depth_window(box)
+        if x1 <= x0 or y1 <= y0:
+            return np.empty(0, dtype=np.float32), 0
+        di, ci = self.intrinsics, self.color_intrinsics
+        bx1, by1, bx2, by2 = (float(v) for v in box)
+        # số pixel depth phủ box (đổi tiêu cự color -> depth), dùng làm mẫu số cho valid_ratio
+        total = int(round(max(0.0, bx2 - bx1) * max(0.0, by2 - by1)
+                          * (di.fx * di.fy) / (ci.fx * ci.fy) / (step * step)))
+        z = self.z16[y0:y1:step, x0:x1:step].astype(np.float32) * self.depth_scale
+        valid = z > 0
+        if not valid.any():
+            return np.empty(0, dtype=np.float32), total
+        xn = ((np.arange(x0, x1, step, dtype=np.float32) - di.ppx) / di.fx)[None, :]
+        yn = ((np.arange(y0, y1, step, dtype=np.float32) - di.ppy) / di.fy)[:, None]
+        zv = z[valid]
+        X = (xn * z)[valid]
+        Y = (yn * z)[valid]
+        R, t = self.d2c.rotation.astype(np.float32), self.d2c.translation.astype(np.float32)
+        Xc = R[0, 0] * X + R[0, 1] * Y + R[0, 2] * zv + t[0]
+        Yc = R[1, 0] * X + R[1, 1] * Y + R[1, 2] * zv + t[1]
+        Zc = np.maximum(R[2, 0] * X + R[2, 1] * Y + R[2, 2] * zv + t[2], 1e-6)
+        uc = Xc / Zc * ci.fx + ci.ppx
+        vc = Yc / Zc * ci.fy + ci.ppy
+        inside = (uc >= bx1) & (uc < bx2) & (vc >= by1) & (vc < by2)
+        d = zv[inside]
+        return d, max(total, int(d.size))
+
+    def batch_mean(self, boxes: Sequence, lo: float = 0.0, hi: float = np.inf) -> Dict[str, np.ndarray]:
+        # integral image nằm ở toạ độ depth, không dùng được cho box color -> tính từng box
+        n = len(boxes)
+        mean = np.zeros(n, dtype=np.float32)
+        vr = np.zeros(n, dtype=np.float32)
+        for i, box in enumerate(boxes):
+            d, total = self._roi_samples(box)
+            d = self._in_range(d, lo, hi)
+            if d.size:
+                mean[i] = d.mean()
+            vr[i] = d.size / total if total else 0.0
+        return {"mean": mean, "valid_ratio": vr}
+
+    def get_distance(self, x: int, y: int, radius: int = 2) -> float:
+        return self.median((x - radius, y - radius, x + radius + 1, y + radius + 1))
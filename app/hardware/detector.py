@@ -0,0 +1,310 @@
+# app/hardware/detector.py
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+log = logging.getLogger("vision.detector")
+
+try:
+    import onnxruntime as ort
+    _ORT_OK = True
+except Exception:
+    ort = None
+    _ORT_OK = False
+
+
+# ---------- kết quả: cùng dạng phần ultralytics Results mà counter / follow-me dùng ----------
+class _Box:
+    __slots__ = ("xyxy", "conf", "cls")
+
+    def __init__(self, row: np.ndarray):
+        self.xyxy = row[None, :4]
+        self.conf = float(row[4])
+        self.cls = float(row[5])
+
+
+class Boxes:
+    """Bbox (N,6) = x1,y1,x2,y2,conf,cls. `.xyxy` (N,4) như ultralytics; lặp ra từng box có .xyxy[0]/.cls/.conf."""
+
+    def __init__(self, data: np.ndarray):
+        self.data = np.asarray(data, dtype=np.float32).reshape(-1, 6)
+
+    @property
+    def xyxy(self) -> np.ndarray:
+        return self.data[:, :4]
+
+    @property
+    def conf(self) -> np.ndarray:
+        return self.data[:, 4]
+
+    @property
+    def cls(self) -> np.ndarray:
+        return self.data[:, 5]
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __iter__(self) -> Iterator[_Box]:
+        return (_Box(r) for r in self.data)
+
+
+class Detections:
+    """Kết quả 1 ảnh: .boxes (Boxes), .orig_shape (h, w)."""
+
+    def __init__(self, data: np.ndarray, orig_shape: Tuple[int, int]):
+        self.boxes = Boxes(data)
+        self.orig_shape = tuple(orig_shape)
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def __getitem__(self, idx) -> "Detections":
+        # như ultralytics Results[idx]: lọc box (mask bool / list index)
+        return Detections(self.boxes.data[idx], self.orig_shape)
+
+
+# ---------- tiền / hậu xử lý ----------
+def letterbox(img: np.ndarray, size: Tuple[int, int], *, color: int = 114,
+              out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+    """Resize giữ tỉ lệ vào khung size=(h, w), pad đều 2 bên. Trả (ảnh, ratio, (pad_x, pad_y))."""
+    th, tw = size
+    h, w = img.shape[:2]
+    r = min(th / h, tw / w)
+    nh, nw = int(round(h * r)), int(round(w * r))
+    py, px = (th - nh) / 2.0, (tw - nw) / 2.0
+    top, left = int(round(py - 0.1)), int(round(px - 0.1))
+    if out is None or out.shape[:2] != (th, tw):
+        out = np.empty((th, tw, 3), dtype=np.uint8)
+    out[...] = color
+    if (nh, nw) == (h, w):
+        out[top:top + nh, left:left + nw] = img
+    else:
+        out[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return out, r, (float(left), float(top))
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU ma trận (len(a), len(b)) cho bbox xyxy."""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    wh = np.clip(rb - lt, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_thr: float = 0.45, max_det: int = 300) -> np.ndarray:
+    """
+    NMS greedy trên ma trận IoU tính 1 lần (numpy), trả index giữ lại theo score giảm dần.
+    Gọi với bbox đã cộng offset theo class để NMS tách theo class.
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    order = np.argsort(-scores, kind="stable")
+    iou = box_iou(boxes[order], boxes[order])
+    keep = np.ones(len(order), dtype=bool)
+    for i in range(len(order)):
+        if keep[i]:
+            keep[i + 1:] &= iou[i, i + 1:] <= iou_thr
+    return order[keep][:max_det]
+
+
+def postprocess(pred: np.ndarray, *, conf: float, iou: float, classes: Optional[Sequence[int]] = None,
+                max_det: int = 300, max_nms: int = 2000) -> np.ndarray:
+    """
+    pred: output 1 ảnh của head YOLOv8/11 export, (4+nc, N) hoặc (N, 4+nc), bbox cx,cy,w,h.
+    Trả (K,6) x1,y1,x2,y2,conf,cls trong toạ độ ảnh letterbox.
+    """
+    if pred.shape[0] < pred.shape[1]:
+        pred = pred.T
+    scores = pred[:, 4:]
+    if classes is not None:
+        cls_idx = np.asarray(list(classes), dtype=np.int64)
+        scores = scores[:, cls_idx]
+    cls = scores.argmax(1)
+    sc = scores[np.arange(len(scores)), cls]
+    m = sc > conf
+    if not m.any():
+        return np.empty((0, 6), dtype=np.float32)
+    xywh, sc, cls = pred[m, :4], sc[m], cls[m]
+    if classes is not None:
+        cls = cls_idx[cls]
+    if len(sc) > max_nms:
+        top = np.argpartition(-sc, max_nms)[:max_nms]
+        xywh, sc, cls = xywh[top], sc[top], cls[top]
+    xyxy = np.empty_like(xywh)
+    xyxy[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+    xyxy[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+    keep = nms(xyxy + (cls[:, None] * 7680.0), sc, iou, max_det)   # offset theo class
+    return np.concatenate([xyxy[keep], sc[keep, None], cls[keep, None].astype(np.float32)], axis=1)
+
+
+class DetectorBackend:
+    """
+    Interface detector dùng chung cho counter / follow-me / YoloModel:
+      detect(frames) -> List[Detections]; detect_person(frame) / detect_persons(frames);
+      gọi kiểu ultralytics model(frames, conf=, classes=) và .track() (không tracker -> như predict).
+    """
+    name = "base"
+
+    def __init__(self, *, conf: float = 0.35, iou: float = 0.45, max_det: int = 300):
+        self.conf = float(conf)
+        self.iou = float(iou)
+        self.max_det = int(max_det)
+
+    def detect(self, frames: Sequence[np.ndarray], *, conf: Optional[float] = None,
+               classes: Optional[Sequence[int]] = None, imgsz: Optional[int] = None) -> List[Detections]:
+        raise NotImplementedError
+
+    def detect_person(self, frame: np.ndarray, imgsz: Optional[int] = None) -> Detections:
+        return self.detect([frame], classes=[0], imgsz=imgsz)[0]
+
+    def detect_persons(self, frames: Sequence[np.ndarray], imgsz: Optional[int] = None) -> List[Detections]:
+        return self.detect(list(frames), classes=[0], imgsz=imgsz)
+
+    def __call__(self, source: Union[np.ndarray, Sequence[np.ndarray]], conf: Optional[float] = None,
+                 classes: Optional[Sequence[int]] = None, imgsz: Optional[int] = None, **_kw) -> List[Detections]:
+        frames = [source] if isinstance(source, np.ndarray) else list(source)
+        return self.detect(frames, conf=conf, classes=classes, imgsz=imgsz)
+
+    predict = __call__
+    track = __call__
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class OnnxDetector(DetectorBackend):
+    """
+    YOLO (export ONNX, head raw 4+nc x N) chạy ONNX Runtime CPU: letterbox numpy, batch
+    nhiều frame 1 lần run (model export dynamic batch; batch cố định thì chạy từng khối, pad khối thiếu),
+    NMS numpy. InferenceSession.run thread-safe -> 1 session dùng chung nhiều service.
+    Model export dynamic H/W: detect(imgsz=N) letterbox về khung (bội 32) cạnh dài N theo tỉ lệ
+    frame (vd crop ROI hẹp -> ít tính toán); model H/W cố định thì luôn chạy self.imgsz.
+    """
+    name = "onnx"
+
+    def __init__(self, path: str, *, conf: float = 0.35, iou: float = 0.45, max_det: int = 300,
+                 imgsz: Optional[int] = None, intra_op_threads: int = 0, inter_op_threads: int = 1,
+                 providers: Optional[Sequence[str]] = None):
+        super().__init__(conf=conf, iou=iou, max_det=max_det)
+        if not _ORT_OK:
+            raise RuntimeError("onnxruntime chưa được cài (pip install onnxruntime)")
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        self.path = str(path)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            opts.intra_op_num_threads = int(intra_op_threads)
+        if inter_op_threads > 0:
+            opts.inter_op_num_threads = int(inter_op_threads)
+        self.session = ort.InferenceSession(self.path, sess_options=opts,
+                                            providers=list(providers or ["CPUExecutionProvider"]))
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        b, _, h, w = inp.shape
+        self.dynamic_batch = not isinstance(b, int) or b <= 0
+        self.fixed_batch = 1 if self.dynamic_batch else int(b)
+        self.input_fp16 = "float16" in str(inp.type)
+        self.dynamic_shape = not (isinstance(h, int) and isinstance(w, int) and h > 0 and w > 0)
+        if not self.dynamic_shape:
+            self.imgsz = (h, w)
+        else:
+            s = int(imgsz or 640)
+            self.imgsz = (s, s)
+        self._warned_imgsz = False
+        self._tls = threading.local()   # buffer letterbox riêng mỗi thread gọi
+        self.calls = 0
+        self.frames = 0
+        self.infer_ms_avg = 0.0
+        log.info("ONNX detector %s: input %s %s, batch=%s, threads=%d/%d", self.path, self.input_name,
+                 self.imgsz, "dynamic" if self.dynamic_batch else self.fixed_batch, intra_op_threads, inter_op_threads)
+
+    def input_size(self, frames: Sequence[np.ndarray], imgsz: Optional[int] = None) -> Tuple[int, int]:
+        """Khung (h, w) đưa vào model: self.imgsz, hoặc theo imgsz nếu model có H/W động."""
+        if not imgsz:
+            return self.imgsz
+        if not self.dynamic_shape:
+            if not self._warned_imgsz:
+                self._warned_imgsz = True
+                log.warning("ONNX %s: H/W cố định %s, bỏ qua imgsz=%s (export dynamic=True để dùng)",
+                            self.path, self.imgsz, imgsz)
+            return self.imgsz
+        h = max(f.shape[0] for f in frames)
+        w = max(f.shape[1] for f in frames)
+        r = int(imgsz) / float(max(h, w))
+        return (max(32, -(-int(round(h * r)) // 32) * 32), max(32, -(-int(round(w * r)) // 32) * 32))
+
+    def _blob(self, frames: Sequence[np.ndarray],
+              size: Optional[Tuple[int, int]] = None) -> Tuple[np.ndarray, List[Tuple[float, Tuple[float, float]]]]:
+        th, tw = size or self.imgsz
+        bufs = getattr(self._tls, "bufs", None)
+        if bufs is None or len(bufs) < len(frames) or bufs[0].shape[:2] != (th, tw):
+            bufs = self._tls.bufs = [np.empty((th, tw, 3), np.uint8) for _ in range(max(len(frames), 1))]
+        blob = np.empty((len(frames), 3, th, tw), dtype=np.float16 if self.input_fp16 else np.float32)
+        metas = []
+        for i, f in enumerate(frames):
+            lb, r, pad = letterbox(f, (th, tw), out=bufs[i])
+            # BGR HWC uint8 -> RGB CHW [0,1]
+            np.multiply(lb[..., ::-1].transpose(2, 0, 1), 1.0 / 255.0, out=blob[i], casting="unsafe")
+            metas.append((r, pad))
+        return blob, metas
+
+    def _run(self, blob: np.ndarray) -> np.ndarray:
+        n, fb = len(blob), self.fixed_batch
+        if self.dynamic_batch or n == fb:
+            return self.session.run(None, {self.input_name: blob})[0]
+        # batch cố định: chạy từng khối fb frame, khối thiếu pad 0 rồi cắt output
+        outs = []
+        for i in range(0, n, fb):
+            chunk = blob[i:i + fb]
+            k = len(chunk)
+            if k < fb:
+                chunk = np.concatenate([chunk, np.zeros((fb - k,) + chunk.shape[1:], chunk.dtype)], axis=0)
+            outs.append(self.session.run(None, {self.input_name: chunk})[0][:k])
+        return np.concatenate(outs, axis=0)
+
+    def detect(self, frames: Sequence[np.ndarray], *, conf: Optional[float] = None,
+               classes: Optional[Sequence[int]] = None, imgsz: Optional[int] = None) -> List[Detections]:
+        if not frames:
+            return []
+        t0 = time.perf_counter()
+        blob, metas = self._blob(frames, self.input_size(frames, imgsz))
+        out = self._run(blob).astype(np.float32, copy=False)
+        res: List[Detections] = []
+        for f, pred, (r, (px, py)) in zip(frames, out, metas):
+            det = postprocess(pred, conf=self.conf if conf is None else float(conf), iou=self.iou,
+                              classes=classes, max_det=self.max_det)
+            if len(det):
+                det[:, [0, 2]] = (det[:, [0, 2]] - px) / r
+                det[:, [1, 3]] = (det[:, [1, 3]] - py) / r
+                h, w = f.shape[:2]
+                det[:, [0, 2]] = det[:, [0, 2]].clip(0, w)
+                det[:, [1, 3]] = det[:, [1, 3]].clip(0, h)
+            res.append(Detections(det, f.shape[:2]))
+        ms = (time.perf_counter() - t0) * 1000.0
+        self.calls += 1
+        self.frames += len(frames)
+        self.infer_ms_avg = ms if self.calls == 1 else 0.9 * self.infer_ms_avg + 0.1 * ms
+        return res
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "imgsz": self.imgsz,
+            "dynamic_shape": self.dynamic_shape,
+            "dynamic_batch": self.dynamic_batch,
+            "calls": self.calls,
+            "frames": self.frames,
+            "infer_ms_avg": round(self.infer_ms_avg, 2),
+        }
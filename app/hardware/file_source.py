@@ -0,0 +1,239 @@
+# app/hardware/file_source.py
+from __future__ import annotations
+
+import glob
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from typing import List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+log = logging.getLogger("vision.filesource")
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+KIND_DEVICE = "device"
+KIND_VIDEO = "video"
+KIND_IMAGES = "images"
+
+
+def source_kind(device: Union[int, str]) -> str:
+    """device index / '/dev/videoN' / URL -> device; file video -> video; thư mục ảnh / glob / 1 ảnh -> images."""
+    if isinstance(device, int):
+        return KIND_DEVICE
+    s = str(device)
+    if s.isdigit() or s.startswith("/dev/video") or "://" in s:
+        return KIND_DEVICE
+    if any(ch in s for ch in "*?["):
+        return KIND_IMAGES
+    if os.path.isdir(s):
+        return KIND_IMAGES
+    if os.path.isfile(s):
+        return KIND_IMAGES if s.lower().endswith(IMAGE_EXTS) else KIND_VIDEO
+    return KIND_DEVICE
+
+
+def _natural_key(path: str):
+    return [int(t) if t.isdigit() else t.lower() for t in re.split(r"(\d+)", os.path.basename(path))]
+
+
+def list_images(spec: str) -> List[str]:
+    if os.path.isdir(spec):
+        files = [os.path.join(spec, f) for f in os.listdir(spec)]
+    elif any(ch in spec for ch in "*?["):
+        files = glob.glob(spec)
+    else:
+        files = [spec]
+    return sorted((f for f in files if f.lower().endswith(IMAGE_EXTS) and os.path.isfile(f)), key=_natural_key)
+
+
+class FileFrameSource:
+    """
+    Nguồn frame từ video file / thư mục ảnh / glob ảnh cho OpenCVCamera.
+    Decode-ahead trên thread riêng vào queue bounded (mọi frame đều tới consumer,
+    không drop như webcam). realtime=True: giữ nhịp theo pts của file (hoặc `fps`
+    với ảnh); False: nhanh nhất có thể để đo throughput engine. loop / seek(index).
+    """
+
+    def __init__(self, spec: str, *, fps: float = 30.0, loop: bool = True, realtime: bool = True,
+                 decode_ahead: int = 4):
+        self.spec = str(spec)
+        self.kind = source_kind(self.spec)
+        self.loop = bool(loop)
+        self.realtime = bool(realtime)
+        self.fps = float(fps) if fps else 30.0
+        self._q: "queue.Queue[Tuple[int, np.ndarray, float, int]]" = queue.Queue(max(1, int(decode_ahead)))
+        self._images: List[str] = []
+        self._cap: Optional[cv2.VideoCapture] = None
+        self._t: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._gen = 0                     # tăng mỗi lần seek -> bỏ frame decode trước đó
+        self._seek_to: Optional[int] = None
+        self._eof = threading.Event()
+        self._clock0: Optional[float] = None
+        self._pts0 = 0.0
+        self.frame_count = 0
+        self.position = 0                 # index frame consumer lấy gần nhất + 1
+        self.frames_decoded = 0
+        self.loops = 0
+        self.decode_ms_avg = 0.0
+
+    # ---------- mở / đóng ----------
+    def open(self) -> bool:
+        if self._t is not None:
+            return True
+        if self.kind == KIND_IMAGES:
+            self._images = list_images(self.spec)
+            self.frame_count = len(self._images)
+            if not self._images:
+                log.warning("Không có ảnh nào khớp %s", self.spec)
+                return False
+        else:
+            cap = cv2.VideoCapture(self.spec)
+            if not cap or not cap.isOpened():
+                log.warning("Không mở được video %s", self.spec)
+                return False
+            self._cap = cap
+            self.frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+            vfps = float(cap.get(cv2.CAP_PROP_FPS) or 0.0)
+            if vfps > 0:
+                self.fps = vfps
+        self._stop.clear()
+        self._eof.clear()
+        self._t = threading.Thread(target=self._decode_loop, name=f"file-decode-{os.path.basename(self.spec)}",
+                                   daemon=True)
+        self._t.start()
+        log.info("File source %s: %s, %d frames @%.1ffps, %s, loop=%s",
+                 self.spec, self.kind, self.frame_count, self.fps,
+                 "realtime" if self.realtime else "unthrottled", self.loop)
+        return True
+
+    def is_opened(self) -> bool:
+        return self._t is not None and not self._stop.is_set()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._drain()
+        t = self._t
+        if t is not None and t.is_alive() and t is not threading.current_thread():
+            t.join(timeout=1.0)
+        self._t = None
+        if self._cap is not None:
+            try:
+                self._cap.release()
+            except Exception:
+                pass
+            self._cap = None
+
+    def _drain(self) -> None:
+        try:
+            while True:
+                self._q.get_nowait()
+        except queue.Empty:
+            pass
+
+    # ---------- decode thread ----------
+    def _decode_one(self, idx: int) -> Tuple[Optional[np.ndarray], float]:
+        if self.kind == KIND_IMAGES:
+            if idx >= len(self._images):
+                return None, 0.0
+            return cv2.imread(self._images[idx], cv2.IMREAD_COLOR), idx / self.fps
+        ok, frame = self._cap.read()
+        if not ok:
+            return None, 0.0
+        pts = float(self._cap.get(cv2.CAP_PROP_POS_MSEC) or 0.0) / 1000.0
+        return frame, (pts if pts > 0 else idx / self.fps)
+
+    def _rewind(self, idx: int) -> None:
+        if self._cap is not None:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+
+    def _decode_loop(self) -> None:
+        idx = 0
+        gen = self._gen
+        while not self._stop.is_set():
+            with self._lock:
+                if self._seek_to is not None:
+                    idx, self._seek_to = self._seek_to, None
+                    gen = self._gen
+                    self._rewind(idx)
+                    self._eof.clear()
+            t0 = time.perf_counter()
+            frame, pts = self._decode_one(idx)
+            if frame is None:
+                if not self.loop:
+                    self._eof.set()
+                    self._stop.wait(0.05)
+                    continue
+                if idx == 0:
+                    log.warning("File source %s không decode được frame nào", self.spec)
+                    self._eof.set()
+                    return
+                idx = 0
+                self._rewind(0)
+                self.loops += 1
+                continue
+            ms = (time.perf_counter() - t0) * 1000.0
+            self.decode_ms_avg = ms if self.decode_ms_avg == 0.0 else 0.9 * self.decode_ms_avg + 0.1 * ms
+            self.frames_decoded += 1
+            item = (idx, frame, pts, gen)
+            while not self._stop.is_set() and gen == self._gen:
+                try:
+                    self._q.put(item, timeout=0.05)
+                    break
+                except queue.Full:
+                    continue
+            idx += 1
+
+    # ---------- consumer ----------
+    def seek(self, index: int) -> None:
+        with self._lock:
+            self._gen += 1
+            self._seek_to = max(0, int(index))
+            self._clock0 = None
+            self._drain()
+
+    def read(self, timeout: float = 0.1) -> Optional[np.ndarray]:
+        end = time.monotonic() + max(0.0, timeout)
+        while True:
+            try:
+                idx, frame, pts, gen = self._q.get(timeout=max(0.0, end - time.monotonic()) or 1e-3)
+            except queue.Empty:
+                return None
+            if gen == self._gen:
+                break
+            if time.monotonic() >= end:
+                return None
+        if self.realtime:
+            now = time.monotonic()
+            if self._clock0 is None or idx == 0 or pts < self._pts0:
+                self._clock0, self._pts0 = now, pts   # bắt đầu / sau loop / sau seek
+            due = self._clock0 + (pts - self._pts0)
+            if due > now:
+                time.sleep(due - now)
+        self.position = idx + 1
+        return frame
+
+    @property
+    def finished(self) -> bool:
+        return self._eof.is_set() and self._q.empty()
+
+    def stats(self) -> dict:
+        return {
+            "source": self.kind,
+            "path": self.spec,
+            "realtime": self.realtime,
+            "loop": self.loop,
+            "position": self.position,
+            "frame_count": self.frame_count,
+            "frames_decoded": self.frames_decoded,
+            "loops": self.loops,
+            "decode_queue": self._q.qsize(),
+            "decode_ms_avg": round(self.decode_ms_avg, 3),
+        }
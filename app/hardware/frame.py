@@ -0,0 +1,185 @@
+# app/hardware/frame.py
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+class FrameBundle:
+    """
+    1 frame do capture layer phát ra + các view dẫn xuất (gray/rgb/resized/clahe)
+    được tính LƯỜI, tối đa 1 lần / frame, an toàn khi nhiều engine (thread) cùng hỏi.
+    Các view trả về là dùng chung -> engine KHÔNG được ghi đè vào chúng.
+
+    capture_ts: time.monotonic() lúc frame rời thiết bị (grab V4L2 / nhận frameset RealSense);
+    device_ts: timestamp phần cứng (ms, domain thiết bị) nếu có; seq: số thứ tự frame của nguồn.
+    """
+
+    def __init__(self, bgr: np.ndarray, depth: Any = None, *,
+                 capture_ts: Optional[float] = None, seq: int = 0, device_ts: Optional[float] = None):
+        self.bgr = bgr
+        self.depth = depth
+        self.capture_ts = float(capture_ts) if capture_ts is not None else time.monotonic()
+        self.seq = int(seq)
+        self.device_ts = float(device_ts) if device_ts is not None else None
+        self._views: Dict[Any, np.ndarray] = {}
+        self._locks: Dict[Any, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.bgr.shape
+
+    # ---------- memo ----------
+    def view(self, key: Any, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        """Trả view `key`; nếu chưa có thì tính đúng 1 lần (thread khác cùng key sẽ chờ)."""
+        v = self._views.get(key)
+        if v is not None:
+            return v
+        with self._lock:
+            lk = self._locks.setdefault(key, threading.Lock())
+        with lk:
+            v = self._views.get(key)
+            if v is None:
+                v = compute()
+                self._views[key] = v
+            return v
+
+    def peek(self, key: Any) -> Optional[np.ndarray]:
+        """View đã tính sẵn (hoặc None) — không kích hoạt tính toán."""
+        return self._views.get(key)
+
+    # ---------- views ----------
+    def gray(self) -> np.ndarray:
+        return self.view("gray", lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY))
+
+    def rgb(self) -> np.ndarray:
+        return self.view("rgb", lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB))
+
+    def resized(self, width: int, height: int, interpolation: int = cv2.INTER_AREA) -> np.ndarray:
+        w, h = int(width), int(height)
+        if (h, w) == self.bgr.shape[:2]:
+            return self.bgr
+        return self.view(("resized", w, h, interpolation),
+                         lambda: cv2.resize(self.bgr, (w, h), interpolation=interpolation))
+
+    def gray_reduced(self, factor: int = 1) -> np.ndarray:
+        """Gray thu nhỏ 1/factor mỗi chiều (làm tròn lên, như IMREAD_REDUCED_GRAYSCALE_n)."""
+        f = int(factor)
+        if f <= 1:
+            return self.gray()
+
+        def _compute():
+            g = self.gray()
+            h, w = g.shape[:2]
+            return cv2.resize(g, ((w + f - 1) // f, (h + f - 1) // f), interpolation=cv2.INTER_AREA)
+        return self.view(("gray_reduced", f), _compute)
+
+    def clahe(self, clip_limit: float = 2.0, tile: Tuple[int, int] = (8, 8), reduce: int = 1) -> np.ndarray:
+        def _compute():
+            # CLAHE object không thread-safe -> tạo mới cho mỗi lần tính
+            return cv2.createCLAHE(float(clip_limit), tuple(tile)).apply(self.gray_reduced(reduce))
+        return self.view(("clahe", float(clip_limit), tuple(tile), int(reduce)), _compute)
+
+
+_JPEG_FLAGS = {
+    "bgr": cv2.IMREAD_COLOR,
+    "gray": cv2.IMREAD_GRAYSCALE,
+    "gray2": cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    "gray4": cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    "gray8": cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def decode_jpeg(buf: np.ndarray, mode: str = "bgr") -> Optional[np.ndarray]:
+    """Decode 1 buffer MJPEG thô theo mode: bgr | gray | gray2 | gray4 | gray8."""
+    return cv2.imdecode(np.asarray(buf).reshape(-1), _JPEG_FLAGS[mode])
+
+
+class JpegFrameBundle(FrameBundle):
+    """
+    FrameBundle từ buffer MJPEG thô (camera đặt CAP_PROP_CONVERT_RGB=0): chỉ decode
+    view nào được hỏi, gray / gray thu nhỏ decode THẲNG từ JPEG (không qua BGR).
+    prefetch: {mode: Future} đã gửi lên decode worker pool lúc grab.
+    """
+
+    def __init__(self, jpeg: np.ndarray, depth: Any = None, *, capture_ts: Optional[float] = None,
+                 seq: int = 0, device_ts: Optional[float] = None, prefetch: Optional[Dict[str, Any]] = None):
+        self.jpeg = np.asarray(jpeg).reshape(-1)
+        self._prefetch = dict(prefetch or {})
+        super().__init__(None, depth, capture_ts=capture_ts, seq=seq, device_ts=device_ts)
+
+    def _decode(self, mode: str) -> np.ndarray:
+        fut = self._prefetch.pop(mode, None)
+        img = None
+        if fut is not None:
+            try:
+                img = fut.result()
+            except Exception:
+                img = None
+        if img is None:
+            img = decode_jpeg(self.jpeg, mode)
+        if img is None:
+            raise ValueError("MJPEG decode thất bại")
+        return img
+
+    @property
+    def bgr(self) -> np.ndarray:
+        return self.view("bgr", lambda: self._decode("bgr"))
+
+    @bgr.setter
+    def bgr(self, value) -> None:
+        pass  # FrameBundle.__init__ gán None; ảnh màu chỉ có khi decode lười
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        b = self.peek("bgr")
+        return b.shape if b is not None else self.gray().shape + (3,)
+
+    def gray(self) -> np.ndarray:
+        b = self.peek("bgr")
+        if b is not None:
+            return self.view("gray", lambda: cv2.cvtColor(b, cv2.COLOR_BGR2GRAY))
+        return self.view("gray", lambda: self._decode("gray"))
+
+    def gray_reduced(self, factor: int = 1) -> np.ndarray:
+        f = int(factor)
+        if f <= 1:
+            return self.gray()
+        if f not in (2, 4, 8):
+            return super().gray_reduced(f)
+        return self.view(("gray_reduced", f), lambda: self._decode(f"gray{f}"))
+
+
+def as_bundle(frame: Any, depth: Any = None) -> Optional[FrameBundle]:
+    """Chuẩn hoá input của engine.step: FrameBundle giữ nguyên, ndarray thì bọc lại."""
+    if frame is None:
+        return None
+    if isinstance(frame, FrameBundle):
+        return frame
+    if isinstance(frame, np.ndarray):
+        return FrameBundle(frame, depth)
+    return None
+
+
+def frame_meta(fb: Any, proc_ms: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Metadata nhúng vào payload vision/result: capture_ts (monotonic, s), frame_seq,
+    latency_ms (capture -> lúc gọi, gồm cả inference) và proc_ms (thời gian engine.step).
+    """
+    if not isinstance(fb, FrameBundle):
+        return {}
+    meta: Dict[str, Any] = {
+        "capture_ts": round(fb.capture_ts, 6),
+        "frame_seq": fb.seq,
+        "latency_ms": round((time.monotonic() - fb.capture_ts) * 1000.0, 2),
+    }
+    if proc_ms is not None:
+        meta["proc_ms"] = round(proc_ms, 2)
+    if fb.device_ts is not None:
+        meta["device_ts"] = fb.device_ts
+    return meta
@@ -0,0 +1,287 @@
+# app/hardware/frame_bus.py
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from app.hardware.frame import FrameBundle
+
+log = logging.getLogger("vision.framebus")
+
+DROP_OLDEST = "drop_oldest"   # queue đầy -> bỏ frame cũ nhất (engine luôn thấy frame mới)
+DROP_NEWEST = "drop_newest"   # queue đầy -> bỏ frame vừa tới (giữ thứ tự liên tục)
+_POLICIES = (DROP_OLDEST, DROP_NEWEST)
+
+
+def device_key(device: Union[int, str]) -> str:
+    """Chuẩn hoá device: 0, '0', '/dev/video0' -> cùng 1 key."""
+    if isinstance(device, str) and device.startswith("/dev/video"):
+        tail = device.replace("/dev/video", "")
+        if tail.isdigit():
+            return f"video{int(tail)}"
+        return device
+    if isinstance(device, int) or (isinstance(device, str) and device.isdigit()):
+        return f"video{int(device)}"
+    return str(device)
+
+
+class FrameSubscription:
+    """
+    Đầu đọc của 1 engine trên FrameBus. Giữ contract camera như OpenCVCamera
+    (open / get_frames / read / check_connectivity / close) để service không phải đổi.
+    Mỗi subscription có queue riêng, bounded, với drop policy riêng.
+    Queue chứa FrameBundle dùng chung giữa các engine -> view gray/rgb... chỉ tính 1 lần.
+    """
+
+    def __init__(self, bus: "FrameBus", name: str, maxlen: int = 2, drop_policy: str = DROP_OLDEST,
+                 wait_timeout_s: float = 0.1):
+        if drop_policy not in _POLICIES:
+            raise ValueError(f"drop_policy phải là một trong {_POLICIES}, nhận {drop_policy!r}")
+        self.bus = bus
+        self.name = name
+        self.kind = getattr(bus.camera, "kind", "2D")
+        self.maxlen = max(1, int(maxlen))
+        self.drop_policy = drop_policy
+        self.wait_timeout_s = float(wait_timeout_s)
+        self._q: deque = deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._closed = False
+        self.delivered = 0
+        self.dropped = 0
+
+    # ---- phía bus ----
+    def _push(self, item: FrameBundle) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._q) >= self.maxlen:
+                self.dropped += 1
+                if self.drop_policy == DROP_NEWEST:
+                    return
+                self._q.popleft()
+            self._q.append(item)
+            self._cond.notify()
+
+    # ---- contract camera ----
+    def open(self):
+        self.bus.start()
+
+    def is_opened(self) -> bool:
+        return not self._closed and self.bus.is_running()
+
+    def get_bundle(self, timeout: Optional[float] = None) -> Optional[FrameBundle]:
+        to = self.wait_timeout_s if timeout is None else float(timeout)
+        with self._cond:
+            if not self._q and not self._closed:
+                self._cond.wait_for(lambda: bool(self._q) or self._closed, timeout=to)
+            if not self._q:
+                return None
+            self.delivered += 1
+            return self._q.popleft()
+
+    def get_frames(self, timeout: Optional[float] = None) -> Tuple[Optional[Any], Optional[Any]]:
+        fb = self.get_bundle(timeout)
+        if fb is None:
+            return None, None
+        return fb.bgr, fb.depth
+
+    read = get_frames
+
+    def check_connectivity(self, timeout_s: float = 1.5) -> Tuple[bool, str]:
+        self.open()
+        if not self.bus.is_running():
+            return False, f"Không mở được frame bus (device={self.bus.key})"
+        t0 = time.time()
+        while time.time() - t0 < timeout_s:
+            frame, _ = self.get_frames(timeout=0.1)
+            if frame is not None:
+                h, w = frame.shape[:2]
+                return True, f"ĐÃ KẾT NỐI frame bus {self.bus.key} ({w}x{h}, sub={self.name})"
+        return False, "Không nhận được khung hình từ frame bus trong thời gian chờ"
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {"name": self.name, "queued": len(self._q), "maxlen": self.maxlen,
+                    "drop_policy": self.drop_policy, "delivered": self.delivered, "dropped": self.dropped}
+
+    def stop(self):
+        self.close()
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._q.clear()
+            self._cond.notify_all()
+        self.bus.unsubscribe(self)
+
+
+class FrameBus:
+    """
+    Mở thiết bị vật lý 1 lần, 1 capture thread đọc + decode 1 lần / frame,
+    rồi fan-out cùng object frame tới mọi subscription (không copy).
+    Subscriber chậm chỉ làm đầy queue của chính nó, không chặn capture thread.
+    """
+
+    def __init__(self, key: str, camera, on_empty: Optional[Callable[["FrameBus"], None]] = None):
+        self.key = key
+        self.camera = camera
+        self._on_empty = on_empty
+        self._subs: List[FrameSubscription] = []
+        self._lock = threading.RLock()
+        self._t: Optional[threading.Thread] = None
+        self._stop_evt = threading.Event()
+        self.frames_read = 0
+        self.read_errors = 0
+        bind = getattr(camera, "bind_owners", None)
+        if callable(bind):   # watchdog publish lỗi thiết bị cho mọi engine đang subscribe
+            bind(self.subscribers)
+
+    # ---- subscribers ----
+    def subscribe(self, name: str, *, maxlen: int = 2, drop_policy: str = DROP_OLDEST,
+                  wait_timeout_s: float = 0.1) -> FrameSubscription:
+        sub = FrameSubscription(self, name, maxlen=maxlen, drop_policy=drop_policy,
+                                wait_timeout_s=wait_timeout_s)
+        with self._lock:
+            self._subs.append(sub)
+        log.info("FrameBus %s: +sub %s (maxlen=%d, %s) -> %d subs",
+                 self.key, name, sub.maxlen, drop_policy, len(self._subs))
+        return sub
+
+    def unsubscribe(self, sub: FrameSubscription) -> None:
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+            left = len(self._subs)
+        log.info("FrameBus %s: -sub %s -> %d subs", self.key, sub.name, left)
+        if left == 0:
+            self._empty()
+
+    def _empty(self) -> None:
+        # registry (nếu có) tự kiểm tra lại + stop dưới lock của nó: subscribe chen vào
+        # giữa lúc đếm và lúc stop không nhận phải bus đã dừng
+        if self._on_empty:
+            self._on_empty(self)
+        else:
+            self.stop()
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return not self._subs
+
+    def subscribers(self) -> List[str]:
+        with self._lock:
+            return [s.name for s in self._subs]
+
+    # ---- capture ----
+    def is_running(self) -> bool:
+        return self._t is not None and self._t.is_alive()
+
+    def start(self) -> None:
+        with self._lock:
+            if self.is_running():
+                return
+            op = getattr(self.camera, "open", None)
+            if callable(op):
+                op()
+            self._stop_evt.clear()
+            self._t = threading.Thread(target=self._loop, name=f"framebus-{self.key}", daemon=True)
+            self._t.start()
+
+    def stop(self) -> None:
+        self._stop_evt.set()
+        t = self._t
+        if t is not None and t.is_alive() and t is not threading.current_thread():
+            t.join(timeout=2.0)
+        self._t = None
+        try:
+            cl = getattr(self.camera, "close", None)
+            if callable(cl):
+                cl()
+        except Exception:
+            pass
+
+    def _read(self) -> Optional[FrameBundle]:
+        fn = getattr(self.camera, "get_bundle", None)
+        if callable(fn):
+            return fn()
+        fn = getattr(self.camera, "get_frames", None) or getattr(self.camera, "read", None)
+        color, depth = fn() if callable(fn) else (None, None)
+        return FrameBundle(color, depth, seq=self.frames_read + 1) if color is not None else None
+
+    def _loop(self) -> None:
+        while not self._stop_evt.is_set():
+            try:
+                fb = self._read()
+            except Exception as e:
+                self.read_errors += 1
+                log.warning("FrameBus %s read error: %s", self.key, e)
+                time.sleep(0.05)
+                continue
+            if fb is None:
+                time.sleep(0.002)
+                continue
+            self.frames_read += 1
+            with self._lock:
+                subs = list(self._subs)
+            for s in subs:
+                s._push(fb)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            subs = [s.stats() for s in self._subs]
+        return {"key": self.key, "running": self.is_running(), "frames_read": self.frames_read,
+                "read_errors": self.read_errors, "subscribers": subs}
+
+
+class _FrameBusRegistry:
+    """1 FrameBus cho mỗi thiết bị vật lý trong process."""
+
+    def __init__(self) -> None:
+        self._buses: Dict[str, FrameBus] = {}
+        self._lock = threading.RLock()
+
+    def _drop(self, bus: FrameBus) -> None:
+        with self._lock:
+            if not bus.is_empty():
+                return   # đã có subscriber mới sau khi bus báo rỗng -> giữ chạy
+            if self._buses.get(bus.key) is bus:
+                del self._buses[bus.key]
+            bus.stop()
+
+    def _get_or_create(self, camera, name: str) -> FrameBus:
+        key = device_key(getattr(camera, "device", id(camera)))
+        bus = self._buses.get(key)
+        if bus is None:
+            bus = FrameBus(key, camera, on_empty=self._drop)
+            self._buses[key] = bus
+        else:
+            want = tuple(getattr(camera, a, None) for a in ("width", "height", "fps"))
+            have = tuple(getattr(bus.camera, a, None) for a in ("width", "height", "fps"))
+            if want != have:
+                log.warning("FrameBus %s: %s yêu cầu %sx%s@%s nhưng bus đang chạy %sx%s@%s — dùng cấu hình bus",
+                            key, name, *want, *have)
+        return bus
+
+    def subscribe(self, camera, name: str, *, maxlen: int = 2, drop_policy: str = DROP_OLDEST,
+                  wait_timeout_s: float = 0.1) -> FrameSubscription:
+        """
+        Đăng ký engine `name` vào bus của thiết bị `camera.device`.
+        Nếu bus đã tồn tại thì `camera` (chưa open) bị bỏ qua -> không mở thiết bị lần 2.
+        """
+        with self._lock:
+            bus = self._get_or_create(camera, name)
+            sub = bus.subscribe(name, maxlen=maxlen, drop_policy=drop_policy, wait_timeout_s=wait_timeout_s)
+        bus.start()
+        return sub
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {k: b.stats() for k, b in self._buses.items()}
+
+
+frame_buses = _FrameBusRegistry()
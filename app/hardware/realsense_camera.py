@@ -1,10 +1,16 @@
 # app/hardware/realsense_camera.py
 from __future__ import annotations
+import logging
+import threading
 import time
 from typing import Optional, Tuple
 
 import numpy as np
 
+from app.hardware.depth import DepthFrame, Extrinsics, Intrinsics, RoiDepthFrame
+from app.hardware.frame import FrameBundle
+from app.hardware.rs_filters import DepthFilterChain
+
 try:
     import pyrealsense2 as rs
     _RS_OK = True
@@ -12,19 +18,72 @@ except Exception:
     rs = None
     _RS_OK = False
 
+log = logging.getLogger("vision.realsense")
+
+
 class RealSenseCamera:
     """
-    Wrapper RealSense 3D chuẩn cho services.
-    get_frames() -> (color_bgr: np.ndarray | None, depth_frame | None)
+    Backend RealSense 3D DUY NHẤT cho services (thay realsense.py / RSAlignWrapper).
+    get_frames() -> (color_bgr: np.ndarray | None, depth: DepthFrame | None)
+
+    threaded=True: pipeline đẩy frameset vào rs.frame_queue(queue_depth); capture
+    thread lấy ra, align (nếu bật), copy color + z16 ra numpy rồi NHẢ frame về pool
+    của librealsense ngay. Consumer chỉ nhận cặp (color, depth) mới nhất, không bao giờ
+    chờ sensor. Thống kê: frame nhận / drop / thời gian align.
+
+    depth_mode="roi": bỏ rs.align cả frame; depth giữ nguyên toạ độ sensor depth dưới
+    dạng RoiDepthFrame (kèm intrinsics color/depth + extrinsics) -> consumer chỉ map
+    pixel của các box cần tra (get_distance / box_distances theo toạ độ color).
+
+    filter_chain: DepthFilterChain tuỳ chọn, chạy trên capture thread trước align;
+    chỉ consumer nào truyền chain mới tốn chi phí lọc.
     """
     kind: str = "3D"
 
-    def __init__(self, width: int = 640, height: int = 480, fps: int = 30):
+    def __init__(self, width: int = 640, height: int = 480, fps: int = 30, *,
+                 threaded: bool = True, queue_depth: int = 2, align: bool = True,
+                 depth_mode: str = "align", filter_chain: Optional[DepthFilterChain] = None,
+                 wait_new: bool = True, wait_timeout_s: float = 0.2):
         self.width = int(width)
         self.height = int(height)
         self.fps = int(fps)
+        self.threaded = bool(threaded)
+        self.queue_depth = max(1, int(queue_depth))
+        self.depth_mode = str(depth_mode or "align").lower()
+        if self.depth_mode not in ("align", "roi"):
+            raise ValueError(f"depth_mode không hợp lệ: {depth_mode!r} (align|roi)")
+        self.use_align = bool(align) and self.depth_mode == "align"
+        self.filter_chain = filter_chain if filter_chain else None
+        self.wait_new = bool(wait_new)
+        self.wait_timeout_s = float(wait_timeout_s)
+
         self.pipe: Optional["rs.pipeline"] = None
         self.align: Optional["rs.align"] = None
+        self._queue = None
+        self.depth_scale = 0.001
+        self._intr: Optional[Intrinsics] = None
+        self._color_intr: Optional[Intrinsics] = None
+        self._d2c: Optional[Extrinsics] = None
+        self._lock = threading.RLock()
+
+        # capture thread state
+        self._cond = threading.Condition(threading.Lock())
+        self._t: Optional[threading.Thread] = None
+        self._stop_evt = threading.Event()
+        self._latest: Optional[Tuple[np.ndarray, DepthFrame, float]] = None
+        self._latest_seq = 0
+        self._read_seq = 0
+        self.last_capture_ts: float = 0.0
+        self.last_seq: int = 0
+
+        # stats
+        self.frames_received = 0
+        self.frames_dropped = 0        # ghi đè trước khi consumer lấy
+        self.frames_skipped_hw = 0     # frame_number nhảy cóc (queue/USB drop)
+        self._last_fn = 0
+        self.align_ms_last = 0.0
+        self.align_ms_avg = 0.0
+        self.align_ms_max = 0.0
 
     @staticmethod
     def list_devices() -> list:
@@ -36,35 +95,161 @@ class RealSenseCamera:
     def open(self):
         if not _RS_OK:
             return
-        if self.pipe is not None:
-            return
-        cfg = rs.config()
-        cfg.enable_stream(rs.stream.depth, self.width, self.height, rs.format.z16, self.fps)
-        cfg.enable_stream(rs.stream.color, self.width, self.height, rs.format.bgr8, self.fps)
-        self.pipe = rs.pipeline()
-        self.pipe.start(cfg)
-        self.align = rs.align(rs.stream.color)
+        with self._lock:
+            if self.pipe is not None:
+                return
+            cfg = rs.config()
+            cfg.enable_stream(rs.stream.depth, self.width, self.height, rs.format.z16, self.fps)
+            cfg.enable_stream(rs.stream.color, self.width, self.height, rs.format.bgr8, self.fps)
+            self.pipe = rs.pipeline()
+            if self.threaded:
+                self._queue = rs.frame_queue(self.queue_depth, keep_frames=True)
+                profile = self.pipe.start(cfg, self._queue)
+            else:
+                profile = self.pipe.start(cfg)
+            try:
+                self.depth_scale = float(profile.get_device().first_depth_sensor().get_depth_scale())
+            except Exception:
+                self.depth_scale = 0.001
+            self.align = rs.align(rs.stream.color) if self.use_align else None
+            self._intr = None
+            self._color_intr = None
+            self._d2c = None
+            self._last_fn = 0
+            if self.threaded:
+                self._stop_evt.clear()
+                self._t = threading.Thread(target=self._capture_loop, name="rs-capture", daemon=True)
+                self._t.start()
 
     def is_opened(self) -> bool:
         return self.pipe is not None
 
-    def get_frames(self) -> Tuple[Optional[np.ndarray], Optional[object]]:
-        if not self.pipe:
-            self.open()
-        if not self.pipe:
-            return None, None
-        frames = self.pipe.wait_for_frames()
-        if self.align:
+    # ---------- frameset -> numpy (nhả frame librealsense ngay) ----------
+    def _convert(self, frames) -> Optional[Tuple[np.ndarray, DepthFrame, float]]:
+        if self.filter_chain is not None:
+            frames = self.filter_chain.process(frames)
+        if self.align is not None:
+            t0 = time.perf_counter()
             frames = self.align.process(frames)
+            ms = (time.perf_counter() - t0) * 1000.0
+            self.align_ms_last = ms
+            self.align_ms_avg = ms if self.align_ms_avg == 0.0 else 0.9 * self.align_ms_avg + 0.1 * ms
+            self.align_ms_max = max(self.align_ms_max, ms)
         depth = frames.get_depth_frame()
         color = frames.get_color_frame()
-        if not color:
+        if not color or not depth:
+            return None
+        fn = int(color.get_frame_number())
+        if self._last_fn and fn > self._last_fn + 1:
+            self.frames_skipped_hw += fn - self._last_fn - 1
+        self._last_fn = fn
+        if self._intr is None:
+            try:
+                self._intr = Intrinsics.from_rs(depth.profile.as_video_stream_profile().get_intrinsics())
+            except Exception:
+                self._intr = None
+        if self.depth_mode == "roi" and self._d2c is None:
+            try:
+                self._color_intr = Intrinsics.from_rs(color.profile.as_video_stream_profile().get_intrinsics())
+                self._d2c = Extrinsics.from_rs(depth.profile.get_extrinsics_to(color.profile))
+            except Exception as e:
+                log.warning("RealSense: không đọc được extrinsics depth->color: %s", e)
+        color_np = np.array(color.get_data(), copy=True)
+        z16 = np.array(depth.get_data(), copy=True)
+        ts, fnum = float(depth.get_timestamp()), int(depth.get_frame_number())
+        if self.depth_mode == "roi" and self._d2c is not None and self._intr is not None:
+            dframe: DepthFrame = RoiDepthFrame(z16, self.depth_scale, self._intr, self._color_intr, self._d2c,
+                                               timestamp=ts, frame_number=fnum)
+        else:
+            dframe = DepthFrame(z16, self.depth_scale, self._intr, timestamp=ts, frame_number=fnum)
+        return color_np, dframe, time.monotonic()
+
+    def _capture_loop(self):
+        while not self._stop_evt.is_set():
+            q = self._queue
+            if q is None:
+                break
+            try:
+                f = q.wait_for_frame(200)
+            except Exception:
+                continue  # timeout
+            try:
+                got = self._convert(f.as_frameset())
+            except Exception as e:
+                log.warning("RealSense convert error: %s", e)
+                got = None
+            del f
+            if got is None:
+                continue
+            with self._cond:
+                if self._latest_seq > self._read_seq:
+                    self.frames_dropped += 1
+                self._latest = got
+                self._latest_seq += 1
+                self.frames_received += 1
+                self._cond.notify_all()
+
+    # ---------- consumer ----------
+    def _take_latest(self, wait: bool, timeout: float) -> Optional[Tuple[np.ndarray, DepthFrame, float]]:
+        with self._cond:
+            if wait and self._latest_seq <= self._read_seq:
+                self._cond.wait_for(lambda: self._latest_seq > self._read_seq or self._stop_evt.is_set(),
+                                    timeout=timeout)
+            if self._latest is None or (wait and self._latest_seq <= self._read_seq):
+                return None
+            self._read_seq = self._latest_seq
+            self.last_seq = self._latest_seq
+            self.last_capture_ts = self._latest[2]
+            return self._latest
+
+    def _read(self, wait: Optional[bool], timeout: Optional[float]):
+        if not self.pipe:
+            self.open()
+        if not self.pipe:
+            return None
+        if self.threaded:
+            w = self.wait_new if wait is None else bool(wait)
+            to = self.wait_timeout_s if timeout is None else float(timeout)
+            return self._take_latest(w, to)
+        with self._lock:
+            frames = self.pipe.wait_for_frames()
+            got = self._convert(frames)
+            if got is not None:
+                self.frames_received += 1
+                self.last_seq += 1
+                self.last_capture_ts = got[2]
+            return got
+
+    def get_frames(self, wait: Optional[bool] = None,
+                   timeout: Optional[float] = None) -> Tuple[Optional[np.ndarray], Optional[DepthFrame]]:
+        got = self._read(wait, timeout)
+        if got is None:
             return None, None
-        color_np = np.asanyarray(color.get_data())
-        return color_np, depth
+        return got[0], got[1]
 
     read = get_frames
 
+    def get_bundle(self, wait: Optional[bool] = None, timeout: Optional[float] = None) -> Optional[FrameBundle]:
+        got = self._read(wait, timeout)
+        if got is None:
+            return None
+        return FrameBundle(got[0], got[1], capture_ts=got[2], seq=self.last_seq,
+                           device_ts=getattr(got[1], "timestamp", None))
+
+    def stats(self) -> dict:
+        return {
+            "threaded": self.threaded,
+            "depth_mode": self.depth_mode,
+            "queue_depth": self.queue_depth,
+            "frames_received": self.frames_received,
+            "frames_dropped": self.frames_dropped,
+            "frames_skipped_hw": self.frames_skipped_hw,
+            "align_ms_last": round(self.align_ms_last, 3),
+            "align_ms_avg": round(self.align_ms_avg, 3),
+            "align_ms_max": round(self.align_ms_max, 3),
+            "depth_filters": self.filter_chain.stats() if self.filter_chain is not None else None,
+        }
+
     def check_connectivity(self, timeout_s: float = 1.5) -> Tuple[bool, str]:
         if not _RS_OK:
             return False, "pyrealsense2 chưa sẵn sàng (chưa cài hoặc driver lỗi)"
@@ -87,10 +272,23 @@ class RealSenseCamera:
         self.close()
 
     def close(self):
-        if self.pipe is not None:
-            try:
-                self.pipe.stop()
-            except Exception:
-                pass
-        self.pipe = None
-        self.align = None
+        self._stop_evt.set()
+        with self._cond:
+            self._cond.notify_all()
+        t = self._t
+        if t is not None and t.is_alive() and t is not threading.current_thread():
+            t.join(timeout=1.0)
+        self._t = None
+        with self._lock:
+            if self.pipe is not None:
+                try:
+                    self.pipe.stop()
+                except Exception:
+                    pass
+            self.pipe = None
+            self.align = None
+            self._queue = None
+        with self._cond:
+            self._latest = None
+            self._latest_seq = 0
+            self._read_seq = 0
@@ -0,0 +1,383 @@
+# app/hardware/recording.py
+from __future__ import annotations
+
+import dataclasses
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.hardware.depth import DepthFrame, Extrinsics, Intrinsics, RoiDepthFrame, as_depth
+from app.hardware.frame import FrameBundle
+
+log = logging.getLogger("vision.recording")
+
+# Layout 1 session (thư mục):
+#   meta.json           version, kind, frames, shape color/depth, depth_scale, intrinsics, extrinsics
+#   color.bin           JPEG nối liền nhau
+#   color_index.npy     int64 (N, 2) = offset, length trong color.bin
+#   timestamps.npy      float64 (N, 2) = capture_ts (s, tương đối frame đầu), device ts (ms)
+#   depth_00000.npy ... uint16 (chunk_frames, H, W) memmap, z16 thô (chunk cuối có thể chưa đầy)
+_VERSION = 1
+_META = "meta.json"
+_COLOR = "color.bin"
+_COLOR_INDEX = "color_index.npy"
+_TS = "timestamps.npy"
+
+
+def _chunk_name(k: int) -> str:
+    return f"depth_{k:05d}.npy"
+
+
+def _extr_to_json(e: Optional[Extrinsics]) -> Optional[Dict[str, Any]]:
+    if e is None:
+        return None
+    return {"rotation": np.asarray(e.rotation).tolist(), "translation": np.asarray(e.translation).tolist()}
+
+
+def _extr_from_json(d: Optional[Dict[str, Any]]) -> Optional[Extrinsics]:
+    if not d:
+        return None
+    return Extrinsics(np.asarray(d["rotation"], dtype=np.float64), np.asarray(d["translation"], dtype=np.float64))
+
+
+class SessionRecorder:
+    """
+    Ghi color (JPEG) + depth z16 thô + intrinsics + timestamps ra 1 thư mục session.
+    Depth ghi thẳng vào file .npy memmap theo chunk (không giữ RAM). Dùng trực tiếp
+    write(color, depth) hoặc gắn làm sink của FrameBus (gọi recorder(bundle)).
+    """
+
+    def __init__(self, path: str, chunk_frames: int = 300, jpeg_quality: int = 90):
+        self.path = path
+        self.chunk_frames = max(1, int(chunk_frames))
+        self.jpeg_quality = int(jpeg_quality)
+        os.makedirs(path, exist_ok=True)
+        self._color_f = open(os.path.join(path, _COLOR), "wb")
+        self._index: List[Tuple[int, int]] = []
+        self._ts: List[Tuple[float, float]] = []
+        self._offset = 0
+        self._t0: Optional[float] = None
+        self._chunk: Optional[np.ndarray] = None
+        self._chunk_k = -1
+        self._depth_shape: Optional[Tuple[int, int]] = None
+        self._color_shape: Optional[Tuple[int, ...]] = None
+        self._meta: Dict[str, Any] = {"depth_scale": None, "intrinsics": None,
+                                      "color_intrinsics": None, "depth_to_color": None}
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.closed = False
+
+    def __call__(self, fb: Any) -> None:
+        if isinstance(fb, FrameBundle):
+            self.write(fb.bgr, fb.depth, ts=fb.capture_ts)
+        else:
+            self.write(fb)
+
+    def _depth_slot(self, i: int, shape: Tuple[int, int]) -> np.ndarray:
+        k, j = divmod(i, self.chunk_frames)
+        if k != self._chunk_k:
+            if self._chunk is not None:
+                self._chunk.flush()
+            self._chunk = np.lib.format.open_memmap(
+                os.path.join(self.path, _chunk_name(k)), mode="w+", dtype=np.uint16,
+                shape=(self.chunk_frames,) + shape)
+            self._chunk_k = k
+        return self._chunk[j]
+
+    def write(self, color: np.ndarray, depth: Any = None, ts: Optional[float] = None) -> int:
+        """Ghi 1 frame, trả về index. Depth = DepthFrame / RoiDepthFrame / rs.depth_frame / None."""
+        if color is None:
+            return -1
+        ts = time.monotonic() if ts is None else float(ts)
+        ok, jpg = cv2.imencode(".jpg", color, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+        if not ok:
+            raise RuntimeError("JPEG encode thất bại")
+        df = as_depth(depth)
+        with self._lock:
+            if self.closed:
+                return -1
+            i = self.frames
+            if self._t0 is None:
+                self._t0 = ts
+                self._color_shape = tuple(int(s) for s in color.shape)
+            if df is not None:
+                shape = tuple(int(s) for s in df.z16.shape[:2])
+                if self._depth_shape is None:
+                    self._depth_shape = shape
+                    self._capture_depth_meta(df)
+                elif shape != self._depth_shape:
+                    raise ValueError(f"depth shape đổi giữa session: {shape} != {self._depth_shape}")
+                np.copyto(self._depth_slot(i, shape), df.z16, casting="unsafe")
+            elif self._depth_shape is not None:
+                self._depth_slot(i, self._depth_shape)[:] = 0   # frame thiếu depth -> toàn lỗ
+            buf = jpg.tobytes()
+            self._color_f.write(buf)
+            self._index.append((self._offset, len(buf)))
+            self._offset += len(buf)
+            self._ts.append((ts - self._t0, float(getattr(df, "timestamp", 0.0) or 0.0)))
+            self.frames += 1
+            return i
+
+    def _capture_depth_meta(self, df: DepthFrame) -> None:
+        self._meta["depth_scale"] = df.depth_scale
+        if df.intrinsics is not None:
+            self._meta["intrinsics"] = dataclasses.asdict(df.intrinsics)
+        if isinstance(df, RoiDepthFrame):
+            self._meta["color_intrinsics"] = dataclasses.asdict(df.color_intrinsics)
+            self._meta["depth_to_color"] = _extr_to_json(df.d2c)
+
+    def close(self) -> Dict[str, Any]:
+        with self._lock:
+            if self.closed:
+                return self._read_meta()
+            self.closed = True
+            self._color_f.close()
+            if self._chunk is not None:
+                self._chunk.flush()
+                self._chunk = None
+            np.save(os.path.join(self.path, _COLOR_INDEX),
+                    np.asarray(self._index, dtype=np.int64).reshape(-1, 2))
+            np.save(os.path.join(self.path, _TS), np.asarray(self._ts, dtype=np.float64).reshape(-1, 2))
+            meta = {
+                "version": _VERSION,
+                "kind": "3D" if self._depth_shape is not None else "2D",
+                "frames": self.frames,
+                "chunk_frames": self.chunk_frames,
+                "color_shape": list(self._color_shape) if self._color_shape else None,
+                "depth_shape": list(self._depth_shape) if self._depth_shape else None,
+                "duration_s": self._ts[-1][0] if self._ts else 0.0,
+                **self._meta,
+            }
+            with open(os.path.join(self.path, _META), "w", encoding="utf-8") as f:
+                json.dump(meta, f, indent=2)
+        log.info("Session saved %s: %d frames, %.1fs", self.path, meta["frames"], meta["duration_s"])
+        return meta
+
+    def _read_meta(self) -> Dict[str, Any]:
+        with open(os.path.join(self.path, _META), encoding="utf-8") as f:
+            return json.load(f)
+
+
+def record_session(camera, path: str, seconds: float = 10.0, max_frames: int = 0,
+                   chunk_frames: int = 300) -> Dict[str, Any]:
+    """Ghi từ camera bất kỳ có get_frames() trong `seconds` giây (hoặc tới max_frames)."""
+    rec = SessionRecorder(path, chunk_frames=chunk_frames)
+    camera.open()
+    end = time.monotonic() + float(seconds)
+    try:
+        while time.monotonic() < end and not (max_frames and rec.frames >= max_frames):
+            color, depth = camera.get_frames()
+            if color is None:
+                continue
+            rec.write(color, depth, ts=getattr(camera, "last_capture_ts", None) or None)
+    finally:
+        meta = rec.close()
+    return meta
+
+
+class ReplayCamera:
+    """
+    Nguồn camera phát lại session đã ghi, cùng contract với OpenCVCamera/RealSenseCamera:
+    get_frames()/read() -> (color_bgr, depth | None), get_bundle(), check_connectivity(), close().
+    Depth là DepthFrame (view memmap zero-copy, có get_distance); session ghi ở chế độ
+    ROI trả RoiDepthFrame.
+    realtime=True: giữ nhịp theo timestamps gốc (chia speed); False: nhanh nhất có thể.
+    """
+
+    def __init__(self, path: str, *, realtime: bool = True, speed: float = 1.0, loop: bool = False):
+        self.path = path
+        self.device = f"replay:{os.path.abspath(path)}"
+        self.realtime = bool(realtime)
+        self.speed = max(1e-3, float(speed))
+        self.loop = bool(loop)
+        self.meta: Dict[str, Any] = {}
+        self.kind = "2D"
+        self.width = self.height = 0
+        self.fps = 0
+        self._color: Optional[np.ndarray] = None
+        self._index: Optional[np.ndarray] = None
+        self._ts: Optional[np.ndarray] = None
+        self._chunks: Dict[int, np.ndarray] = {}
+        self._intr: Optional[Intrinsics] = None
+        self._color_intr: Optional[Intrinsics] = None
+        self._d2c: Optional[Extrinsics] = None
+        self._lock = threading.Lock()
+        self._pos = 0
+        self._clock0: Optional[float] = None
+        self._ts0 = 0.0
+        self.last_capture_ts: float = 0.0
+        self.last_seq: int = 0
+        self.loops = 0
+        self.decode_ms_avg = 0.0
+
+    # ---------- mở session ----------
+    def open(self):
+        with self._lock:
+            if self._index is not None:
+                return
+            with open(os.path.join(self.path, _META), encoding="utf-8") as f:
+                self.meta = json.load(f)
+            n = int(self.meta.get("frames", 0))
+            self._index = np.load(os.path.join(self.path, _COLOR_INDEX))[:n]
+            self._ts = np.load(os.path.join(self.path, _TS))[:n]
+            self._color = np.memmap(os.path.join(self.path, _COLOR), dtype=np.uint8, mode="r") \
+                if n else np.zeros(0, np.uint8)
+            self.kind = self.meta.get("kind", "2D")
+            cs = self.meta.get("color_shape") or [0, 0]
+            self.height, self.width = int(cs[0]), int(cs[1])
+            dur = float(self.meta.get("duration_s") or 0.0)
+            self.fps = int(round((n - 1) / dur)) if n > 1 and dur > 0 else 0
+            if self.meta.get("intrinsics"):
+                self._intr = Intrinsics(**self.meta["intrinsics"])
+            if self.meta.get("color_intrinsics"):
+                self._color_intr = Intrinsics(**self.meta["color_intrinsics"])
+            self._d2c = _extr_from_json(self.meta.get("depth_to_color"))
+            self._pos = 0
+            self._clock0 = None
+
+    def is_opened(self) -> bool:
+        return self._index is not None
+
+    def __len__(self) -> int:
+        return 0 if self._index is None else int(len(self._index))
+
+    def seek(self, index: int) -> None:
+        with self._lock:
+            self._pos = max(0, min(int(index), len(self)))
+            self._clock0 = None
+
+    def _depth_at(self, i: int) -> Optional[DepthFrame]:
+        if self.meta.get("depth_shape") is None:
+            return None
+        cf = int(self.meta["chunk_frames"])
+        k, j = divmod(i, cf)
+        chunk = self._chunks.get(k)
+        if chunk is None:
+            chunk = self._chunks[k] = np.load(os.path.join(self.path, _chunk_name(k)), mmap_mode="r")
+        z16 = chunk[j]
+        scale = float(self.meta.get("depth_scale") or 0.001)
+        dev_ts = float(self._ts[i, 1])
+        if self._d2c is not None and self._color_intr is not None and self._intr is not None:
+            return RoiDepthFrame(z16, scale, self._intr, self._color_intr, self._d2c,
+                                 timestamp=dev_ts, frame_number=i)
+        return DepthFrame(z16, scale, self._intr, timestamp=dev_ts, frame_number=i)
+
+    def _next(self, wait: bool) -> Optional[Tuple[np.ndarray, Optional[DepthFrame], float]]:
+        with self._lock:
+            n = len(self)
+            if n == 0:
+                return None
+            if self._pos >= n:
+                if not self.loop:
+                    return None
+                self._pos = 0
+                self._clock0 = None
+                self.loops += 1
+            i = self._pos
+            if self.realtime:
+                now = time.monotonic()
+                if self._clock0 is None:
+                    self._clock0, self._ts0 = now, float(self._ts[i, 0])
+                due = self._clock0 + (float(self._ts[i, 0]) - self._ts0) / self.speed
+                if due > now:
+                    if not wait:
+                        return None
+                    time.sleep(due - now)
+            self._pos += 1
+            off, ln = (int(v) for v in self._index[i])
+            t0 = time.perf_counter()
+            color = cv2.imdecode(np.asarray(self._color[off:off + ln]), cv2.IMREAD_COLOR)
+            ms = (time.perf_counter() - t0) * 1000.0
+            self.decode_ms_avg = ms if self.decode_ms_avg == 0.0 else 0.9 * self.decode_ms_avg + 0.1 * ms
+            depth = self._depth_at(i)
+            self.last_capture_ts = time.monotonic()
+            self.last_seq += 1
+            return color, depth, self.last_capture_ts
+
+    def get_frames(self, wait: Optional[bool] = None,
+                   timeout: Optional[float] = None) -> Tuple[Optional[np.ndarray], Optional[DepthFrame]]:
+        if not self.is_opened():
+            self.open()
+        got = self._next(True if wait is None else bool(wait))
+        if got is None:
+            return None, None
+        return got[0], got[1]
+
+    read = get_frames
+
+    def get_bundle(self, wait: Optional[bool] = None, timeout: Optional[float] = None) -> Optional[FrameBundle]:
+        color, depth = self.get_frames(wait=wait, timeout=timeout)
+        if color is None:
+            return None
+        return FrameBundle(color, depth, capture_ts=self.last_capture_ts, seq=self.last_seq,
+                           device_ts=getattr(depth, "timestamp", None))
+
+    @property
+    def finished(self) -> bool:
+        return self.is_opened() and not self.loop and self._pos >= len(self)
+
+    def stats(self) -> dict:
+        return {
+            "source": "replay",
+            "path": self.path,
+            "realtime": self.realtime,
+            "position": self._pos,
+            "frames": len(self),
+            "loops": self.loops,
+            "last_seq": self.last_seq,
+            "decode_ms_avg": round(self.decode_ms_avg, 3),
+        }
+
+    def check_connectivity(self, timeout_s: float = 1.5) -> Tuple[bool, str]:
+        try:
+            self.open()
+        except Exception as e:
+            return False, f"Không mở được session replay {self.path}: {e}"
+        if not len(self):
+            return False, f"Session replay rỗng: {self.path}"
+        return True, (f"ĐÃ KẾT NỐI replay {self.kind} ({self.width}x{self.height}, "
+                      f"{len(self)} frames, {'realtime' if self.realtime else 'fast'})")
+
+    def stop(self):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._chunks.clear()
+            self._color = None
+            self._index = None
+            self._ts = None
+            self._pos = 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """python -m app.hardware.recording --out DIR [--seconds 10] [--rgb DEVICE]"""
+    import argparse
+    ap = argparse.ArgumentParser(description="Ghi session color+depth để replay/benchmark")
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--rgb", default=None, help="ghi từ camera RGB (device) thay vì RealSense")
+    ap.add_argument("--depth-mode", default="align", choices=("align", "roi"))
+    args = ap.parse_args(argv)
+    if args.rgb is not None:
+        from app.hardware.rgb_camera import OpenCVCamera
+        cam = OpenCVCamera(args.rgb)
+    else:
+        from app.hardware.realsense_camera import RealSenseCamera
+        cam = RealSenseCamera(depth_mode=args.depth_mode)
+    try:
+        meta = record_session(cam, args.out, seconds=args.seconds)
+    finally:
+        cam.close()
+    print(json.dumps({k: meta[k] for k in ("kind", "frames", "duration_s")}))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,17 +1,40 @@
 # app/hardware/rgb_camera.py
 from __future__ import annotations
-import cv2, threading, time
+import cv2, logging, threading, time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Tuple, Union
 
+from app.hardware.file_source import KIND_DEVICE, FileFrameSource, source_kind
+from app.hardware.frame import FrameBundle, JpegFrameBundle, decode_jpeg
+
+log = logging.getLogger("vision.rgb")
+
 class OpenCVCamera:
     """
     Nguồn camera 2D (RGB). Trả về (color_bgr, None) để tương thích service.
     Hỗ trợ device index (0,1,...) hoặc đường dẫn '/dev/videoX'.
+
+    threaded=True: một capture thread grab liên tục, chỉ giữ frame MỚI NHẤT
+    (kèm capture_ts monotonic + seq). get_frames() trả ngay, hoặc chờ tối đa
+    wait_timeout_s cho tới khi có frame mới (wait_new=True) để loop service
+    không phải spin sleep(0.002).
+
+    device cũng có thể là video file, thư mục ảnh hoặc glob ảnh ('/data/run1/*.jpg'):
+    khi đó frame đến từ FileFrameSource (decode-ahead thread, loop, seek, realtime
+    hoặc unthrottled) và width/height/fps của camera không áp dụng.
+
+    raw_mjpeg=True (cần use_mjpg): đặt CAP_PROP_CONVERT_RGB=0 để lấy buffer MJPEG thô;
+    get_bundle() trả JpegFrameBundle, frame được gửi lên decode worker pool ngay lúc grab
+    theo `decode` (bgr | gray | gray2 | gray4) -> engine chỉ cần gray không phải decode màu
+    rồi cvtColor. get_frames() vẫn trả BGR như cũ.
     """
     kind: str = "2D"
 
     def __init__(self, device: Union[int, str] = 0, width: int = 640, height: int = 480, fps: int = 30,
-                 use_mjpg: bool = True, buffer_size: int = 2):
+                 use_mjpg: bool = True, buffer_size: int = 2,
+                 threaded: bool = False, wait_new: bool = True, wait_timeout_s: float = 0.1,
+                 loop: bool = True, realtime: bool = True, decode_ahead: int = 4,
+                 raw_mjpeg: bool = False, decode: str = "bgr", decode_workers: int = 2):
         self.device = device
         self.width = int(width)
         self.height = int(height)
@@ -21,6 +44,41 @@ class OpenCVCamera:
         self.cap: Optional[cv2.VideoCapture] = None
         self._lock = threading.RLock()
 
+        # ---- nguồn file (video / ảnh) ----
+        self.source = source_kind(device)
+        self.loop = bool(loop)
+        self.realtime = bool(realtime)
+        self.decode_ahead = int(decode_ahead)
+        self._file: Optional[FileFrameSource] = None
+
+        # ---- MJPEG thô + decode worker pool ----
+        self.raw_mjpeg = bool(raw_mjpeg) and self.use_mjpg
+        self.decode_mode = str(decode)
+        self.decode_workers = max(1, int(decode_workers))
+        self._dec_pool: Optional[ThreadPoolExecutor] = None
+        self._latest_fut = None        # Future decode của _latest (threaded)
+        self._last_fut = None          # Future decode của frame consumer vừa lấy
+        self.raw_frames = 0
+        self.decodes_cancelled = 0
+
+        # ---- capture thread (latest-frame grabber) ----
+        self.threaded = bool(threaded)
+        self.wait_new = bool(wait_new)
+        self.wait_timeout_s = float(wait_timeout_s)
+        self._cond = threading.Condition(threading.Lock())
+        self._grab_t: Optional[threading.Thread] = None
+        self._grab_stop = threading.Event()
+        self._latest = None            # np.ndarray | None
+        self._latest_ts = 0.0          # time.monotonic() lúc grab xong
+        self._latest_seq = 0
+        self._read_seq = 0             # seq của frame consumer lấy gần nhất
+        self.frames_captured = 0
+        self.frames_dropped = 0        # frame bị ghi đè trước khi consumer kịp lấy
+
+        # metadata của frame trả về gần nhất (cho cả 2 mode)
+        self.last_capture_ts: float = 0.0
+        self.last_seq: int = 0
+
     def _to_index(self, dev: Union[int, str]) -> Union[int, str]:
         if isinstance(dev, str) and dev.startswith("/dev/video"):
             try:
@@ -29,7 +87,23 @@ class OpenCVCamera:
                 return dev
         return dev
 
+    @property
+    def is_file_source(self) -> bool:
+        return self.source != KIND_DEVICE
+
     def open(self):
+        if self.is_file_source:
+            with self._lock:
+                if self._file is None:
+                    src = FileFrameSource(str(self.device), fps=self.fps, loop=self.loop,
+                                          realtime=self.realtime, decode_ahead=self.decode_ahead)
+                    if src.open():
+                        self._file = src
+            return
+        if not self._join_grabber(1.0):
+            # grab thread cũ còn kẹt trong cap.read() -> chưa mở lại (tránh 2 thread cùng chạy)
+            log.warning("RGB %s: grab thread cũ chưa dừng, hoãn open()", self.device)
+            return
         with self._lock:
             if self.cap is not None:
                 return
@@ -55,28 +129,212 @@ class OpenCVCamera:
                     self.cap.set(cv2.CAP_PROP_FOURCC, fourcc)
                 except Exception:
                     pass
+            if self.raw_mjpeg:
+                try:
+                    self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+                except Exception:
+                    pass
+                if self._dec_pool is None:
+                    self._dec_pool = ThreadPoolExecutor(self.decode_workers, thread_name_prefix="mjpeg-dec")
             try:
-                self.cap.set(cv2.CAP_PROP_BUFFERSIZE, max(1, self.buffer_size))
+                # threaded: driver chỉ cần 1 slot, thread đã luôn lấy frame mới nhất
+                bs = 1 if self.threaded else self.buffer_size
+                self.cap.set(cv2.CAP_PROP_BUFFERSIZE, max(1, bs))
             except Exception:
                 pass
 
-    def get_frames(self) -> Tuple[Optional["np.ndarray"], None]:
-        import numpy as np  # lazy import
+            if self.threaded:
+                self._start_grabber()
+
+    def reconfigure(self, width: int, height: int, fps: int) -> bool:
+        """
+        Đổi độ phân giải / fps trên capture đang mở (giữ nguyên thiết bị, không close/open lại).
+        Trả False nếu không áp dụng được (nguồn file, chưa mở, grab thread không dừng kịp).
+        """
+        if self.is_file_source or self.cap is None:
+            return False
+        t = self._grab_t
+        if t is not None and t.is_alive():
+            self._grab_stop.set()
+            with self._cond:
+                self._cond.notify_all()
+            t.join(timeout=1.0)
+            if t.is_alive():
+                return False
         with self._lock:
             if self.cap is None:
-                self.open()
-            if self.cap is None:
-                return None, None
-            ok, frame = self.cap.read()
+                return False
+            self.width, self.height, self.fps = int(width), int(height), int(fps)
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+            self.cap.set(cv2.CAP_PROP_FPS, self.fps)
+        with self._cond:
+            self._latest = None
+            self._latest_fut = None
+            self._read_seq = self._latest_seq
+        if self.threaded:
+            self._start_grabber()
+        return True
+
+    # ---------- capture thread ----------
+    def _start_grabber(self):
+        if self._grab_t is not None and self._grab_t.is_alive():
+            return
+        self._grab_stop.clear()
+        self._grab_t = threading.Thread(target=self._grab_loop, name=f"rgb-grab-{self.device}", daemon=True)
+        self._grab_t.start()
+
+    def _join_grabber(self, timeout: float) -> bool:
+        """Chờ grab thread cũ thoát; True nếu không còn thread nào chạy."""
+        t = self._grab_t
+        if t is None or t is threading.current_thread():
+            return True
+        if t.is_alive():
+            t.join(timeout=timeout)
+            if t.is_alive():
+                return False
+        self._grab_t = None
+        return True
+
+    def _grab_loop(self):
+        cap = self.cap
+        # cap bị close()/mở lại thì thread này thoát, kể cả khi _grab_stop đã bị clear
+        while not self._grab_stop.is_set() and cap is not None and cap is self.cap:
+            try:
+                ok, frame = cap.read()
+            except Exception:
+                ok, frame = False, None
             if not ok or frame is None:
-                time.sleep(0.002)
+                time.sleep(0.005)
+                continue
+            ts = time.monotonic()
+            fut = self._submit_decode(frame)
+            with self._cond:
+                if self._latest_seq > self._read_seq:
+                    self.frames_dropped += 1
+                    if self._latest_fut is not None and self._latest_fut.cancel():
+                        self.decodes_cancelled += 1
+                self._latest = frame
+                self._latest_fut = fut
+                self._latest_ts = ts
+                self._latest_seq += 1
+                self.frames_captured += 1
+                self._cond.notify_all()
+
+    def _get_latest(self, wait: bool, timeout: float) -> Tuple[Optional["np.ndarray"], None]:
+        with self._cond:
+            if wait and self._latest_seq <= self._read_seq:
+                self._cond.wait_for(lambda: self._latest_seq > self._read_seq or self._grab_stop.is_set(),
+                                    timeout=timeout)
+            if self._latest is None or (wait and self._latest_seq <= self._read_seq):
                 return None, None
-            return frame, None
+            self._read_seq = self._latest_seq
+            self.last_capture_ts = self._latest_ts
+            self.last_seq = self._latest_seq
+            self._last_fut = self._latest_fut
+            return self._latest, None
+
+    # ---------- MJPEG thô ----------
+    @staticmethod
+    def _is_raw(frame) -> bool:
+        # CONVERT_RGB=0 -> V4L2 trả buffer 1 x N (hoặc N) uint8 thay vì H x W x 3
+        return frame.ndim == 1 or (frame.ndim == 2 and frame.shape[0] == 1)
+
+    def _submit_decode(self, frame):
+        if self._dec_pool is None or not self._is_raw(frame):
+            return None
+        self.raw_frames += 1
+        try:
+            return self._dec_pool.submit(decode_jpeg, frame, self.decode_mode)
+        except RuntimeError:  # pool đã shutdown
+            return None
+
+    def get_frames(self, wait: Optional[bool] = None,
+                   timeout: Optional[float] = None) -> Tuple[Optional["np.ndarray"], None]:
+        frame = self._read_frame(wait, timeout)
+        if frame is not None and self._is_raw(frame):
+            fut, self._last_fut = self._last_fut, None
+            img = fut.result() if (fut is not None and self.decode_mode == "bgr") else None
+            frame = img if img is not None else decode_jpeg(frame, "bgr")
+        return frame, None
 
     read = get_frames
 
+    def _read_frame(self, wait: Optional[bool], timeout: Optional[float]):
+        self._last_fut = None
+        if self.is_file_source:
+            return self._get_file_frame(wait, timeout)[0]
+        with self._lock:
+            if self.cap is None:
+                self.open()
+            if self.cap is None:
+                return None
+            if not self.threaded:
+                ok, frame = self.cap.read()
+                if not ok or frame is None:
+                    time.sleep(0.002)
+                    return None
+                self.last_capture_ts = time.monotonic()
+                self.last_seq += 1
+                return frame
+        # threaded: không giữ self._lock khi chờ để close() không bị chặn
+        w = self.wait_new if wait is None else bool(wait)
+        to = self.wait_timeout_s if timeout is None else float(timeout)
+        return self._get_latest(w, to)[0]
+
+    def _get_file_frame(self, wait: Optional[bool], timeout: Optional[float]) -> Tuple[Optional["np.ndarray"], None]:
+        if self._file is None:
+            self.open()
+        src = self._file
+        if src is None:
+            return None, None
+        w = self.wait_new if wait is None else bool(wait)
+        to = (self.wait_timeout_s if timeout is None else float(timeout)) if w else 0.0
+        frame = src.read(timeout=to)
+        if frame is None:
+            return None, None
+        self.last_capture_ts = time.monotonic()
+        self.last_seq += 1
+        self.frames_captured += 1
+        return frame, None
+
+    def seek(self, index: int) -> None:
+        """Nhảy tới frame `index` (chỉ nguồn file)."""
+        if self._file is not None:
+            self._file.seek(index)
+
+    def get_bundle(self, wait: Optional[bool] = None, timeout: Optional[float] = None) -> Optional[FrameBundle]:
+        """Như get_frames() nhưng trả FrameBundle (kèm capture_ts/seq, view gray/rgb dùng chung)."""
+        frame = self._read_frame(wait, timeout)
+        if frame is None:
+            return None
+        if self._is_raw(frame):
+            fut, self._last_fut = self._last_fut, None
+            return JpegFrameBundle(frame, capture_ts=self.last_capture_ts, seq=self.last_seq,
+                                   prefetch={self.decode_mode: fut} if fut is not None else None)
+        return FrameBundle(frame, capture_ts=self.last_capture_ts, seq=self.last_seq)
+
+    def stats(self) -> dict:
+        if self._file is not None:
+            st = self._file.stats()
+            st.update(last_seq=self.last_seq, last_capture_ts=self.last_capture_ts)
+            return st
+        with self._cond:
+            return {
+                "threaded": self.threaded,
+                "frames_captured": self.frames_captured,
+                "frames_dropped": self.frames_dropped,
+                "raw_mjpeg": self.raw_mjpeg,
+                "raw_frames": self.raw_frames,
+                "decodes_cancelled": self.decodes_cancelled,
+                "last_seq": self.last_seq,
+                "last_capture_ts": self.last_capture_ts,
+            }
+
     def is_opened(self) -> bool:
         with self._lock:
+            if self.is_file_source:
+                return self._file is not None and self._file.is_opened()
             return bool(self.cap and self.cap.isOpened())
 
     def check_connectivity(self, timeout_s: float = 1.5) -> Tuple[bool, str]:
@@ -92,6 +350,8 @@ class OpenCVCamera:
             frame, _ = self.get_frames()
             if frame is not None:
                 h, w = frame.shape[:2]
+                if self.is_file_source:
+                    return True, f"ĐÃ KẾT NỐI nguồn file {self.source} ({w}x{h}, src={self.device})"
                 return True, f"ĐÃ KẾT NỐI camera 2D RGB ({w}x{h}@{self.fps}fps, dev={self.device})"
             time.sleep(0.01)
         return False, "Không nhận được khung hình từ camera RGB trong thời gian chờ"
@@ -100,6 +360,12 @@ class OpenCVCamera:
         self.close()
 
     def close(self):
+        self._grab_stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if not self._join_grabber(1.0):
+            # giữ tham chiếu: open() sau sẽ chờ thread này thoát trước khi mở lại
+            log.warning("RGB %s: grab thread chưa dừng sau 1s (cap.read() treo?)", self.device)
         with self._lock:
             if self.cap is not None:
                 try:
@@ -107,3 +373,14 @@ class OpenCVCamera:
                 except Exception:
                     pass
                 self.cap = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._dec_pool is not None:
+                self._dec_pool.shutdown(wait=False)
+                self._dec_pool = None
+        with self._cond:
+            self._latest = None
+            self._latest_fut = None
+            self._latest_seq = 0
+            self._read_seq = 0
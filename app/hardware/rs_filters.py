@@ -0,0 +1,133 @@
+# app/hardware/rs_filters.py
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+try:
+    import pyrealsense2 as rs
+    _RS_OK = True
+except Exception:
+    rs = None
+    _RS_OK = False
+
+log = logging.getLogger("vision.realsense.filters")
+
+FILTER_NAMES = ("decimation", "threshold", "spatial", "temporal", "hole_filling")
+
+
+def parse_filter_names(spec: Union[str, Sequence[str], None]) -> List[str]:
+    """'decimation, spatial' / ['decimation','spatial'] -> danh sách tên hợp lệ, giữ thứ tự."""
+    if not spec:
+        return []
+    items = spec.split(",") if isinstance(spec, str) else list(spec)
+    names: List[str] = []
+    for it in items:
+        n = str(it).strip().lower().replace("-", "_")
+        if not n:
+            continue
+        if n not in FILTER_NAMES:
+            log.warning("Bỏ qua depth filter không hỗ trợ: %r (hỗ trợ: %s)", it, ", ".join(FILTER_NAMES))
+            continue
+        names.append(n)
+    return names
+
+
+class DepthFilterChain:
+    """
+    Chuỗi post-processing depth của librealsense, chạy theo thứ tự cấu hình trên
+    capture thread (trước align), ghi latency từng filter (last/avg/max ms).
+    Filter nhận cả frameset: chỉ stream depth bị xử lý, color đi qua nguyên vẹn.
+    decimation đổi độ phân giải depth -> intrinsics depth lấy từ frame SAU chuỗi.
+    """
+
+    def __init__(self, names: Union[str, Sequence[str], None], *,
+                 decimation: int = 2,
+                 threshold_min: float = 0.15, threshold_max: float = 6.0,
+                 spatial_alpha: float = 0.5, spatial_delta: float = 20.0,
+                 temporal_alpha: float = 0.4, temporal_delta: float = 20.0,
+                 hole_filling: int = 1):
+        self.names = parse_filter_names(names)
+        self.options: Dict[str, Any] = {
+            "decimation": int(decimation),
+            "threshold_min": float(threshold_min), "threshold_max": float(threshold_max),
+            "spatial_alpha": float(spatial_alpha), "spatial_delta": float(spatial_delta),
+            "temporal_alpha": float(temporal_alpha), "temporal_delta": float(temporal_delta),
+            "hole_filling": int(hole_filling),
+        }
+        self._filters: List[Tuple[str, Any]] = []
+        self._stats: Dict[str, Dict[str, float]] = {
+            n: {"calls": 0, "ms_last": 0.0, "ms_avg": 0.0, "ms_max": 0.0} for n in self.names
+        }
+        self.errors = 0
+        if _RS_OK:
+            for n in self.names:
+                try:
+                    self._filters.append((n, self._make(n)))
+                except Exception as e:
+                    log.warning("Không tạo được depth filter %s: %s", n, e)
+
+    @classmethod
+    def from_settings(cls, settings, names: Union[str, Sequence[str], None] = None) -> "DepthFilterChain":
+        g = lambda k, d: getattr(settings, k, d)  # noqa: E731
+        return cls(
+            g("RS_FILTERS", "") if names is None else names,
+            decimation=g("RS_DECIMATION", 2),
+            threshold_min=g("RS_THRESHOLD_MIN_M", 0.15), threshold_max=g("RS_THRESHOLD_MAX_M", 6.0),
+            spatial_alpha=g("RS_SPATIAL_ALPHA", 0.5), spatial_delta=g("RS_SPATIAL_DELTA", 20.0),
+            temporal_alpha=g("RS_TEMPORAL_ALPHA", 0.4), temporal_delta=g("RS_TEMPORAL_DELTA", 20.0),
+            hole_filling=g("RS_HOLE_FILLING", 1),
+        )
+
+    def _make(self, name: str):
+        o = self.options
+        if name == "decimation":
+            f = rs.decimation_filter()
+            f.set_option(rs.option.filter_magnitude, max(1, o["decimation"]))
+        elif name == "threshold":
+            f = rs.threshold_filter(o["threshold_min"], o["threshold_max"])
+        elif name == "spatial":
+            f = rs.spatial_filter()
+            f.set_option(rs.option.filter_smooth_alpha, o["spatial_alpha"])
+            f.set_option(rs.option.filter_smooth_delta, o["spatial_delta"])
+        elif name == "temporal":
+            f = rs.temporal_filter()
+            f.set_option(rs.option.filter_smooth_alpha, o["temporal_alpha"])
+            f.set_option(rs.option.filter_smooth_delta, o["temporal_delta"])
+        else:  # hole_filling
+            f = rs.hole_filling_filter(o["hole_filling"])
+        return f
+
+    def __bool__(self) -> bool:
+        return bool(self._filters)
+
+    def process(self, frames):
+        """frameset -> frameset đã lọc depth. Filter lỗi thì bỏ qua filter đó cho frame này."""
+        for name, flt in self._filters:
+            t0 = time.perf_counter()
+            try:
+                out = flt.process(frames)
+                frames = out.as_frameset() if out.is_frameset() else out
+            except Exception as e:
+                self.errors += 1
+                if self.errors == 1:
+                    log.warning("Depth filter %s lỗi: %s", name, e)
+                continue
+            ms = (time.perf_counter() - t0) * 1000.0
+            st = self._stats[name]
+            st["calls"] += 1
+            st["ms_last"] = ms
+            st["ms_avg"] = ms if st["ms_avg"] == 0.0 else 0.9 * st["ms_avg"] + 0.1 * ms
+            st["ms_max"] = max(st["ms_max"], ms)
+        return frames
+
+    def stats(self) -> Dict[str, Any]:
+        per = {n: {k: (round(v, 3) if k != "calls" else int(v)) for k, v in st.items()}
+               for n, st in self._stats.items()}
+        return {
+            "chain": [n for n, _ in self._filters],
+            "total_ms_avg": round(sum(st["ms_avg"] for st in self._stats.values()), 3),
+            "errors": self.errors,
+            "filters": per,
+        }
@@ -0,0 +1,210 @@
+# app/hardware/shm_ring.py
+from __future__ import annotations
+
+import logging
+import time
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+log = logging.getLogger("vision.shmring")
+
+# Layout 1 segment shared memory:
+#   [0:64)                header int64[8] = magic, n_slots, h, w, c, dtype_char, write_seq, reserved
+#   [64 : 64+16*n)        slot_seq int64[n] | slot_ts float64[n]
+#   [data_off : ...)      n_slots * frame_nbytes (mỗi slot căn 64 byte)
+_MAGIC = 0x56495352494E47  # "VISRING"
+_HDR_BYTES = 64
+_ALIGN = 64
+_WRITING = -1
+_CREATED_HERE: set = set()  # tên segment do process này tạo (đã được tracker của chính nó quản lý)
+
+
+def _align(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class ShmFrameRing:
+    """
+    Ring buffer frame trên multiprocessing.shared_memory, slot cố định.
+    - Capture side (1 writer) ghi mỗi frame ĐÚNG 1 lần vào slot seq % n_slots.
+    - Process engine attach theo tên và đọc view numpy zero-copy qua ShmRingReader.
+    Seqlock theo slot: slot_seq = -1 trong lúc ghi, = seq khi xong. Reader kiểm tra
+    lại seq sau khi dùng view (is_valid) để biết slot có bị ghi đè giữa chừng không.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        hdr = np.ndarray((8,), dtype=np.int64, buffer=shm.buf, offset=0)
+        if int(hdr[0]) != _MAGIC:
+            raise ValueError(f"shared memory {shm.name!r} không phải ShmFrameRing")
+        self._hdr = hdr
+        self.n_slots = int(hdr[1])
+        self.shape: Tuple[int, ...] = tuple(int(x) for x in hdr[2:5] if int(x) > 0)
+        self.dtype = np.dtype(chr(int(hdr[5])))
+        self.frame_nbytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.slot_stride = _align(self.frame_nbytes)
+        n = self.n_slots
+        self.slot_seq = np.ndarray((n,), dtype=np.int64, buffer=shm.buf, offset=_HDR_BYTES)
+        self.slot_ts = np.ndarray((n,), dtype=np.float64, buffer=shm.buf, offset=_HDR_BYTES + 8 * n)
+        self.data_off = _align(_HDR_BYTES + 16 * n)
+        self._slots = [
+            np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf, offset=self.data_off + i * self.slot_stride)
+            for i in range(n)
+        ]
+
+    # ---------- tạo / attach ----------
+    @classmethod
+    def create(cls, shape: Tuple[int, ...], dtype=np.uint8, slots: int = 8,
+               name: Optional[str] = None) -> "ShmFrameRing":
+        dt = np.dtype(dtype)
+        shape = tuple(int(s) for s in shape)
+        if not 2 <= len(shape) <= 3:
+            raise ValueError(f"shape frame phải là (h,w) hoặc (h,w,c), nhận {shape}")
+        n = max(2, int(slots))
+        frame_nbytes = int(np.prod(shape)) * dt.itemsize
+        size = _align(_HDR_BYTES + 16 * n) + n * _align(frame_nbytes)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        hdr = np.ndarray((8,), dtype=np.int64, buffer=shm.buf, offset=0)
+        hdr[:] = 0
+        hdr[1] = n
+        hdr[2:2 + len(shape)] = shape
+        hdr[5] = ord(dt.char)
+        np.ndarray((n,), dtype=np.int64, buffer=shm.buf, offset=_HDR_BYTES)[:] = 0
+        _CREATED_HERE.add(shm.name)
+        hdr[0] = _MAGIC  # ghi magic sau cùng -> reader attach sớm sẽ báo lỗi thay vì đọc header dở
+        log.info("ShmFrameRing created name=%s shape=%s dtype=%s slots=%d (%.1f MB)",
+                 shm.name, shape, dt, n, size / 1e6)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "ShmFrameRing":
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=False, track=False)  # Python >= 3.13
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name, create=False)
+            import multiprocessing
+            if multiprocessing.parent_process() is None and name not in _CREATED_HERE:
+                # process độc lập có resource_tracker riêng -> nó sẽ unlink segment khi thoát; bỏ đăng ký
+                # (process con spawn từ writer dùng chung tracker với writer nên giữ nguyên)
+                try:
+                    from multiprocessing import resource_tracker
+                    resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+                except Exception:
+                    pass
+        return cls(shm, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def write_seq(self) -> int:
+        return int(self._hdr[6])
+
+    # ---------- writer ----------
+    def write(self, frame: np.ndarray, ts: Optional[float] = None) -> int:
+        """Ghi 1 frame (copy 1 lần vào slot). Trả về seq (bắt đầu từ 1)."""
+        if frame.shape != self.shape:
+            raise ValueError(f"frame shape {frame.shape} khác ring {self.shape}")
+        seq = self.write_seq + 1
+        i = seq % self.n_slots
+        self.slot_seq[i] = _WRITING
+        np.copyto(self._slots[i], frame, casting="unsafe")
+        self.slot_ts[i] = time.monotonic() if ts is None else float(ts)
+        self.slot_seq[i] = seq
+        self._hdr[6] = seq
+        return seq
+
+    # ---------- reader primitives ----------
+    def slot_of(self, seq: int) -> int:
+        return seq % self.n_slots
+
+    def view(self, seq: int) -> Optional[Tuple[np.ndarray, float]]:
+        """View zero-copy của frame `seq` nếu slot còn giữ đúng seq đó."""
+        i = seq % self.n_slots
+        if int(self.slot_seq[i]) != seq:
+            return None
+        ts = float(self.slot_ts[i])
+        return self._slots[i], ts
+
+    def is_valid(self, seq: int) -> bool:
+        """Gọi SAU khi dùng xong view: False nghĩa là writer đã ghi đè slot giữa chừng."""
+        return int(self.slot_seq[seq % self.n_slots]) == seq
+
+    def close(self) -> None:
+        self._slots = []
+        self.slot_seq = self.slot_ts = self._hdr = None  # nhả export buffer trước khi close
+        try:
+            self.shm.close()
+        except Exception:
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except Exception:
+                pass
+
+
+class ShmRingReader:
+    """
+    Cursor đọc riêng cho 1 process engine.
+    - read_latest(): frame mới nhất chưa đọc (bỏ qua frame trung gian).
+    - read_next(): frame kế tiếp theo thứ tự; nếu bị writer vượt vòng thì nhảy tới
+      frame cũ nhất còn trong ring và đếm overruns.
+    """
+
+    def __init__(self, ring: ShmFrameRing, copy: bool = False):
+        self.ring = ring
+        self.copy = bool(copy)
+        self.cursor = 0
+        self.overruns = 0
+        self.torn = 0
+
+    def _take(self, seq: int) -> Optional[Tuple[np.ndarray, int, float]]:
+        got = self.ring.view(seq)
+        if got is None:
+            self.torn += 1
+            return None
+        frame, ts = got
+        if self.copy:
+            frame = frame.copy()
+            if not self.ring.is_valid(seq):
+                self.torn += 1
+                return None
+        self.cursor = seq
+        return frame, seq, ts
+
+    def read_latest(self) -> Optional[Tuple[np.ndarray, int, float]]:
+        seq = self.ring.write_seq
+        if seq <= self.cursor:
+            return None
+        return self._take(seq)
+
+    def read_next(self) -> Optional[Tuple[np.ndarray, int, float]]:
+        head = self.ring.write_seq
+        if head <= self.cursor:
+            return None
+        nxt = self.cursor + 1
+        oldest = max(1, head - self.ring.n_slots + 2)  # chừa 1 slot writer có thể đang ghi
+        if nxt < oldest:
+            self.overruns += oldest - nxt
+            nxt = oldest
+        return self._take(nxt)
+
+    def wait(self, timeout: float = 0.1, latest: bool = True,
+             poll_s: float = 0.001) -> Optional[Tuple[np.ndarray, int, float]]:
+        """Chờ frame mới tối đa `timeout` giây (poll nhẹ, không cần IPC event)."""
+        end = time.monotonic() + timeout
+        fn = self.read_latest if latest else self.read_next
+        while True:
+            got = fn()
+            if got is not None or time.monotonic() >= end:
+                return got
+            time.sleep(poll_s)
+
+    def stats(self) -> dict:
+        return {"cursor": self.cursor, "head": self.ring.write_seq,
+                "overruns": self.overruns, "torn": self.torn}
@@ -0,0 +1,296 @@
+# app/hardware/synthetic.py
+from __future__ import annotations
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from app.hardware.frame import FrameBundle
+
+log = logging.getLogger("vision.synthetic")
+
+
+@dataclass
+class SyntheticTag:
+    """AprilTag đặt cố định: tâm (cx, cy) px, cạnh size_px (gồm viền trắng), xoay roll_deg trong mặt ảnh."""
+    tag_id: int
+    cx: float
+    cy: float
+    size_px: int = 120
+    roll_deg: float = 0.0
+
+
+@dataclass
+class _Obj:
+    id: int
+    x: float            # tâm
+    y: float
+    w: float
+    h: float
+    vx: float           # px/s
+    vy: float
+    color: Tuple[int, int, int]
+    side: str = "unknown"
+
+
+def _is_inside(side: str, camera_side: str) -> bool:
+    # cùng quy ước với CounterService: camera_side='left' -> phía "trong" là bên phải line
+    return side == ("right" if camera_side == "left" else "left")
+
+
+class SyntheticCamera:
+    """
+    Camera giả lập cho load test counter / tag, cùng contract get_frames()/read()/get_bundle().
+    Vẽ n_objects hình chữ nhật hoặc silhouette chạy ngang qua line đếm (line_x_ratio) ở
+    mọi độ phân giải / fps, ghi ground-truth IN/OUT theo quy ước camera_side của counter,
+    và dán AprilTag (cv2.aruco DICT_APRILTAG_36h11) tại các pose biết trước.
+    Thời gian mô phỏng = seq / fps (tất định theo seed); realtime=False chạy nhanh nhất có thể.
+    """
+    kind: str = "2D"
+
+    def __init__(self, width: int = 640, height: int = 480, fps: int = 30, *,
+                 n_objects: int = 5, line_x_ratio: float = 0.5, camera_side: str = "left",
+                 shape: str = "rect", speed_px_s: Tuple[float, float] = (80.0, 240.0),
+                 size_ratio: Tuple[float, float] = (0.25, 0.6),
+                 tags: Sequence[Any] = (), tags_on_top: bool = True,
+                 realtime: bool = True, noise: float = 0.0, seed: int = 0):
+        self.device = f"synthetic:{width}x{height}@{fps}:n{n_objects}"
+        self.width = int(width)
+        self.height = int(height)
+        self.fps = int(fps)
+        self.n_objects = int(n_objects)
+        self.line_x_ratio = float(line_x_ratio)
+        self.camera_side = str(camera_side).lower()
+        self.shape = shape
+        self.speed_px_s = speed_px_s
+        self.size_ratio = size_ratio
+        self.realtime = bool(realtime)
+        self.noise = float(noise)
+        self._rng = np.random.default_rng(seed)
+        self.tags: List[SyntheticTag] = [t if isinstance(t, SyntheticTag) else SyntheticTag(**t) for t in tags]
+        self._tag_imgs: List[Tuple[SyntheticTag, np.ndarray, np.ndarray]] = []
+        self.tags_on_top = bool(tags_on_top)   # False: object có thể che tag
+
+        self._bg: Optional[np.ndarray] = None
+        self._objs: List[_Obj] = []
+        self._next_id = 1
+        self._opened = False
+        self._lock = threading.Lock()
+        self._clock0: Optional[float] = None
+        self.seq = 0
+        self.last_seq = 0
+        self.last_capture_ts: float = 0.0
+        self.total_in = 0
+        self.total_out = 0
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=10000)
+        self.render_ms_avg = 0.0
+
+    # ---------- dựng scene ----------
+    def open(self):
+        with self._lock:
+            if self._opened:
+                return
+            h, w = self.height, self.width
+            gy = np.linspace(60, 140, h, dtype=np.float32)[:, None]
+            gx = np.linspace(0, 30, w, dtype=np.float32)[None, :]
+            self._bg = np.repeat((gy + gx).astype(np.uint8)[:, :, None], 3, axis=2)
+            self._tag_imgs = [self._render_tag(t) for t in self.tags]
+            if not self.tags_on_top:
+                for (t, img, mask) in self._tag_imgs:
+                    self._paste(self._bg, img, mask, t)
+            self._objs = [self._spawn(initial=True) for _ in range(self.n_objects)]
+            self._opened = True
+
+    def is_opened(self) -> bool:
+        return self._opened
+
+    def _spawn(self, initial: bool = False) -> _Obj:
+        r = self._rng
+        h = float(r.uniform(*self.size_ratio)) * self.height
+        w = h * (0.45 if self.shape == "silhouette" else float(r.uniform(0.4, 0.8)))
+        speed = float(r.uniform(*self.speed_px_s))
+        left_to_right = bool(r.integers(0, 2))
+        if initial:
+            x = float(r.uniform(0, self.width))   # rải sẵn trong khung để có tải ngay frame đầu
+        else:
+            x = -w / 2 - 1 if left_to_right else self.width + w / 2 + 1
+        y = float(r.uniform(h / 2, max(h / 2 + 1, self.height - h / 2)))
+        color = tuple(int(c) for c in r.integers(150, 256, 3))
+        o = _Obj(self._next_id, x, y, w, h, speed if left_to_right else -speed,
+                 float(r.uniform(-0.05, 0.05)) * speed, color)
+        self._next_id += 1
+        return o
+
+    def _render_tag(self, t: SyntheticTag) -> Tuple[SyntheticTag, np.ndarray, np.ndarray]:
+        d = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_APRILTAG_36h11)
+        inner = max(10, int(t.size_px * 0.8))
+        if hasattr(cv2.aruco, "generateImageMarker"):
+            m = cv2.aruco.generateImageMarker(d, int(t.tag_id), inner)
+        else:  # OpenCV < 4.7
+            m = cv2.aruco.drawMarker(d, int(t.tag_id), inner)
+        pad = (int(t.size_px) - inner) // 2
+        m = cv2.copyMakeBorder(m, pad, pad, pad, pad, cv2.BORDER_CONSTANT, value=255)
+        s = m.shape[0]
+        diag = int(math.ceil(s * math.sqrt(2))) + 2
+        M = cv2.getRotationMatrix2D((s / 2, s / 2), t.roll_deg, 1.0)
+        M[:, 2] += (diag - s) / 2
+        img = cv2.warpAffine(m, M, (diag, diag), flags=cv2.INTER_LINEAR, borderValue=0)
+        mask = cv2.warpAffine(np.full_like(m, 255), M, (diag, diag), flags=cv2.INTER_NEAREST, borderValue=0)
+        return t, cv2.cvtColor(img, cv2.COLOR_GRAY2BGR), mask
+
+    @staticmethod
+    def _paste(dst: np.ndarray, img: np.ndarray, mask: np.ndarray, t: SyntheticTag) -> None:
+        s = img.shape[0]
+        x0, y0 = int(round(t.cx - s / 2)), int(round(t.cy - s / 2))
+        H, W = dst.shape[:2]
+        dx0, dy0, dx1, dy1 = max(0, x0), max(0, y0), min(W, x0 + s), min(H, y0 + s)
+        if dx1 <= dx0 or dy1 <= dy0:
+            return
+        sub = (slice(dy0 - y0, dy1 - y0), slice(dx0 - x0, dx1 - x0))
+        roi = dst[dy0:dy1, dx0:dx1]
+        np.copyto(roi, img[sub], where=mask[sub][:, :, None] > 0)
+
+    def _draw(self, frame: np.ndarray, o: _Obj) -> None:
+        x1, y1 = int(o.x - o.w / 2), int(o.y - o.h / 2)
+        x2, y2 = int(o.x + o.w / 2), int(o.y + o.h / 2)
+        if self.shape == "silhouette":
+            hr = max(2, int(o.w * 0.35))
+            cv2.circle(frame, (int(o.x), y1 + hr), hr, o.color, -1)
+            cv2.rectangle(frame, (x1, y1 + 2 * hr), (x2, y2), o.color, -1)
+        else:
+            cv2.rectangle(frame, (x1, y1), (x2, y2), o.color, -1)
+
+    # ---------- mô phỏng ----------
+    def _advance(self, dt: float, t_sim: float) -> None:
+        line_x = self.width * self.line_x_ratio
+        for i, o in enumerate(self._objs):
+            o.x += o.vx * dt
+            o.y = float(np.clip(o.y + o.vy * dt, o.h / 2, self.height - o.h / 2))
+            side = "left" if o.x < line_x else "right"
+            if o.side != "unknown" and side != o.side:
+                action = "IN" if _is_inside(side, self.camera_side) else "OUT"
+                if action == "IN":
+                    self.total_in += 1
+                else:
+                    self.total_out += 1
+                self.events.append({"seq": self.seq, "t": round(t_sim, 4), "obj": o.id, "action": action})
+            o.side = side
+            if o.x < -o.w or o.x > self.width + o.w:
+                self._objs[i] = self._spawn()
+
+    def _render(self) -> np.ndarray:
+        t0 = time.perf_counter()
+        frame = self._bg.copy()
+        for o in self._objs:
+            self._draw(frame, o)
+        if self.tags_on_top:
+            for (t, img, mask) in self._tag_imgs:
+                self._paste(frame, img, mask, t)
+        if self.noise > 0:
+            n = self._rng.normal(0.0, self.noise, frame.shape).astype(np.int16)
+            frame = np.clip(frame.astype(np.int16) + n, 0, 255).astype(np.uint8)
+        ms = (time.perf_counter() - t0) * 1000.0
+        self.render_ms_avg = ms if self.render_ms_avg == 0.0 else 0.9 * self.render_ms_avg + 0.1 * ms
+        return frame
+
+    def get_frames(self, wait: Optional[bool] = None,
+                   timeout: Optional[float] = None) -> Tuple[Optional[np.ndarray], None]:
+        if not self._opened:
+            self.open()
+        with self._lock:
+            if self.realtime:
+                now = time.monotonic()
+                if self._clock0 is None:
+                    self._clock0 = now
+                due = self._clock0 + self.seq / float(self.fps)
+                if due > now:
+                    time.sleep(due - now)
+            if self.seq > 0:
+                self._advance(1.0 / self.fps, self.seq / float(self.fps))
+            frame = self._render()
+            self.seq += 1
+            self.last_seq = self.seq
+            self.last_capture_ts = time.monotonic()
+            return frame, None
+
+    read = get_frames
+
+    def get_bundle(self, wait: Optional[bool] = None, timeout: Optional[float] = None) -> Optional[FrameBundle]:
+        frame, _ = self.get_frames(wait=wait, timeout=timeout)
+        if frame is None:
+            return None
+        return FrameBundle(frame, capture_ts=self.last_capture_ts, seq=self.last_seq)
+
+    # ---------- ground truth ----------
+    def boxes(self) -> List[Tuple[int, int, int, int]]:
+        """Box (x1,y1,x2,y2) đang thấy trong frame vừa phát — dùng thay detector khi đo tracker."""
+        out = []
+        for o in self._objs:
+            x1, y1 = max(0, int(o.x - o.w / 2)), max(0, int(o.y - o.h / 2))
+            x2, y2 = min(self.width, int(o.x + o.w / 2)), min(self.height, int(o.y + o.h / 2))
+            if x2 > x1 and y2 > y1:
+                out.append((x1, y1, x2, y2))
+        return out
+
+    def ground_truth(self) -> Dict[str, Any]:
+        return {"IN": self.total_in, "OUT": self.total_out, "frames": self.seq,
+                "tags": [{"id": t.tag_id, "center": (t.cx, t.cy), "size_px": t.size_px,
+                          "roll_deg": t.roll_deg} for t in self.tags]}
+
+    def drain_events(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            ev = list(self.events)
+            self.events.clear()
+            return ev
+
+    def stats(self) -> dict:
+        return {"source": "synthetic", "resolution": f"{self.width}x{self.height}", "fps": self.fps,
+                "objects": self.n_objects, "tags": len(self.tags), "last_seq": self.last_seq,
+                "render_ms_avg": round(self.render_ms_avg, 3), "gt_in": self.total_in, "gt_out": self.total_out}
+
+    def check_connectivity(self, timeout_s: float = 1.5) -> Tuple[bool, str]:
+        self.open()
+        return True, f"ĐÃ KẾT NỐI camera giả lập ({self.width}x{self.height}@{self.fps}fps, {self.n_objects} objects)"
+
+    def stop(self):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._opened = False
+            self._clock0 = None
+
+
+def sweep_tracker(objects: Sequence[int] = (1, 10, 50, 100, 200),
+                  resolutions: Sequence[Tuple[int, int]] = ((480, 320), (1280, 720), (1920, 1080)),
+                  frames: int = 300) -> List[Dict[str, Any]]:
+    """Đo CentroidTracker.update theo số object x độ phân giải, box lấy từ ground truth."""
+    from app.services.counter_service import CentroidTracker
+    rows = []
+    for (w, h) in resolutions:
+        for n in objects:
+            cam = SyntheticCamera(w, h, 30, n_objects=n, realtime=False)
+            tr = CentroidTracker()
+            cost = 0.0
+            for _ in range(frames):
+                cam.get_frames()
+                boxes = cam.boxes()
+                t0 = time.perf_counter()
+                tr.update(boxes)
+                cost += time.perf_counter() - t0
+            rows.append({"resolution": f"{w}x{h}", "objects": n,
+                         "update_ms": round(cost / frames * 1000.0, 4),
+                         "render_ms": round(cam.render_ms_avg, 3)})
+    return rows
+
+
+if __name__ == "__main__":
+    for row in sweep_tracker():
+        print(row)
@@ -0,0 +1,251 @@
+# app/hardware/watchdog.py
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.hardware.frame import FrameBundle
+from app.hardware.frame_bus import device_key
+
+log = logging.getLogger("vision.watchdog")
+
+STATE_OK = "ok"
+STATE_ERROR = "device_error"
+STATE_RECOVERED = "recovered"
+
+
+class WatchedCamera:
+    """
+    Watchdog bọc 1 camera (OpenCVCamera / RealSenseCamera), cùng contract camera.
+    - Stall: không có frame lâu hơn max(min_stall_s, stall_factor * p95 khoảng cách frame)
+      (trước frame đầu tiên dùng open_grace_s).
+    - Khi stall: báo on_state("device_error"), close()+open() THIẾT BỊ tại chỗ với backoff
+      mũ (backoff_s -> backoff_max_s); engine/model của service vẫn giữ nguyên.
+    - Có frame trở lại: on_state("recovered") kèm thời gian gián đoạn.
+    - Exception từ camera (vd wait_for_frames) bị nuốt, coi như không có frame.
+    """
+
+    def __init__(self, camera, name: str = "", *, min_stall_s: float = 1.0, stall_factor: float = 10.0,
+                 open_grace_s: float = 3.0, backoff_s: float = 0.5, backoff_max_s: float = 10.0,
+                 on_state: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        self._camera = camera
+        self.name = name or str(getattr(camera, "device", type(camera).__name__))
+        self.min_stall_s = float(min_stall_s)
+        self.stall_factor = float(stall_factor)
+        self.open_grace_s = float(open_grace_s)
+        self.backoff_s = float(backoff_s)
+        self.backoff_max_s = float(backoff_max_s)
+        self.on_state = on_state
+        self._lock = threading.Lock()
+        self._intervals: Deque[float] = deque(maxlen=120)
+        self._last_frame_ts = 0.0
+        self._opened_at = time.monotonic()
+        self._error_since = 0.0
+        self._next_attempt = 0.0
+        self._backoff = self.backoff_s
+        self.state = STATE_OK
+        self.stalls = 0
+        self.reopens = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.last_downtime_s = 0.0
+        self._err_logged = False
+        self._owners: Optional[Callable[[], List[str]]] = None
+
+    def __getattr__(self, name: str):
+        return getattr(self._camera, name)
+
+    @property
+    def camera(self):
+        return self._camera
+
+    # ---------- ai đang dùng ----------
+    def bind_owners(self, fn: Optional[Callable[[], List[str]]]) -> None:
+        """Lease manager / frame bus đang giữ camera gắn hàm trả method hiện tại (owner / subscribers)."""
+        self._owners = fn
+
+    def owners(self) -> List[str]:
+        fn = self._owners
+        if fn is None:
+            return []
+        try:
+            return [str(m) for m in fn() if m]
+        except Exception:
+            return []
+
+    # ---------- ngưỡng ----------
+    def stall_threshold(self) -> float:
+        if len(self._intervals) >= 10:
+            p95 = float(np.percentile(np.fromiter(self._intervals, dtype=np.float64), 95))
+            return max(self.min_stall_s, self.stall_factor * p95)
+        return self.min_stall_s
+
+    # ---------- state ----------
+    def _emit(self, state: str, **info: Any) -> None:
+        info.setdefault("device", self.name)
+        if state == STATE_ERROR:
+            log.warning("Camera %s: %s %s", self.name, state, info)
+        else:
+            log.info("Camera %s: %s %s", self.name, state, info)
+        cb = self.on_state
+        if cb is not None:
+            try:
+                cb(state, info)
+            except Exception as e:
+                log.warning("watchdog on_state error: %s", e)
+
+    def _on_frame(self, now: float) -> None:
+        recovered = None
+        with self._lock:
+            if self._last_frame_ts and self.state == STATE_OK:
+                self._intervals.append(now - self._last_frame_ts)   # bỏ khoảng gián đoạn khỏi phân bố
+            self._last_frame_ts = now
+            self._err_logged = False
+            if self.state != STATE_OK:
+                self.state = STATE_OK
+                self.last_downtime_s = now - self._error_since
+                self._backoff = self.backoff_s
+                recovered = self.last_downtime_s
+        if recovered is not None:
+            self._emit(STATE_RECOVERED, downtime_s=round(recovered, 3), reopens=self.reopens)
+
+    def _on_miss(self, now: float) -> None:
+        stalled = None
+        with self._lock:
+            if self.state == STATE_OK:
+                ref = self._last_frame_ts or self._opened_at
+                thr = self.stall_threshold() if self._last_frame_ts else max(self.stall_threshold(), self.open_grace_s)
+                if now - ref > thr:
+                    self.state = STATE_ERROR
+                    self.stalls += 1
+                    self._error_since = ref
+                    self._next_attempt = now
+                    stalled = (now - ref, thr)
+        if stalled is not None:
+            self._emit(STATE_ERROR, silent_s=round(stalled[0], 3), threshold_s=round(stalled[1], 3),
+                       error=self.last_error)
+        elif self.state == STATE_ERROR:
+            time.sleep(0.02)   # đang lỗi: tránh loop service spin
+
+    def _maybe_reopen(self, now: float) -> None:
+        with self._lock:
+            if self.state != STATE_ERROR or now < self._next_attempt:
+                return
+            self._next_attempt = now + self._backoff
+            backoff = self._backoff
+            self._backoff = min(self._backoff * 2.0, self.backoff_max_s)
+            self.reopens += 1
+        log.info("Camera %s: reopen #%d (backoff kế tiếp %.1fs)", self.name, self.reopens, backoff)
+        try:
+            self._camera.close()
+        except Exception as e:
+            log.warning("Camera %s close lỗi: %s", self.name, e)
+        try:
+            self._camera.open()
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            log.warning("Camera %s open lỗi: %s", self.name, e)
+        self._opened_at = time.monotonic()
+
+    def _call(self, fn: Callable, *a, **kw):
+        self._maybe_reopen(time.monotonic())
+        try:
+            return fn(*a, **kw)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            if not self._err_logged:
+                self._err_logged = True   # log 1 lần cho mỗi đợt lỗi
+                log.warning("Camera %s read lỗi: %s", self.name, e)
+            return None
+
+    # ---------- contract camera ----------
+    def open(self):
+        self._opened_at = time.monotonic()
+        return self._camera.open()
+
+    def get_frames(self, wait: Optional[bool] = None, timeout: Optional[float] = None) -> Tuple[Any, Any]:
+        got = self._call(self._camera.get_frames, wait=wait, timeout=timeout)
+        if got is None or got[0] is None:
+            self._on_miss(time.monotonic())
+            return None, None
+        self._on_frame(time.monotonic())
+        return got
+
+    read = get_frames
+
+    def get_bundle(self, wait: Optional[bool] = None, timeout: Optional[float] = None) -> Optional[FrameBundle]:
+        fn = getattr(self._camera, "get_bundle", None)
+        if fn is None:
+            color, depth = self.get_frames(wait=wait, timeout=timeout)
+            return FrameBundle(color, depth) if color is not None else None
+        fb = self._call(fn, wait=wait, timeout=timeout)
+        if fb is None:
+            self._on_miss(time.monotonic())
+            return None
+        self._on_frame(time.monotonic())
+        return fb
+
+    def watchdog_stats(self) -> Dict[str, Any]:
+        iv = np.fromiter(self._intervals, dtype=np.float64) if self._intervals else None
+        return {
+            "state": self.state,
+            "stalls": self.stalls,
+            "reopens": self.reopens,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_downtime_s": round(self.last_downtime_s, 3),
+            "stall_threshold_s": round(self.stall_threshold(), 3),
+            "interval_p50_ms": round(float(np.percentile(iv, 50)) * 1000.0, 2) if iv is not None else None,
+            "interval_p95_ms": round(float(np.percentile(iv, 95)) * 1000.0, 2) if iv is not None else None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        fn = getattr(self._camera, "stats", None)
+        st = dict(fn()) if callable(fn) else {}
+        st["watchdog"] = self.watchdog_stats()
+        return st
+
+    def stop(self):
+        self.close()
+
+    def close(self):
+        self._camera.close()
+        with self._lock:
+            self.state = STATE_OK
+            self._last_frame_ts = 0.0
+            self._intervals.clear()
+
+
+def watch_camera(camera, method: str):
+    """
+    Bọc camera bằng WatchedCamera theo settings (CAMERA_WATCHDOG*); trạng thái
+    device_error / recovered được publish lên MQTT dạng {"type":"state", ...} cho method
+    đang dùng thiết bị lúc đó (owner lease / subscriber frame bus), mặc định `method`.
+    Nguồn file / replay / giả lập không bọc (hết file không phải lỗi thiết bị).
+    """
+    from app.configs.settings import settings
+    if not getattr(settings, "CAMERA_WATCHDOG", True) or getattr(camera, "is_file_source", False):
+        return camera
+
+    def _publish(state: str, info: Dict[str, Any]) -> None:
+        from app.mqtt.client import mqtt_bus
+        for m in watched.owners() or [method]:
+            mqtt_bus.publish_result({"type": "state", "payload": {"method": m, "data": {"state": state, **info}}},
+                                    qos=1, retain=False)
+
+    watched = WatchedCamera(
+        camera, device_key(getattr(camera, "device", type(camera).__name__)),
+        min_stall_s=float(getattr(settings, "CAMERA_STALL_MIN_S", 1.0)),
+        stall_factor=float(getattr(settings, "CAMERA_STALL_FACTOR", 10.0)),
+        backoff_s=float(getattr(settings, "CAMERA_REOPEN_BACKOFF_S", 0.5)),
+        backoff_max_s=float(getattr(settings, "CAMERA_REOPEN_BACKOFF_MAX_S", 10.0)),
+        on_state=_publish,
+    )
+    return watched
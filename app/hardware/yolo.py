@@ -1,9 +1,17 @@
-from ultralytics import YOLO
-
 class YoloModel:
-    def __init__(self, model_path: str, device: str = "auto", conf: float = 0.35):
+    """
+    backend="torch": ultralytics YOLO; backend="onnx" (hoặc model_path *.onnx): ONNX Runtime CPU
+    (app.hardware.detector.OnnxDetector) - không import torch/ultralytics.
+    """
+    def __init__(self, model_path: str, device: str = "auto", conf: float = 0.35, backend: str = "torch"):
         self.model_path = model_path
         self.conf = conf
+        self.backend = "onnx" if (backend == "onnx" or str(model_path).endswith(".onnx")) else "torch"
+        if self.backend == "onnx":
+            from app.hardware.detector import OnnxDetector
+            self.device = "cpu"
+            self.model = OnnxDetector(self.model_path, conf=conf)
+            return
         if device == "auto":
             try:
                 import torch
@@ -12,7 +20,20 @@ class YoloModel:
                 self.device = "cpu"
         else:
             self.device = device
+        from ultralytics import YOLO
         self.model = YOLO(self.model_path)
 
     def detect_person(self, frame):
+        if self.backend == "onnx":
+            return self.model.detect_person(frame)
         return self.model(frame, conf=self.conf, device=self.device, verbose=False, classes=[0])[0]
+
+    def detect_persons(self, frames, imgsz=None):
+        """
+        Batch nhiều frame (vd nhiều camera cửa) trong 1 lần forward; trả 1 Results / frame.
+        imgsz: kích thước inference (vd crop ROI nhỏ hơn 640), None = mặc định của model.
+        """
+        if self.backend == "onnx":
+            return self.model.detect_persons(frames, imgsz=imgsz)
+        kw = {} if imgsz is None else {"imgsz": int(imgsz)}
+        return self.model(list(frames), conf=self.conf, device=self.device, verbose=False, classes=[0], **kw)
@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from app.core.lifecycle import register_lifecycle
 from app.controllers.counter_controller import router as counter_router
+from app.controllers.health_controller import router as health_router
 from app.utils.logging import configure_logging
 
 # Khởi tạo logging ngay khi import
@@ -11,6 +12,7 @@ def create_app():
     app = FastAPI(title="Vision Counter Service", version="1.0.0")
     register_lifecycle(app)
     app.include_router(counter_router)
+    app.include_router(health_router)
     return app
 
 app = create_app()
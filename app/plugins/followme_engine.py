@@ -4,39 +4,50 @@ from typing import Optional, Dict, Any, Tuple, List
 
 import numpy as np
 import cv2
-from ultralytics import YOLO
 from insightface.app import FaceAnalysis
 
+from app.core.model_registry import model_registry, BACKEND_INSIGHTFACE, BACKEND_MP_HANDS
+from app.core.inference_server import acquire_detector
+from app.hardware.depth import as_depth
+from app.hardware.frame import FrameBundle, as_bundle
+from app.utils.buffer_pool import BufferPool
+
 log = logging.getLogger("vision.followme.engine")
 
 # ---------- helpers ----------
 def _median_distance(depth_frame, box: Tuple[int,int,int,int]) -> float:
-    if depth_frame is None or not hasattr(depth_frame, "get_distance"):
+    df = as_depth(depth_frame)
+    if df is None:
         return 0.0
     x1,y1,x2,y2 = box
     cx, cy = (x1+x2)//2, (y1+y2)//2
     roi = max(2, min(x2-x1, y2-y1)//4)
-    vals = []
-    for dx in range(-roi, roi, 5):
-        for dy in range(-roi, roi, 5):
-            px, py = cx+dx, cy+dy
-            try:
-                d = depth_frame.get_distance(int(px), int(py))
-            except Exception:
-                d = 0.0
-            if 0.25 < d < 6.0:
-                vals.append(d)
-    return float(np.median(vals)) if vals else 0.0
-
-def _face_embed(face_app: FaceAnalysis, color_bgr: np.ndarray, person_box: Tuple[int,int,int,int]) -> Optional[np.ndarray]:
+    # 1 phép mảng trên ô trung tâm box thay cho vòng get_distance từng pixel
+    return df.median((cx-roi, cy-roi, cx+roi, cy+roi), lo=0.25, hi=6.0)
+
+def _roi_rgb(fb: FrameBundle, pool: BufferPool, tag: str,
+             y0: int, y1: int, x0: int, x1: int) -> Optional[np.ndarray]:
+    """ROI dạng RGB contiguous trong buffer dùng lại; copy từ view RGB của bundle nếu đã có."""
+    roi_bgr = fb.bgr[y0:y1, x0:x1]
+    if roi_bgr.size == 0:
+        return None
+    dst = pool.get(tag, roi_bgr.shape)
+    full = fb.peek("rgb")
+    if full is not None:
+        np.copyto(dst, full[y0:y1, x0:x1])
+        return dst
+    return cv2.cvtColor(roi_bgr, cv2.COLOR_BGR2RGB, dst=dst)
+
+def _face_embed(face_app: FaceAnalysis, fb: FrameBundle, person_box: Tuple[int,int,int,int],
+                pool: BufferPool) -> Optional[np.ndarray]:
     x1,y1,x2,y2 = person_box
     box_h = max(1, y2-y1)
     y_top, y_mid = y1, y1 + int(box_h*0.5)
-    roi = color_bgr[max(0,y_top):max(0,min(color_bgr.shape[0],y_mid)),
-                    max(0,x1):max(0,min(color_bgr.shape[1],x2))]
-    if roi.size == 0:
+    h, w = fb.shape[:2]
+    roi = _roi_rgb(fb, pool, "face_roi", max(0,y_top), max(0,min(h,y_mid)), max(0,x1), max(0,min(w,x2)))
+    if roi is None:
         return None
-    faces = face_app.get(cv2.cvtColor(roi, cv2.COLOR_BGR2RGB))
+    faces = face_app.get(roi)
     if not faces:
         return None
     best = max(faces, key=lambda f: max(0,(f.bbox[2]-f.bbox[0]))*max(0,(f.bbox[3]-f.bbox[1])))
@@ -91,6 +102,8 @@ class FollowMeEngine:
         cfg = dict(config or {})
         self.yolo_weights = cfg.get("yolo_weights", os.getenv("YOLO_WEIGHTS","yolo11s.pt"))
         self.yolo_conf    = float(cfg.get("yolo_conf", 0.5))
+        self.yolo_device  = str(cfg.get("yolo_device", "auto"))
+        self.yolo_backend = str(cfg.get("yolo_backend", "yolo"))   # yolo (ultralytics) | onnx
         self.rec_range_m  = float(cfg.get("recognition_range_m", 2.5))
         self.face_thr     = float(cfg.get("face_distance_thr", 0.40))
 
@@ -100,20 +113,22 @@ class FollowMeEngine:
 
         self.auto_resume_on_reacquire = bool(cfg.get("auto_resume_on_reacquire", False))
 
-        # models
-        self.yolo = YOLO(self.yolo_weights)
-        self.face_app = FaceAnalysis(name="buffalo_s", allowed_modules=['detection','recognition'])
-        # Jetson thường dùng CPU provider; PC x86 có thể dùng CUDA nếu onnxruntime-gpu sẵn sàng.
+        # models: lấy từ registry (dùng chung với counter khi cùng weights, cache giữa các lần start)
+        # INFERENCE_SERVER=True: detect qua server dùng chung (micro-batch cùng counter)
+        self.yolo = self.face_app = self.hands = None
         try:
-            self.face_app.prepare(ctx_id=-1, det_size=(640,640))
+            self.yolo = acquire_detector(self.yolo_weights, device=self.yolo_device,
+                                         backend=self.yolo_backend, owner="follow_me", conf=self.yolo_conf)
+            # Jetson thường dùng CPU provider (ctx_id=-1); PC x86 có thể dùng CUDA nếu onnxruntime-gpu sẵn sàng.
+            self.face_app = model_registry.acquire("buffalo_s", device="cpu", backend=BACKEND_INSIGHTFACE,
+                                                   owner="follow_me")
+            if _MP_OK:
+                self.hands = model_registry.acquire("hands", device="cpu", backend=BACKEND_MP_HANDS,
+                                                    owner="follow_me")
+                log.info("MediaPipe Hands initialized")
         except Exception:
-            self.face_app.prepare(ctx_id=0, det_size=(640,640))
-        if _MP_OK:
-            self._mp_hands = mp.solutions.hands
-            self.hands = self._mp_hands.Hands(max_num_hands=2, min_detection_confidence=0.5)
-            log.info("MediaPipe Hands initialized")
-        else:
-            self.hands = None
+            self.close()   # trả các model đã lấy, không để rò refcount trong registry
+            raise
 
         # state
         self.target_embedding: Optional[np.ndarray] = None
@@ -126,25 +141,35 @@ class FollowMeEngine:
         self.follow_latch = _GestureLatch()
         self.pause_latch  = _GestureLatch()
 
+        # buffer dùng lại cho ROI RGB (hands / face) mỗi frame
+        self.pool = BufferPool("followme")
+
     # public status
     def status(self) -> Dict[str, Any]:
         return {
             "has_face_embedding": self.target_embedding is not None,
             "identity_ok": self.identity_ok,
             "following": self.following,
+            "buffers": self.pool.stats(),
         }
 
+    def close(self) -> None:
+        """Trả các model về registry (model vẫn được cache cho lần start sau)."""
+        for m in (self.yolo, self.face_app, self.hands):
+            release = getattr(m, "release", None)
+            if callable(release):
+                release()
+
     # helpers
-    def _roi_fingers(self, color_bgr: np.ndarray, box: Tuple[int,int,int,int]) -> Optional[int]:
+    def _roi_fingers(self, fb: FrameBundle, box: Tuple[int,int,int,int]) -> Optional[int]:
         if self.hands is None: return None
         x1,y1,x2,y2 = box
         h = max(1, y2-y1)
         y_top, y_40 = y1, y1 + int(h*0.4)
-        roi = color_bgr[max(0,y_top):min(color_bgr.shape[0],y_40),
-                        max(0,x1):min(color_bgr.shape[1],x2)]
-        if roi.size == 0:
+        fh, fw = fb.shape[:2]
+        rgb = _roi_rgb(fb, self.pool, "hands_roi", max(0,y_top), min(fh,y_40), max(0,x1), min(fw,x2))
+        if rgb is None:
             return None
-        rgb = cv2.cvtColor(roi, cv2.COLOR_BGR2RGB)
         try:
             res = self.hands.process(rgb)
         except Exception:
@@ -154,11 +179,15 @@ class FollowMeEngine:
         return _count_fingers_mp(res.multi_hand_landmarks[0])
 
     # main
-    def step(self, color_bgr: np.ndarray, depth_frame) -> List[Dict[str, Any]]:
+    def step(self, color_bgr, depth_frame) -> List[Dict[str, Any]]:
+        """color_bgr: np.ndarray BGR hoặc FrameBundle (view RGB dùng chung cho hands + face)."""
         events: List[Dict[str, Any]] = []
+        fb = as_bundle(color_bgr, depth_frame)
+        if fb is None:
+            return events
 
         # 1) detect persons
-        yolores = self.yolo.track(color_bgr, conf=self.yolo_conf, verbose=False, persist=True)
+        yolores = self.yolo.track(fb.bgr, conf=self.yolo_conf, verbose=False, persist=True)
         persons: List[dict] = []
         for r in yolores:
             for box in getattr(r, "boxes", []):
@@ -182,13 +211,13 @@ class FollowMeEngine:
         # 2) Registration: cần ✌️ giữ N khung, rồi LẤY EMBEDDING
         if self.target_embedding is None:
             if candidate is not None and self.hands is not None:
-                fingers = self._roi_fingers(color_bgr, candidate["box"])
+                fingers = self._roi_fingers(fb, candidate["box"])
                 gesture = "register" if fingers == 1 else None
             else:
                 gesture = None
 
             if self.reg_latch.step(gesture, self.reg_need) and candidate is not None:
-                emb = _face_embed(self.face_app, color_bgr, candidate["box"])
+                emb = _face_embed(self.face_app, fb, candidate["box"], self.pool)
                 if emb is not None:
                     self.target_embedding = emb
                     self.identity_ok = True
@@ -201,7 +230,7 @@ class FollowMeEngine:
         # 3) Sau đăng ký: kiểm tra IDENTITY bằng embedding
         matched = False
         if candidate is not None:
-            emb = _face_embed(self.face_app, color_bgr, candidate["box"])
+            emb = _face_embed(self.face_app, fb, candidate["box"], self.pool)
             if emb is not None:
                 matched = (_cosine_dist(emb, self.target_embedding) < self.face_thr)
 
@@ -234,7 +263,7 @@ class FollowMeEngine:
         if not self.identity_ok:
             return events
 
-        fingers = self._roi_fingers(color_bgr, candidate["box"]) if self.hands is not None else None
+        fingers = self._roi_fingers(fb, candidate["box"]) if self.hands is not None else None
         g_follow = "follow" if fingers == 2 else None
         g_pause  = "pause"  if fingers == 3 else None
 
@@ -7,6 +7,9 @@ from typing import Dict, Any, Optional, Tuple, List
 import cv2
 import numpy as np
 
+from app.hardware.frame import as_bundle
+from app.utils.buffer_pool import BufferPool
+
 log = logging.getLogger("vision.tag.engine")
 
 try:
@@ -50,6 +53,8 @@ class TagEngineConfig:
     alpha_pos: float = 0.25
     alpha_dist: float = 0.25
     alpha_angle: float = 0.25
+    # 1 | 2 | 4 | 8: detect trên gray thu nhỏ (JpegFrameBundle decode thẳng ở size nhỏ)
+    gray_reduce: int = 1
 
 class TagEngine:
     """
@@ -78,6 +83,7 @@ class TagEngine:
 
         self._K = None
         self._fxfycc = None  # tuple (fx,fy,cx,cy)
+        self.pool = BufferPool("tag")  # blur/sharp ghi vào buffer dùng lại mỗi frame
 
     def _ensure_intrinsics(self, frame_shape: Tuple[int,int,int]):
         if self._fxfycc is not None: return
@@ -93,23 +99,22 @@ class TagEngine:
             self._fxfycc = None
             log.warning("Không tải được calib %s: %s. Sẽ detect không pose.", self.cfg.calib_file, e)
 
-    def step(self, color_bgr: Optional[np.ndarray]) -> List[Dict[str,Any]]:
+    def step(self, color_bgr) -> List[Dict[str,Any]]:
+        """color_bgr: np.ndarray BGR hoặc FrameBundle."""
         evs: List[Dict[str,Any]] = []
-        if color_bgr is None or not isinstance(color_bgr, np.ndarray) or self.detector is None:
+        fb = as_bundle(color_bgr)
+        if fb is None or self.detector is None:
             if self._had_tag:
                 self._had_tag = False
                 evs.append({"state":"tag_lost"})
             return evs
 
-        h, w = color_bgr.shape[:2]
-        self._ensure_intrinsics(color_bgr.shape)
-
-        # tiền xử lý nhẹ để ổn định
-        gray = cv2.cvtColor(color_bgr, cv2.COLOR_BGR2GRAY)
-        clahe = cv2.createCLAHE(2.0, (8,8))
-        gray = clahe.apply(gray)
-        blur = cv2.GaussianBlur(gray, (0,0), 1.0)
-        sharp = cv2.addWeighted(gray, 1.6, blur, -0.6, 0)
+        # tiền xử lý nhẹ để ổn định (gray + CLAHE lấy từ bundle, tính 1 lần / frame)
+        gray = fb.clahe(2.0, (8,8), reduce=self.cfg.gray_reduce)
+        # intrinsics scale theo size gray thực tế (gray_reduce > 1 -> K thu nhỏ tương ứng)
+        self._ensure_intrinsics(gray.shape)
+        blur = cv2.GaussianBlur(gray, (0,0), 1.0, dst=self.pool.get("blur", gray.shape))
+        sharp = cv2.addWeighted(gray, 1.6, blur, -0.6, 0, dst=self.pool.get("sharp", gray.shape))
 
         # detect
         if self._fxfycc is not None:
@@ -9,6 +9,9 @@ from typing import Dict, Any, List, Optional, Tuple
 import cv2
 import numpy as np
 
+from app.hardware.frame import as_bundle
+from app.utils.buffer_pool import BufferPool
+
 log = logging.getLogger("vision.unphysics.engine")
 
 # MediaPipe Hands
@@ -71,6 +74,7 @@ class UnphysicsEngine:
         self.cooldown_timer = _SimpleTimer()
         self.center_timer = _SimpleTimer()
         self.last_command: Optional[str] = None
+        self.pool = BufferPool("unphysics")
 
         if _MP_OK:
             self._mp_hands = mp.solutions.hands
@@ -129,25 +133,30 @@ class UnphysicsEngine:
             "center_radius": self.center_radius,
             "pull_threshold": self.pull_threshold,
             "cooldown_ms": self.gesture_cooldown_ms,
+            "buffers": self.pool.stats(),
         }
 
-    def step(self, color_bgr: Optional[np.ndarray], depth_frame=None) -> List[Dict[str, Any]]:
+    def step(self, color_bgr, depth_frame=None) -> List[Dict[str, Any]]:
         """
-        Xử lý 1 frame. Trả về list events: [{"state":...}|{"action":...}, ...]
+        Xử lý 1 frame (np.ndarray BGR hoặc FrameBundle). Trả về list events: [{"state":...}|{"action":...}, ...]
         """
         out: List[Dict[str, Any]] = []
-        if color_bgr is None or not isinstance(color_bgr, np.ndarray):
+        fb = as_bundle(color_bgr, depth_frame)
+        if fb is None:
             self.state.prev_tip = None
             self.center_timer.reset()
             return out
         if not _MP_OK or self._hands is None:
             return out
 
-        h, w = color_bgr.shape[:2]
-        rgb = cv2.cvtColor(color_bgr, cv2.COLOR_BGR2RGB)
+        h, w = fb.shape[:2]
+        # dùng view RGB của bundle nếu engine khác đã tính, nếu không thì convert vào buffer dùng lại
+        rgb = fb.peek("rgb")
+        if rgb is None:
+            rgb = cv2.cvtColor(fb.bgr, cv2.COLOR_BGR2RGB, dst=self.pool.get("rgb", fb.shape))
         res = self._hands.process(rgb)
 
-        now = cv2.getTickCount() / cv2.getTickFrequency()  # giây, độ chính xác cao
+        now = fb.capture_ts  # giây, monotonic lúc capture (không phải lúc xử lý)
 
         self.state.tip = None
         command: Optional[str] = None
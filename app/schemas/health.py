@@ -1,5 +1,10 @@
+from typing import Any, Dict, Optional
+
 from pydantic import BaseModel
 
 class HealthResponse(BaseModel):
     live: bool = True
     ready: bool
+    preload_done: bool = False
+    preload_s: Optional[float] = None
+    models: Dict[str, Any] = {}
@@ -11,6 +11,11 @@ from collections import deque
 import numpy as np
 
 from app.mqtt.client import mqtt_bus
+from app.hardware.depth import as_depth
+from app.hardware.frame import FrameBundle, frame_meta
+from app.utils.box_flow import BoxFlow
+from app.utils.motion_gate import MotionGate
+from app.utils.roi import DetectRoi
 
 log = logging.getLogger("vision.counter")
 
@@ -88,6 +93,25 @@ class CentroidTracker:
 
         return self.tracks
 
+    def move(self, boxes: Dict[int, Tuple[int, int, int, int]]):
+        """
+        Cập nhật bbox các track đã có (vd optical flow giữa 2 keyframe), không tạo track mới.
+        Không làm mới last_seen: chỉ detection giữ track sống, track mất khỏi YOLO vẫn hết hạn.
+        """
+        now = time.time()
+        for tid, b in boxes.items():
+            tr = self.tracks.get(tid)
+            if tr is None:
+                continue
+            tr.bbox = b
+            tr.history.append(self._centroid(b))
+
+        to_del = [tid for tid, tr in self.tracks.items() if now - tr.last_seen > self.max_age]
+        for tid in to_del:
+            del self.tracks[tid]
+
+        return self.tracks
+
 
 # -----------------------------
 # Helper vào/ra
@@ -105,17 +129,77 @@ def is_inside(side: str, camera_side: str) -> bool:
         return side == 'left'
 
 
+_NO_BOXES = np.empty((0, 4), dtype=np.int32)
+
+
+def person_boxes(result) -> np.ndarray:
+    """Bbox xyxy (N,4) int32 từ 1 kết quả YOLO (Results, hoặc list [Results] khi gọi model trực tiếp)."""
+    if isinstance(result, (list, tuple)):
+        result = result[0] if result else None
+    boxes = getattr(result, "boxes", None)
+    if boxes is None or len(boxes) == 0:
+        return _NO_BOXES
+    xyxy = boxes.xyxy
+    if hasattr(xyxy, "cpu"):
+        xyxy = xyxy.cpu().numpy()
+    return np.asarray(xyxy).reshape(-1, 4).astype(np.int32)
+
+
+# -----------------------------
+# 1 camera cửa = 1 lane
+# -----------------------------
+class CounterLane:
+    """Camera cửa + line + tracker + bộ đếm riêng; model YOLO dùng chung ở CounterService."""
+
+    def __init__(self, name: str, camera, *, camera_side: str = 'left', line_x_ratio: float = 0.5,
+                 roi: Optional[DetectRoi] = None):
+        self.name = str(name)
+        self.rs = camera
+        self.camera_side = str(camera_side or 'left').lower()
+        self.line_x_ratio = float(line_x_ratio)
+        self.tracker = CentroidTracker()
+        self.roi = roi   # None = detect cả frame
+        self.total_in = 0
+        self.total_out = 0
+        self.frames = 0
+        # keyframe mode
+        self.prev_gray: Optional[np.ndarray] = None
+        self.since_key = 0
+        self.need_key = True
+        # motion gate (None = luôn detect)
+        self.gate: Optional[MotionGate] = None
+
+    def status(self) -> Dict[str, object]:
+        st: Dict[str, object] = {
+            "name": self.name,
+            "camera_side": self.camera_side,
+            "line_x_ratio": self.line_x_ratio,
+            "total_in": self.total_in,
+            "total_out": self.total_out,
+            "tracks": len(self.tracker.tracks),
+            "frames": self.frames,
+        }
+        if self.roi is not None:
+            st["roi"] = self.roi.describe()
+        if self.gate is not None:
+            st["motion"] = self.gate.stats()
+        return st
+
+
 # -----------------------------
 # CounterService
 # -----------------------------
 class CounterService:
     """
     - Nhận rs wrapper (get_frames -> (color, depth)) và yolo wrapper (detect_person(frame))
+    - Nhiều camera cửa (lanes): mỗi vòng lấy frame mọi lane, detect 1 batch trên model dùng chung,
+      rồi tracker / line_x / camera_side riêng từng lane.
     - Đếm vào/ra theo crossing line, publish MQTT ngay khi có sự kiện:
         topic: vision/result
         payload:
           {"type":"detect","payload":{"method":"counter","data":{"action":"IN"}}}
           {"type":"detect","payload":{"method":"counter","data":{"action":"OUT"}}}
+        nhiều lane: data thêm camera, camera_in/camera_out và tổng total_in/total_out.
     - Log định kỳ tổng IN/OUT theo log_interval.
     - Có camera lock để không tranh chấp giữa các service.
     """
@@ -127,8 +211,8 @@ class CounterService:
         self.running = False
 
         # deps
-        self.rs = None        # RealSense wrapper
-        self.yolo = None      # YOLO wrapper
+        self.lanes: List[CounterLane] = []   # mỗi lane giữ camera wrapper riêng
+        self.yolo = None      # YOLO wrapper (dùng chung mọi lane)
 
         # config
         self.camera_side = 'left'
@@ -138,9 +222,13 @@ class CounterService:
         self.max_dist = 6.0
         self.enter_window = 1.0
         self.log_interval = 2.0
+        self.keyframe_interval = 1     # 1 = detect mọi frame
+        self.keyframe_min_conf = 0.5   # tỉ lệ điểm LK tốt tối thiểu, thấp hơn -> detect ở frame kế
+        self.flow = BoxFlow()
+        self.keyframes = 0
+        self.propagated = 0
 
-        # state
-        self.tracker = CentroidTracker()
+        # state (tổng mọi lane)
         self.total_in = 0
         self.total_out = 0
         self.enter_times = deque()
@@ -162,7 +250,8 @@ class CounterService:
             except RuntimeError:
                 pass
             self._lock_acquired = False
-            time.sleep(0.2)  # grace cho driver nhả hẳn
+            if not all(getattr(ln.rs, "warm_handoff", False) for ln in self.lanes):  # lease warm: thiết bị không bị đóng
+                time.sleep(0.2)  # grace cho driver nhả hẳn
 
     # ---------- Public API ----------
     def is_running(self) -> bool:
@@ -180,7 +269,18 @@ class CounterService:
         max_dist: float = 6.0,
         enter_window: float = 1.0,
         log_interval: float = 2.0,
+        lanes: Optional[List[CounterLane]] = None,
+        keyframe_interval: int = 1,
+        keyframe_min_conf: float = 0.5,
+        motion_gate: Optional[Dict[str, object]] = None,
     ) -> None:
+        """
+        lanes=None: 1 camera `rs_wrapper` với camera_side/line_x_ratio (như trước).
+        keyframe_interval > 1: YOLO mỗi N frame (hoặc khi LK mất bám), giữa 2 keyframe box
+        track được đẩy bằng optical flow; logic crossing vẫn chạy mọi frame.
+        motion_gate: kwargs MotionGate (method / band_ratio / reduce / min_area / hold_s) -> lane
+        không có chuyển động quanh line thì bỏ qua YOLO, track hết hạn theo max_age như thường.
+        """
         if self.running:
             log.info("Counter already running.")
             return
@@ -192,19 +292,27 @@ class CounterService:
         self._lock_acquired = True
 
         try:
-            self.rs = rs_wrapper
+            if not lanes:
+                lanes = [CounterLane(str(getattr(rs_wrapper, "device", "rgb")), rs_wrapper,
+                                     camera_side=camera_side, line_x_ratio=line_x_ratio)]
+            self.lanes = list(lanes)
             self.yolo = yolo_wrapper
 
-            self.camera_side = str(camera_side or 'left').lower()
-            self.line_x_ratio = float(line_x_ratio)
+            self.camera_side = self.lanes[0].camera_side
+            self.line_x_ratio = self.lanes[0].line_x_ratio
             self.use_depth = bool(use_depth)
             self.min_dist = float(min_dist)
             self.max_dist = float(max_dist)
             self.enter_window = float(enter_window)
             self.log_interval = float(log_interval)
+            self.keyframe_interval = max(1, int(keyframe_interval))
+            self.keyframe_min_conf = float(keyframe_min_conf)
+            for ln in self.lanes:
+                ln.gate = MotionGate(**motion_gate) if motion_gate is not None else None
 
             # reset state
-            self.tracker = CentroidTracker()
+            self.keyframes = 0
+            self.propagated = 0
             self.total_in = 0
             self.total_out = 0
             self.enter_times.clear()
@@ -217,8 +325,10 @@ class CounterService:
             self.running = True
 
             log.info(
-                "Counter START | camera_side=%s line_x_ratio=%.2f use_depth=%s dist=[%.2f..%.2f] enter_window=%.1fs",
-                self.camera_side, self.line_x_ratio, self.use_depth, self.min_dist, self.max_dist, self.enter_window
+                "Counter START | lanes=%s use_depth=%s dist=[%.2f..%.2f] enter_window=%.1fs keyframe=%d motion_gate=%s",
+                ", ".join(f"{ln.name}(side={ln.camera_side} line_x={ln.line_x_ratio:.2f})" for ln in self.lanes),
+                self.use_depth, self.min_dist, self.max_dist, self.enter_window, self.keyframe_interval,
+                motion_gate.get("method", "diff") if motion_gate is not None else "off"
             )
         except Exception:
             self._release_camera_lock()
@@ -249,27 +359,40 @@ class CounterService:
             "log_interval": self.log_interval,
             "total_in": self.total_in,
             "total_out": self.total_out,
+            "keyframe_interval": self.keyframe_interval,
+            "keyframes": self.keyframes,
+            "propagated": self.propagated,
+            "gated_s": round(sum(ln.gate.gated_s for ln in self.lanes if ln.gate is not None), 1),
+            "active_s": round(sum(ln.gate.active_s for ln in self.lanes if ln.gate is not None), 1),
+            "cameras": [ln.status() for ln in self.lanes],
         }
 
     # ---------- Internals ----------
     def _cleanup(self):
-        try:
-            if self.rs is not None:
-                if hasattr(self.rs, "close"):
-                    self.rs.close()
-                elif hasattr(self.rs, "stop"):
-                    self.rs.stop()
-        except Exception:
-            pass
+        release = getattr(self.yolo, "release", None)   # handle từ model registry
+        if callable(release):
+            release()
+        for ln in self.lanes:
+            try:
+                if hasattr(ln.rs, "close"):
+                    ln.rs.close()
+                elif hasattr(ln.rs, "stop"):
+                    ln.rs.stop()
+            except Exception:
+                pass
 
-    def _get_frames(self):
+    @staticmethod
+    def _get_frames(rs):
         """Trả (color_np, depth_frame hoặc None). Hỗ trợ rs wrapper có get_frames() hoặc read()."""
-        if self.rs is None:
+        if rs is None:
             return None, None
-        if hasattr(self.rs, "get_frames"):
-            return self.rs.get_frames()
-        if hasattr(self.rs, "read"):
-            return self.rs.read()
+        if hasattr(rs, "get_bundle"):
+            fb = rs.get_bundle()
+            return (fb, fb.depth) if fb is not None else (None, None)
+        if hasattr(rs, "get_frames"):
+            return rs.get_frames()
+        if hasattr(rs, "read"):
+            return rs.read()
         raise RuntimeError("RealSense wrapper must implement get_frames() or read()")
 
     @staticmethod
@@ -277,6 +400,7 @@ class CounterService:
         """
         Chuẩn hóa về np.ndarray cho khung màu.
         - Nếu color đã là ndarray -> trả về
+        - Nếu color là FrameBundle -> lấy khung BGR gốc
         - Nếu color là video_frame -> convert get_data()
         - Nếu color là depth_frame nhưng depth là video_frame -> swap
         """
@@ -286,6 +410,9 @@ class CounterService:
         if isinstance(color, np.ndarray):
             return color
 
+        if isinstance(color, FrameBundle):
+            return color.bgr
+
         if is_video(color):
             try:
                 import numpy as _np
@@ -302,93 +429,174 @@ class CounterService:
 
         return None
 
-    def _publish_action(self, action: str):
-        """Publish một sự kiện IN/OUT ngay khi phát hiện."""
+    def _publish_action(self, action: str, meta: Optional[Dict] = None, lane: Optional[CounterLane] = None):
+        """Publish một sự kiện IN/OUT ngay khi phát hiện (kèm capture_ts/frame_seq/latency của frame)."""
+        data: Dict[str, object] = {"action": action}
+        if lane is not None and len(self.lanes) > 1:
+            data.update(camera=lane.name, camera_in=lane.total_in, camera_out=lane.total_out,
+                        total_in=self.total_in, total_out=self.total_out)
         mqtt_bus.publish_result({
             "type": "detect",
             "payload": {
                 "method": "counter",
-                "data": {"action": action}
+                "data": data,
+                **(meta or {}),
             }
         }, qos=1)
 
+    def _detect(self, colors: List[np.ndarray], imgsz: Optional[int] = None) -> List[object]:
+        """
+        YOLO detect người (class=0) cho cả batch frame; trả 1 kết quả / frame (None nếu lỗi).
+        imgsz: kích thước inference (crop ROI), None = mặc định của model.
+        """
+        kw = {} if imgsz is None else {"imgsz": int(imgsz)}
+        try:
+            if hasattr(self.yolo, "detect_persons"):
+                results = self.yolo.detect_persons(colors, **kw)
+            elif hasattr(self.yolo, "detect_person"):
+                results = [self.yolo.detect_person(c, **kw) for c in colors]
+            else:
+                # fallback: giả sử YOLO object có __call__ (list ảnh -> chạy 1 batch)
+                results = self.yolo(colors, conf=0.35, verbose=False, classes=[0], **kw)
+        except Exception:
+            results = None
+        results = list(results) if results is not None else []
+        return results + [None] * (len(colors) - len(results))
+
+    def _filter_boxes(self, boxes: np.ndarray, depth) -> List[Tuple[int, int, int, int]]:
+        if len(boxes) == 0:
+            return []
+        x1, y1, x2, y2 = boxes.T
+        # bỏ bbox quá nhỏ để giảm nhiễu
+        keep = (x2 - x1) * (y2 - y1) >= 8000
+        if self.use_depth:
+            cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+            for i in np.flatnonzero(keep):
+                keep[i] = self._depth_ok(depth, int(cx[i]), int(cy[i]))
+        return [tuple(b) for b in boxes[keep].tolist()]
+
     def _depth_ok(self, depth_frame, cx: int, cy: int) -> bool:
-        if depth_frame is None or not hasattr(depth_frame, "get_distance"):
+        df = as_depth(depth_frame)
+        if df is None:
             return True  # không có depth thì bỏ qua filter
         try:
-            dist = depth_frame.get_distance(int(cx), int(cy))
+            dist = df.get_distance(int(cx), int(cy))
         except Exception:
             return True
         if dist <= 0:
             return False
         return (self.min_dist <= dist <= self.max_dist)
 
+    # ---------- keyframe mode ----------
+    def _need_detect(self, lane: CounterLane, fb: FrameBundle) -> bool:
+        if self.keyframe_interval <= 1 or lane.need_key or lane.prev_gray is None:
+            return True
+        return lane.since_key + 1 >= self.keyframe_interval or lane.prev_gray.shape != fb.shape[:2]
+
+    def _propagate(self, lane: CounterLane, gray: np.ndarray):
+        """Frame không detect: dời box track theo LK; bám kém -> keyframe ở frame kế."""
+        boxes = {tid: tr.bbox for tid, tr in lane.tracker.tracks.items()}
+        moved = self.flow.propagate(lane.prev_gray, gray, boxes)
+        ok = {tid: b for tid, (b, conf) in moved.items() if conf >= self.keyframe_min_conf}
+        if len(ok) < len(moved):
+            lane.need_key = True
+        return lane.tracker.move(ok)
+
+    def _count_lane(self, lane: CounterLane, fb: FrameBundle, width: int,
+                    tracks: Dict[int, Track], now: float, t_frame: float) -> None:
+        line_x = int(width * lane.line_x_ratio)
+
+        for tid, tr in tracks.items():
+            x1, y1, x2, y2 = tr.bbox
+            cx = int((x1 + x2) / 2)
+
+            prev_side = tr.side
+            cur_side = get_side(cx, line_x)
+            tr.side = cur_side
+
+            if prev_side != 'unknown' and cur_side != prev_side:
+                # crossing line
+                if is_inside(cur_side, lane.camera_side) and not tr.counted_in:
+                    lane.total_in += 1
+                    self.total_in += 1
+                    tr.counted_in, tr.counted_out = True, False
+                    self.enter_times.append(now)
+                    # Log & publish ngay
+                    log.info("[VÀO] %s Track %d | IN=%d OUT=%d", lane.name, tid, self.total_in, self.total_out)
+                    print(f'in=1 | IN={self.total_in} OUT={self.total_out}', flush=True)
+                    self._publish_action("IN", frame_meta(fb, (time.monotonic() - t_frame) * 1000.0), lane)
+                elif not is_inside(cur_side, lane.camera_side) and not tr.counted_out:
+                    lane.total_out += 1
+                    self.total_out += 1
+                    tr.counted_out, tr.counted_in = True, False
+                    log.info("[RA ] %s Track %d | IN=%d OUT=%d", lane.name, tid, self.total_in, self.total_out)
+                    print(f'out=1 | IN={self.total_in} OUT={self.total_out}', flush=True)
+                    self._publish_action("OUT", frame_meta(fb, (time.monotonic() - t_frame) * 1000.0), lane)
+
     def _loop(self):
         try:
             last_summary = time.time()
             while not self.stop_evt.is_set():
-                color, depth = self._get_frames()
-                color = self._np_color(color, depth)
-                if color is None:
+                # 1 frame mới nhất / lane (lane chưa có frame thì bỏ qua vòng này)
+                batch = []
+                for lane in self.lanes:
+                    raw, depth = self._get_frames(lane.rs)
+                    color = self._np_color(raw, depth)
+                    if color is None:
+                        continue
+                    fb = raw if isinstance(raw, FrameBundle) else FrameBundle(color, depth)
+                    batch.append((lane, fb, color, depth, time.monotonic()))
+                if not batch:
                     time.sleep(0.002)
                     continue
 
-                h, w = color.shape[:2]
-                line_x = int(w * self.line_x_ratio)
-
-                # YOLO detect người (class=0)
-                dets: List[Tuple[int, int, int, int]] = []
-                try:
-                    if hasattr(self.yolo, "detect_person"):
-                        results = self.yolo.detect_person(color)
+                # motion gate: lane tĩnh quanh line -> bỏ qua YOLO / LK, chỉ cho track cũ hết hạn
+                active = []
+                for b in batch:
+                    lane = b[0]
+                    if lane.gate is None or lane.gate.update(b[1], lane.line_x_ratio, b[4]):
+                        active.append(b)
+                        continue
+                    lane.frames += 1
+                    lane.tracker.move({})
+                    lane.need_key, lane.prev_gray = True, None
+                batch = active
+
+                # keyframe mode: chỉ lane tới lượt (hoặc mất bám) mới vào batch YOLO
+                det_idx = [i for i, b in enumerate(batch) if self._need_detect(b[0], b[1])]
+                # ROI: detector chỉ thấy crop quanh line / polygon (imgsz riêng), box map lại
+                # toạ độ frame; lane cùng imgsz chung 1 batch
+                groups: Dict[Optional[int], List[int]] = {}
+                crops, tfs = {}, {}
+                for i in det_idx:
+                    lane, color = batch[i][0], batch[i][2]
+                    if lane.roi is None:
+                        crops[i] = color
+                        groups.setdefault(None, []).append(i)
                     else:
-                        # fallback: giả sử YOLO object có __call__
-                        results = self.yolo(color, conf=0.35, verbose=False, classes=[0])
-                except Exception:
-                    results = None
-
-                if results:
-                    r = results[0] if len(results) > 0 else None
-                    if r is not None and hasattr(r, "boxes"):
-                        for b in r.boxes:
-                            xyxy = b.xyxy[0].cpu().numpy().astype(int).tolist()
-                            x1, y1, x2, y2 = xyxy
-                            cx = int((x1 + x2) / 2)
-                            cy = int((y1 + y2) / 2)
-                            if self.use_depth and not self._depth_ok(depth, cx, cy):
-                                continue
-                            # bỏ bbox quá nhỏ để giảm nhiễu
-                            if (x2 - x1) * (y2 - y1) < 8000:
-                                continue
-                            dets.append((x1, y1, x2, y2))
-
-                tracks = self.tracker.update(dets)
+                        crops[i], tfs[i] = lane.roi.crop(color, lane.line_x_ratio)
+                        groups.setdefault(lane.roi.imgsz or None, []).append(i)
+                results = {}
+                for imgsz, idx in groups.items():
+                    results.update(zip(idx, self._detect([crops[i] for i in idx], imgsz)))
                 now = time.time()
-
-                for tid, tr in tracks.items():
-                    x1, y1, x2, y2 = tr.bbox
-                    cx = int((x1 + x2) / 2)
-
-                    prev_side = tr.side
-                    cur_side = get_side(cx, line_x)
-                    tr.side = cur_side
-
-                    if prev_side != 'unknown' and cur_side != prev_side:
-                        # crossing line
-                        if is_inside(cur_side, self.camera_side) and not tr.counted_in:
-                            self.total_in += 1
-                            tr.counted_in, tr.counted_out = True, False
-                            self.enter_times.append(now)
-                            # Log & publish ngay
-                            log.info("[VÀO] Track %d | IN=%d OUT=%d", tid, self.total_in, self.total_out)
-                            print(f'in=1 | IN={self.total_in} OUT={self.total_out}', flush=True)
-                            self._publish_action("IN")
-                        elif not is_inside(cur_side, self.camera_side) and not tr.counted_out:
-                            self.total_out += 1
-                            tr.counted_out, tr.counted_in = True, False
-                            log.info("[RA ] Track %d | IN=%d OUT=%d", tid, self.total_in, self.total_out)
-                            print(f'out=1 | IN={self.total_in} OUT={self.total_out}', flush=True)
-                            self._publish_action("OUT")
+                for i, (lane, fb, color, depth, t_frame) in enumerate(batch):
+                    lane.frames += 1
+                    gray = fb.gray() if self.keyframe_interval > 1 else None
+                    if i in results:
+                        boxes = person_boxes(results[i])
+                        if i in tfs:
+                            boxes = DetectRoi.to_frame(boxes, tfs[i])
+                        dets = self._filter_boxes(boxes, depth)
+                        tracks = lane.tracker.update(dets)
+                        lane.since_key, lane.need_key = 0, False
+                        self.keyframes += 1
+                    else:
+                        tracks = self._propagate(lane, gray)
+                        lane.since_key += 1
+                        self.propagated += 1
+                    lane.prev_gray = gray
+                    self._count_lane(lane, fb, color.shape[1], tracks, now, t_frame)
 
                 # cảnh báo nhiều người cùng vào trong cửa sổ thời gian
                 while self.enter_times and now - self.enter_times[0] > self.enter_window:
@@ -399,7 +607,11 @@ class CounterService:
 
                 # log định kỳ tổng kết
                 if (now - last_summary) >= float(self.log_interval):
-                    log.info("SUMMARY (periodic): IN=%d OUT=%d", self.total_in, self.total_out)
+                    if len(self.lanes) > 1:
+                        log.info("SUMMARY (periodic): IN=%d OUT=%d | %s", self.total_in, self.total_out,
+                                 " ".join(f"{ln.name}={ln.total_in}/{ln.total_out}" for ln in self.lanes))
+                    else:
+                        log.info("SUMMARY (periodic): IN=%d OUT=%d", self.total_in, self.total_out)
                     last_summary = now
 
         finally:
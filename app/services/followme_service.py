@@ -4,6 +4,7 @@ import logging, threading, time
 from typing import Optional, Dict, Any, Tuple, List
 import numpy as np
 from app.mqtt.client import mqtt_bus
+from app.hardware.frame import FrameBundle, as_bundle, frame_meta
 
 log = logging.getLogger("vision.followme")
 
@@ -74,7 +75,11 @@ class FollowMeService:
     def status(self) -> Dict[str, Any]:
         e = getattr(self.engine, "status", None)
         est = e() if callable(e) else {}
-        return {"running": self.running, "config": dict(self.cfg), **(est or {})}
+        st = {"running": self.running, "config": dict(self.cfg), **(est or {})}
+        cs = getattr(self.rs, "stats", None)
+        if callable(cs):
+            st["camera"] = cs()
+        return st
 
     # ---- internals ----
     def _release_camera_lock(self):
@@ -84,7 +89,8 @@ class FollowMeService:
             except RuntimeError:
                 pass
             self._lock_acquired = False
-            time.sleep(0.2)  # grace để driver nhả hẳn
+            if not getattr(self.rs, "warm_handoff", False):  # lease warm: thiết bị không bị đóng
+                time.sleep(0.2)  # grace để driver nhả hẳn
 
     def _cleanup(self):
         try:
@@ -93,10 +99,16 @@ class FollowMeService:
                 elif hasattr(self.rs, "stop"): self.rs.stop()
         except Exception:
             pass
+        close = getattr(self.engine, "close", None)   # trả model về registry
+        if callable(close):
+            close()
 
     def _get_frames(self) -> Tuple[Optional[np.ndarray], Optional[object]]:
         if self.rs is None:
             return None, None
+        if hasattr(self.rs, "get_bundle"):
+            fb = self.rs.get_bundle()
+            return (fb, fb.depth) if fb is not None else (None, None)
         if hasattr(self.rs, "get_frames"):
             return self.rs.get_frames()
         if hasattr(self.rs, "read"):
@@ -106,9 +118,10 @@ class FollowMeService:
     @staticmethod
     def _np_color(color, depth):
         # đổi color video_frame -> np.ndarray; nếu bị đảo với depth thì lấy từ depth
+        # FrameBundle giữ nguyên để engine dùng chung các view dẫn xuất
         def is_depth(f): return hasattr(f, "get_distance")
         def is_video(f): return hasattr(f, "get_data") and not is_depth(f)
-        if isinstance(color, np.ndarray): return color
+        if isinstance(color, (np.ndarray, FrameBundle)): return color
         if is_video(color):
             import numpy as _np
             try: return _np.asanyarray(color.get_data())
@@ -119,13 +132,14 @@ class FollowMeService:
             except Exception: return None
         return None
 
-    def _publish(self, data: Dict[str, Any]):
-        # data là phần 'data' trong payload
+    def _publish(self, data: Dict[str, Any], meta: Optional[Dict[str, Any]] = None):
+        # data là phần 'data' trong payload; meta = capture_ts/frame_seq/latency của frame sinh ra event
         mqtt_bus.publish_result({
             "type": "detect",
             "payload": {
                 "method": "follow_me",
-                "data": data
+                "data": data,
+                **(meta or {}),
             }
         }, qos=1)
 
@@ -140,10 +154,13 @@ class FollowMeService:
                     time.sleep(0.002)
                     continue
 
+                fb = as_bundle(color, depth)
+                t0 = time.monotonic()
                 try:
-                    events: List[Dict[str, Any]] = self.engine.step(color, depth)
+                    events: List[Dict[str, Any]] = self.engine.step(fb, depth)
                 except Exception:
                     events = []
+                meta = frame_meta(fb, (time.monotonic() - t0) * 1000.0) if events else None
 
                 for ev in events:
                     # ev ví dụ: {"event":"registered"} | {"state":"following"} | {"event":"lost"} ...
@@ -157,7 +174,7 @@ class FollowMeService:
                         log.info("event=%s", ev["event"])
                         print(f"event={ev['event']}", flush=True)
                     # publish
-                    self._publish(ev)
+                    self._publish(ev, meta)
 
         finally:
             self._cleanup()
@@ -5,6 +5,7 @@ from typing import Optional, Dict, Any, Tuple, List
 import numpy as np
 
 from app.mqtt.client import mqtt_bus
+from app.hardware.frame import FrameBundle, as_bundle, frame_meta
 
 log = logging.getLogger("vision.tag")
 
@@ -34,19 +35,25 @@ class TagService:
                     "tag_size_m": self.engine.cfg.tag_size_m,
                     "calib_file": self.engine.cfg.calib_file,
                 }
+            if hasattr(self.engine, "pool"):
+                st["buffers"] = self.engine.pool.stats()
         except Exception: pass
         return st
 
     # --- MQTT publish helpers ---
-    def _pub_state(self, state: str) -> None:
-        mqtt_bus.publish_result({"type":"state","payload":{"method":"tagdata","data":{"state": state}}}, qos=1, retain=False)
+    def _pub_state(self, state: str, meta: Optional[Dict[str, Any]] = None) -> None:
+        mqtt_bus.publish_result({"type":"state","payload":{"method":"tagdata","data":{"state": state}, **(meta or {})}}, qos=1, retain=False)
 
-    def _pub_detect(self, data: Dict[str, Any]) -> None:
-        mqtt_bus.publish_result({"type":"detect","payload":{"method":"tagdata","data": data}}, qos=1, retain=False)
+    def _pub_detect(self, data: Dict[str, Any], meta: Optional[Dict[str, Any]] = None) -> None:
+        mqtt_bus.publish_result({"type":"detect","payload":{"method":"tagdata","data": data, **(meta or {})}}, qos=1, retain=False)
 
     # --- camera I/O ---
-    def _read(self) -> Tuple[Optional[np.ndarray], Optional[object]]:
+    def _read(self) -> Tuple[Optional[np.ndarray | FrameBundle], Optional[object]]:
         if self.rs is None: return None, None
+        fn = getattr(self.rs, "get_bundle", None)
+        if callable(fn):
+            fb = fn()
+            return (fb, fb.depth) if fb is not None else (None, None)
         fn = getattr(self.rs, "get_frames", None)
         if callable(fn): return self.rs.get_frames()
         fn = getattr(self.rs, "read", None)
@@ -86,19 +93,24 @@ class TagService:
                 if color is None:
                     time.sleep(0.01)
                     continue
+                fb = as_bundle(color)
+                t0 = time.monotonic()
                 try:
-                    events = self.engine.step(color)
+                    events = self.engine.step(fb)
                 except Exception as e:
                     log.exception("TagEngine step error: %s", e)
                     events = []
+                if not events:
+                    continue
+                meta = frame_meta(fb, (time.monotonic() - t0) * 1000.0)
 
                 for ev in events:
                     if "state" in ev:
                         st = ev["state"]
                         log.info("tag state=%s", st)
-                        self._pub_state(st)
+                        self._pub_state(st, meta)
                     if "detect" in ev:
-                        self._pub_detect(ev["detect"])
+                        self._pub_detect(ev["detect"], meta)
         finally:
             log.info("TagService STOP")
             self._pub_state("stop")
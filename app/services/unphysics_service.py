@@ -8,6 +8,7 @@ from typing import Optional, Dict, Any, Tuple
 
 import numpy as np
 from app.mqtt.client import mqtt_bus
+from app.hardware.frame import FrameBundle, as_bundle, frame_meta
 
 log = logging.getLogger("vision.unphysics")
 
@@ -50,29 +51,35 @@ class UnphysicsService:
         except Exception as e:
             log.warning("Publish result failed: %s", e)
 
-    def _emit_state(self, state: str) -> None:
+    def _emit_state(self, state: str, meta: Optional[Dict[str, Any]] = None) -> None:
         self._publish({
             "type": "state",
             "payload": {
                 "method": "control_unphysics",
-                "data": {"state": state}
+                "data": {"state": state},
+                **(meta or {}),
             }
         })
 
-    def _emit_action(self, action: str) -> None:
+    def _emit_action(self, action: str, meta: Optional[Dict[str, Any]] = None) -> None:
         self._publish({
             "type": "detect",
             "payload": {
                 "method": "control_unphysics",
-                "data": {"action": action}
+                "data": {"action": action},
+                **(meta or {}),
             }
         })
         log.info("UNPHYSICS action=%s", action)
 
     # ---- I/O ----
-    def _read_frame(self) -> Tuple[Optional[np.ndarray], Optional[object]]:
+    def _read_frame(self) -> Tuple[Optional[np.ndarray | FrameBundle], Optional[object]]:
         if self.rs is None:
             return None, None
+        fn = getattr(self.rs, "get_bundle", None)
+        if callable(fn):
+            fb = fn()
+            return (fb, fb.depth) if fb is not None else (None, None)
         fn = getattr(self.rs, "get_frames", None)
         if callable(fn):
             return self.rs.get_frames()
@@ -92,19 +99,24 @@ class UnphysicsService:
                 if color is None:
                     time.sleep(0.002)
                     continue
+                fb = as_bundle(color, depth)
+                t0 = time.monotonic()
                 try:
-                    events = self.engine.step(color, depth)
+                    events = self.engine.step(fb, depth)
                 except Exception as e:
                     log.exception("Engine step failed: %s", e)
                     events = []
+                if not events:
+                    continue
+                meta = frame_meta(fb, (time.monotonic() - t0) * 1000.0)
 
                 for ev in events:
                     if "state" in ev:
                         s = ev["state"]
                         log.info("ARMED (✌️)" if s == "armed" else "PAUSED (3 ngón)")
-                        self._emit_state(s)
+                        self._emit_state(s, meta)
                     elif "action" in ev:
-                        self._emit_action(str(ev["action"]).upper())
+                        self._emit_action(str(ev["action"]).upper(), meta)
         finally:
             log.info("Unphysics STOP (cleanup)")
             self._emit_state("stop")
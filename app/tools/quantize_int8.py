@@ -0,0 +1,227 @@
+# app/tools/quantize_int8.py
+"""
+Lượng tử hoá INT8 (static, per-channel, QDQ) detector YOLO của counter / follow-me bằng
+ONNX Runtime, calibrate trên frame ghi tại site (session recording / video / thư mục ảnh),
+kèm report latency / RAM / recall người so với FP32 trên cùng clip.
+
+  python -m app.tools.quantize_int8 --model yolo11s.pt \\
+      --calib /data/sessions/door1 /data/clips/door2.mp4 --eval /data/clips/door3.mp4 \\
+      --out yolo11s.int8.onnx
+
+Dùng bản INT8: VISION_COUNTER_BACKEND=onnx_int8 (VISION_COUNTER_INT8_WEIGHTS=yolo11s.int8.onnx),
+tương tự FOLLOWME_BACKEND / FOLLOWME_INT8_WEIGHTS.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.model_registry import _rss_mb
+from app.hardware.detector import OnnxDetector, box_iou
+from app.hardware.file_source import FileFrameSource
+from app.hardware.recording import ReplayCamera
+
+log = logging.getLogger("vision.tools.quantize")
+
+CALIB_METHODS = ("minmax", "entropy", "percentile")
+
+
+# ---------- frame nguồn ----------
+def iter_frames(sources: Sequence[str], max_frames: int = 0, stride: int = 1) -> Iterator[np.ndarray]:
+    """Frame BGR từ session đã ghi (thư mục có meta.json) / video / thư mục ảnh / glob, lấy 1 mỗi `stride`."""
+    n = 0
+    stride = max(1, int(stride))
+    for src in sources:
+        i = 0
+        if os.path.isfile(os.path.join(src, "meta.json")):
+            cam = ReplayCamera(src, realtime=False, loop=False)
+            read = lambda: cam.get_frames()[0]
+        else:
+            cam = FileFrameSource(src, realtime=False, loop=False)
+            if not cam.open():
+                continue
+            read = lambda: None if cam.finished else cam.read(timeout=1.0)
+        try:
+            while True:
+                frame = read()
+                if frame is None:
+                    if isinstance(cam, FileFrameSource) and not cam.finished:
+                        continue
+                    break
+                if i % stride == 0:
+                    yield frame
+                    n += 1
+                    if max_frames and n >= max_frames:
+                        return
+                i += 1
+        finally:
+            cam.close()
+
+
+# ---------- export / quantize ----------
+def export_onnx(weights: str, imgsz: int = 640) -> str:
+    """*.pt -> ONNX FP32 (dynamic batch) qua ultralytics; *.onnx trả nguyên."""
+    if weights.endswith(".onnx"):
+        return weights
+    from ultralytics import YOLO
+    return str(YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True))
+
+
+def head_nodes(model_path: str) -> List[str]:
+    """Node của Detect head (/model.<N lớn nhất>/...) - giữ FP32 để không mất độ chính xác bbox."""
+    import onnx
+    nodes = onnx.load(model_path, load_external_data=False).graph.node
+    idx = [int(m.group(1)) for nd in nodes for m in [re.match(r"/model\.(\d+)/", nd.name)] if m]
+    if not idx:
+        return []
+    prefix = f"/model.{max(idx)}/"
+    return [nd.name for nd in nodes if nd.name.startswith(prefix)]
+
+
+def quantize(fp32: str, out: str, frames: Sequence[np.ndarray], *, per_channel: bool = True,
+             method: str = "minmax", keep_head_fp32: bool = True) -> Dict[str, Any]:
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                          QuantType, quantize_static)
+
+    det = OnnxDetector(fp32)   # cùng letterbox/normalize với lúc chạy thật
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self):
+            self._it = iter(frames)
+
+        def get_next(self):
+            f = next(self._it, None)
+            return None if f is None else {det.input_name: det._blob([f])[0]}
+
+    src = fp32
+    try:
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+        src = out + ".prep.onnx"
+        quant_pre_process(fp32, src)
+    except Exception as e:
+        log.warning("quant_pre_process bỏ qua: %s", e)
+        src = fp32
+    exclude = head_nodes(src) if keep_head_fp32 else []
+    cm = {"minmax": CalibrationMethod.MinMax, "entropy": CalibrationMethod.Entropy,
+          "percentile": CalibrationMethod.Percentile}[method]
+    t0 = time.perf_counter()
+    quantize_static(src, out, _Reader(), quant_format=QuantFormat.QDQ, per_channel=per_channel,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                    calibrate_method=cm, nodes_to_exclude=exclude)
+    if src != fp32 and os.path.exists(src):
+        os.remove(src)
+    return {
+        "calib_frames": len(frames),
+        "calib_method": method,
+        "per_channel": per_channel,
+        "fp32_head_nodes": len(exclude),
+        "quantize_s": round(time.perf_counter() - t0, 1),
+    }
+
+
+# ---------- đánh giá ----------
+def _match(ref: np.ndarray, test: np.ndarray, thr: float) -> int:
+    """Ghép 1-1 tham lam theo IoU >= thr, trả số box ref được khớp."""
+    if len(ref) == 0 or len(test) == 0:
+        return 0
+    iou = box_iou(ref.astype(np.float32), test.astype(np.float32))
+    matched = 0
+    while True:
+        i, j = np.unravel_index(int(iou.argmax()), iou.shape)
+        if iou[i, j] < thr:
+            return matched
+        matched += 1
+        iou[i, :] = -1.0
+        iou[:, j] = -1.0
+
+
+def _lat(ms: List[float]) -> Dict[str, float]:
+    a = np.asarray(ms or [0.0])
+    return {"mean_ms": round(float(a.mean()), 2), "p50_ms": round(float(np.percentile(a, 50)), 2),
+            "p95_ms": round(float(np.percentile(a, 95)), 2)}
+
+
+def evaluate(fp32: str, int8: str, frames: Sequence[np.ndarray], *, iou_thr: float = 0.5,
+             conf: float = 0.35, threads: int = 0) -> Dict[str, Any]:
+    """Recall người (class 0) của INT8 lấy FP32 làm chuẩn, latency batch=1, RAM tăng khi tạo session."""
+    rss0 = _rss_mb()
+    ref = OnnxDetector(fp32, conf=conf, intra_op_threads=threads)
+    rss1 = _rss_mb()
+    q = OnnxDetector(int8, conf=conf, intra_op_threads=threads)
+    rss2 = _rss_mb()
+    for d in (ref, q):   # warm-up
+        d.detect_person(frames[0])
+    lat_ref: List[float] = []
+    lat_q: List[float] = []
+    n_ref = n_q = n_match = 0
+    for f in frames:
+        t0 = time.perf_counter()
+        a = ref.detect_person(f).boxes.xyxy
+        t1 = time.perf_counter()
+        b = q.detect_person(f).boxes.xyxy
+        t2 = time.perf_counter()
+        lat_ref.append((t1 - t0) * 1000.0)
+        lat_q.append((t2 - t1) * 1000.0)
+        n_ref += len(a)
+        n_q += len(b)
+        n_match += _match(a, b, iou_thr)
+    return {
+        "frames": len(frames),
+        "iou_thr": iou_thr,
+        "conf": conf,
+        "persons_fp32": n_ref,
+        "persons_int8": n_q,
+        "recall_vs_fp32": round(n_match / n_ref, 4) if n_ref else None,
+        "precision_vs_fp32": round(n_match / n_q, 4) if n_q else None,
+        "latency_fp32": _lat(lat_ref),
+        "latency_int8": _lat(lat_q),
+        "rss_mb_fp32": round(rss1 - rss0, 1),
+        "rss_mb_int8": round(rss2 - rss1, 1),
+        "file_mb_fp32": round(os.path.getsize(fp32) / 1e6, 1),
+        "file_mb_int8": round(os.path.getsize(int8) / 1e6, 1),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Quantize YOLO detector sang INT8 (static, per-channel) + report")
+    ap.add_argument("--model", default="yolo11s.pt", help="*.pt (export ONNX trước) hoặc *.onnx FP32")
+    ap.add_argument("--calib", nargs="+", required=True, help="session đã ghi / video / thư mục ảnh / glob")
+    ap.add_argument("--eval", nargs="*", default=None, help="clip đánh giá (mặc định: dùng --calib)")
+    ap.add_argument("--out", default=None, help="file INT8 (mặc định <model>.int8.onnx)")
+    ap.add_argument("--report", default=None, help="report JSON (mặc định <out>.json)")
+    ap.add_argument("--calib-frames", type=int, default=300)
+    ap.add_argument("--eval-frames", type=int, default=300)
+    ap.add_argument("--stride", type=int, default=5, help="lấy 1 frame mỗi N frame (tránh frame gần trùng)")
+    ap.add_argument("--method", default="minmax", choices=CALIB_METHODS)
+    ap.add_argument("--per-tensor", action="store_true", help="weights per-tensor thay vì per-channel")
+    ap.add_argument("--quantize-head", action="store_true", help="quantize cả Detect head (mặc định giữ FP32)")
+    ap.add_argument("--imgsz", type=int, default=640)
+    ap.add_argument("--threads", type=int, default=0, help="intra-op threads khi đo latency")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    fp32 = export_onnx(args.model, args.imgsz)
+    out = args.out or re.sub(r"\.onnx$", "", fp32) + ".int8.onnx"
+    calib = list(iter_frames(args.calib, args.calib_frames, args.stride))
+    if not calib:
+        ap.error("không đọc được frame calibrate nào")
+    q = quantize(fp32, out, calib, per_channel=not args.per_tensor, method=args.method,
+                 keep_head_fp32=not args.quantize_head)
+    frames = list(iter_frames(args.eval, args.eval_frames, args.stride)) if args.eval else calib[:args.eval_frames]
+    report = {"fp32": fp32, "int8": out, "calibration": q, "eval": evaluate(fp32, out, frames, threads=args.threads)}
+    path = args.report or out + ".json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["eval"], indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
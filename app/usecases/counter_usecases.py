@@ -1,33 +1,78 @@
 # app/usecases/counter_usecases.py
 from __future__ import annotations
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+import json
 import logging
 
-from ultralytics import YOLO
 from app.configs.settings import settings
 from app.hardware.rgb_camera import OpenCVCamera
+from app.hardware.frame_bus import frame_buses
+from app.core.camera_pool import camera_leases
+from app.hardware.watchdog import watch_camera
+from app.core.model_registry import detector_spec
+from app.core.inference_server import acquire_detector
+from app.services.counter_service import CounterLane
+from app.utils.motion_gate import MOTION_METHODS
+from app.utils.roi import DetectRoi
 
 log = logging.getLogger("vision.uc.counter")
 
 
-def start_counter_uc(service, *, settings=settings, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    """
-    Khởi động COUNTER với camera RGB (2D).
-    """
-    o = overrides or {}
+def _camera_configs(o: Dict[str, Any], settings) -> List[Dict[str, Any]]:
+    """Danh sách camera cửa: overrides["cameras"] > COUNTER_CAMERAS (JSON) > 1 camera mặc định."""
+    cams = o.get("cameras")
+    if cams is None:
+        raw = getattr(settings, "COUNTER_CAMERAS", "") or ""
+        cams = json.loads(raw) if str(raw).strip() else []
+    if isinstance(cams, dict):
+        cams = [cams]
+    if not cams:
+        cams = [{"device": o.get("rgb_device", getattr(settings, "RGB_CAM_DEVICE", 0))}]
+    return [dict(c) for c in cams]
 
-    # --- RGB camera ---
+
+def _roi_config(o: Dict[str, Any], settings) -> Any:
+    """overrides["roi"] > COUNTER_ROI ("" | "band" | JSON polygon)."""
+    roi = o.get("roi", getattr(settings, "COUNTER_ROI", "") or "")
+    if isinstance(roi, str) and roi.strip().startswith(("[", "{")):
+        roi = json.loads(roi)
+    return roi
+
+
+def _open_lane_camera(c: Dict[str, Any], o: Dict[str, Any], settings, *, multi: bool):
     cam = OpenCVCamera(
-        device=o.get("rgb_device", getattr(settings, "RGB_CAM_DEVICE", 0)),
-        width=o.get("rgb_width", getattr(settings, "RGB_CAM_WIDTH", 1280)),
-        height=o.get("rgb_height", getattr(settings, "RGB_CAM_HEIGHT", 720)),
-        fps=o.get("rgb_fps", getattr(settings, "RGB_CAM_FPS", 30)),
+        device=c.get("device", getattr(settings, "RGB_CAM_DEVICE", 0)),
+        width=c.get("width", o.get("rgb_width", getattr(settings, "RGB_CAM_WIDTH", 1280))),
+        height=c.get("height", o.get("rgb_height", getattr(settings, "RGB_CAM_HEIGHT", 720))),
+        fps=c.get("fps", o.get("rgb_fps", getattr(settings, "RGB_CAM_FPS", 30))),
+        # nhiều camera: capture thread mỗi camera để 1 vòng đọc không bị chặn tuần tự
+        threaded=bool(c.get("threaded", o.get("rgb_threaded",
+                                              multi or getattr(settings, "RGB_THREADED_CAPTURE", False)))),
+        wait_timeout_s=float(getattr(settings, "RGB_WAIT_TIMEOUT_S", 0.1)),
+        # device có thể là video / thư mục ảnh / glob -> phát lại footage đã ghi
+        loop=bool(c.get("loop", o.get("rgb_loop", True))),
+        realtime=bool(c.get("realtime", o.get("rgb_realtime", True))),
     )
 
-    # --- YOLO model ---
-    weights = o.get("yolo_weights", getattr(settings, "COUNTER_YOLO_WEIGHTS", "yolo11s.pt"))
-    yolo_model = YOLO(weights)
+    cam = watch_camera(cam, "counter")
+
+    if getattr(settings, "FRAME_BUS_ENABLED", False):
+        # dùng chung capture với các engine RGB khác trên cùng thiết bị
+        return frame_buses.subscribe(cam, "counter",
+                                     maxlen=int(getattr(settings, "FRAME_BUS_QUEUE", 2)),
+                                     drop_policy=getattr(settings, "FRAME_BUS_DROP_POLICY", "drop_oldest"))
+    if getattr(settings, "CAMERA_WARM_POOL", True):
+        # giữ thiết bị mở giữa các lần đổi method, trao tay qua lease thay vì đóng/mở lại
+        return camera_leases.lease(cam, "counter", timeout=float(getattr(settings, "CAMERA_LEASE_TIMEOUT_S", 5.0)))
+    return cam
+
+
+def start_counter_uc(service, *, settings=settings, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Khởi động COUNTER với camera RGB (2D): 1 hoặc nhiều camera cửa, 1 model YOLO dùng chung.
+    """
+    o = overrides or {}
 
     # --- Params ---
     camera_side = o.get("camera_side", getattr(settings, "COUNTER_CAMERA_SIDE", "left"))
@@ -37,10 +82,64 @@ def start_counter_uc(service, *, settings=settings, overrides: Optional[Dict[str
     log_interval = float(o.get("log_interval", getattr(settings, "COUNTER_LOG_INTERVAL", 2.0)))
     min_dist = float(o.get("min_dist", getattr(settings, "COUNTER_MIN_DIST", 0.2)))
     max_dist = float(o.get("max_dist", getattr(settings, "COUNTER_MAX_DIST", 6.0)))
+    keyframe_interval = int(o.get("keyframe_interval", getattr(settings, "COUNTER_KEYFRAME_INTERVAL", 1)))
+    keyframe_min_conf = float(o.get("keyframe_min_conf", getattr(settings, "COUNTER_KEYFRAME_MIN_CONF", 0.5)))
+    motion_gate = None
+    if bool(o.get("motion_gate", getattr(settings, "COUNTER_MOTION_GATE", False))):
+        motion_gate = {
+            "method": str(o.get("motion_method", getattr(settings, "COUNTER_MOTION_METHOD", "diff"))).lower(),
+            "band_ratio": float(o.get("motion_band", getattr(settings, "COUNTER_MOTION_BAND", 0.3))),
+            "reduce": int(o.get("motion_reduce", getattr(settings, "COUNTER_MOTION_REDUCE", 4))),
+            "min_area": float(o.get("motion_min_area", getattr(settings, "COUNTER_MOTION_MIN_AREA", 0.005))),
+            "hold_s": float(o.get("motion_hold_s", getattr(settings, "COUNTER_MOTION_HOLD_S", 1.0))),
+        }
+        if motion_gate["method"] not in MOTION_METHODS:
+            return {"ok": False, "running": False, "error": f"invalid motion_method: {motion_gate['method']}"}
+
+    roi_band = float(o.get("roi_band", getattr(settings, "COUNTER_ROI_BAND", 0.4)))
+    roi_imgsz = int(o.get("roi_imgsz", getattr(settings, "COUNTER_ROI_IMGSZ", 0)))
+
+    # --- RGB cameras (mỗi camera 1 lane: line_x / camera_side / tracker / ROI riêng) ---
+    try:
+        cam_cfgs = _camera_configs(o, settings)
+        roi_cfg = _roi_config(o, settings)
+        rois = [DetectRoi.from_config(c.get("roi", roi_cfg), band_ratio=roi_band, imgsz=roi_imgsz)
+                for c in cam_cfgs]
+    except (ValueError, TypeError) as e:
+        log.warning("COUNTER_CAMERAS / COUNTER_ROI không hợp lệ: %s", e)
+        return {"ok": False, "running": False, "error": f"invalid cameras/roi: {e}"}
+    multi = len(cam_cfgs) > 1
+    lanes: List[CounterLane] = []
+    for i, c in enumerate(cam_cfgs):
+        cam = _open_lane_camera(c, o, settings, multi=multi)
+        if cam is None:
+            for ln in lanes:
+                ln.rs.close()
+            return {"ok": False, "running": False, "error": "camera busy"}
+        lanes.append(CounterLane(
+            c.get("name") or (f"cam{i}" if multi else str(c.get("device", "rgb"))), cam,
+            camera_side=c.get("camera_side", camera_side),
+            line_x_ratio=float(c.get("line_x", line_x)),
+            roi=rois[i],
+        ))
+
+    # --- YOLO model (registry: dùng chung / cache giữa các lần start) ---
+    # COUNTER_BACKEND=onnx -> ONNX Runtime CPU (COUNTER_ONNX_WEIGHTS) thay cho ultralytics/torch
+    weights = o.get("yolo_weights", getattr(settings, "COUNTER_YOLO_WEIGHTS", "yolo11s.pt"))
+    try:
+        weights, device, backend = detector_spec(settings, "COUNTER", weights,
+                                                 getattr(settings, "COUNTER_DEVICE", "auto"), o)
+        yolo_model = acquire_detector(weights, device=device, backend=backend, owner="counter",
+                                      conf=float(o.get("conf", getattr(settings, "COUNTER_CONF", 0.35))))
+    except Exception as e:
+        for ln in lanes:
+            ln.rs.close()
+        log.warning("Counter: load model %s lỗi: %s", weights, e)
+        return {"ok": False, "running": False, "error": f"model load failed: {e}"}
 
     # NOTE: không truyền 'conf' / 'device' vì CounterService.start không hỗ trợ
     service.start(
-        rs_wrapper=cam,
+        rs_wrapper=lanes[0].rs,
         yolo_wrapper=yolo_model,
         camera_side=camera_side,
         line_x_ratio=line_x,
@@ -49,9 +148,18 @@ def start_counter_uc(service, *, settings=settings, overrides: Optional[Dict[str
         max_dist=max_dist,
         enter_window=enter_window,
         log_interval=log_interval,
+        lanes=lanes,
+        keyframe_interval=keyframe_interval,
+        keyframe_min_conf=keyframe_min_conf,
+        motion_gate=motion_gate,
     )
+    if not service.is_running():
+        for ln in lanes:
+            ln.rs.close()  # trả lease / huỷ subscription nếu service không start được
+        yolo_model.release()
 
-    log.info("Counter requested start | side=%s line=%.2f (RGB cam)", camera_side, line_x)
+    log.info("Counter requested start | %d camera(s) %s (RGB cam)", len(lanes),
+             ", ".join(f"{ln.name}:side={ln.camera_side} line={ln.line_x_ratio:.2f}" for ln in lanes))
     return {"ok": True, "running": service.is_running()}
 
 
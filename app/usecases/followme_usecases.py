@@ -2,51 +2,44 @@
 from __future__ import annotations
 import logging
 from typing import Dict, Any
-import pyrealsense2 as rs
 from app.services.followme_service import FollowMeService
 from app.plugins.followme_engine import FollowMeEngine
+from app.hardware.realsense_camera import RealSenseCamera
+from app.hardware.recording import ReplayCamera
+from app.hardware.rs_filters import DepthFilterChain
+from app.hardware.watchdog import watch_camera
+from app.core.model_registry import detector_spec
 
 log = logging.getLogger("vision.usecases.followme")
 
-class RSAlignWrapper:
-    def __init__(self, width=640, height=480, fps=30):
-        self.pipe = rs.pipeline()
-        cfg = rs.config()
-        cfg.enable_stream(rs.stream.depth, width, height, rs.format.z16, fps)
-        cfg.enable_stream(rs.stream.color, width, height, rs.format.bgr8, fps)
-        self.align = rs.align(rs.stream.color)
-        self.pipe.start(cfg)
-
-    def get_frames(self):
-        frames = self.pipe.wait_for_frames()
-        frames = self.align.process(frames)
-        depth = frames.get_depth_frame()
-        color = frames.get_color_frame()
-        if not depth or not color:
-            return None, depth
-        import numpy as np
-        img = None
-        try:
-            img = np.asanyarray(color.get_data())
-        except Exception:
-            img = None
-        return img, depth
-
-    def stop(self):
-        try:
-            self.pipe.stop()
-        except Exception:
-            pass
-
 def start_followme_uc(service: FollowMeService, *, settings, overrides: Dict[str, Any] | None = None) -> Dict[str, Any]:
     o = overrides or {}
-    rsw = RSAlignWrapper(
-        width=int(o.get("rs_width", getattr(settings, "RS_WIDTH", 640))),
-        height=int(o.get("rs_height", getattr(settings, "RS_HEIGHT", 480))),
-        fps=int(o.get("rs_fps", getattr(settings, "RS_FPS", 30))),
-    )
+    if o.get("replay"):
+        # phát lại session đã ghi (app.hardware.recording) thay cho RealSense thật
+        rsw = ReplayCamera(str(o["replay"]), realtime=bool(o.get("replay_realtime", True)),
+                           loop=bool(o.get("replay_loop", False)))
+    else:
+        chain = None
+        if bool(o.get("depth_filters", getattr(settings, "FOLLOWME_DEPTH_FILTERS", True))):
+            chain = DepthFilterChain.from_settings(settings, o.get("rs_filters"))
+        rsw = RealSenseCamera(
+            width=int(o.get("rs_width", getattr(settings, "RS_WIDTH", 640))),
+            height=int(o.get("rs_height", getattr(settings, "RS_HEIGHT", 480))),
+            fps=int(o.get("rs_fps", getattr(settings, "RS_FPS", 30))),
+            threaded=bool(getattr(settings, "RS_THREADED", True)),
+            queue_depth=int(getattr(settings, "RS_QUEUE_DEPTH", 2)),
+            depth_mode=str(o.get("rs_depth_mode", getattr(settings, "RS_DEPTH_MODE", "align"))),
+            filter_chain=chain,
+        )
+        rsw = watch_camera(rsw, "follow_me")
+    rsw.open()
+    weights, device, backend = detector_spec(settings, "FOLLOWME",
+                                             o.get("yolo_weights", getattr(settings, "YOLO_MODEL", "yolo11s.pt")),
+                                             "auto", o)
     engine = FollowMeEngine(config={
-        "yolo_weights": o.get("yolo_weights", getattr(settings, "YOLO_MODEL", "yolo11s.pt")),
+        "yolo_weights": weights,
+        "yolo_device":  device,
+        "yolo_backend": backend,
         "yolo_conf":    float(o.get("yolo_conf", 0.5)),
         "recognition_range_m": float(o.get("FOLLOWME_RECOG_RANGE_M", 2.5)),
         "face_distance_thr":   float(o.get("FOLLOWME_FACE_THR", 0.40)),
@@ -5,21 +5,49 @@ import logging
 
 from app.configs.settings import settings
 from app.hardware.rgb_camera import OpenCVCamera
+from app.hardware.frame_bus import frame_buses
+from app.core.camera_pool import camera_leases
+from app.hardware.watchdog import watch_camera
 from app.plugins.tag_engine import TagEngine, TagEngineConfig
 
 log = logging.getLogger("vision.uc.tag")
 
 def start_tag_uc(service, *, settings=settings, overrides: Optional[Dict[str, Any]] = None):
     # 2D RGB @ 640x480
+    o = overrides or {}
+    device = o.get("rgb_device", getattr(settings, "TAG_RGB_DEVICE", 0))
+    gray_reduce = int(o.get("gray_reduce", getattr(settings, "TAG_GRAY_REDUCE", 1)))
     cam = OpenCVCamera(
-        device=getattr(settings, "TAG_RGB_DEVICE", 0),
+        device=device,
         width=getattr(settings, "TAG_RGB_WIDTH", 640),
         height=getattr(settings, "TAG_RGB_HEIGHT", 480),
         fps=getattr(settings, "TAG_RGB_FPS", 30),
         use_mjpg=getattr(settings, "RGB_USE_MJPEG", True),
         buffer_size=getattr(settings, "RGB_BUFFERSIZE", 2),
+        threaded=getattr(settings, "RGB_THREADED_CAPTURE", False),
+        wait_timeout_s=getattr(settings, "RGB_WAIT_TIMEOUT_S", 0.1),
+        # rgb_device có thể là video / thư mục ảnh / glob -> phát lại footage đã ghi
+        loop=bool(o.get("rgb_loop", True)),
+        realtime=bool(o.get("rgb_realtime", True)),
+        # engine chỉ dùng gray -> lấy MJPEG thô, decode thẳng gray trên worker pool
+        raw_mjpeg=bool(o.get("raw_mjpeg", getattr(settings, "TAG_RAW_MJPEG", False))),
+        decode=f"gray{gray_reduce}" if gray_reduce in (2, 4, 8) else "gray",
+        decode_workers=int(getattr(settings, "RGB_DECODE_WORKERS", 2)),
     )
 
+    cam = watch_camera(cam, "tagdata")
+
+    if getattr(settings, "FRAME_BUS_ENABLED", False):
+        # dùng chung capture với các engine RGB khác trên cùng thiết bị
+        cam = frame_buses.subscribe(cam, "tagdata",
+                                    maxlen=int(getattr(settings, "FRAME_BUS_QUEUE", 2)),
+                                    drop_policy=getattr(settings, "FRAME_BUS_DROP_POLICY", "drop_oldest"))
+    elif getattr(settings, "CAMERA_WARM_POOL", True):
+        # giữ thiết bị mở giữa các lần đổi method, trao tay qua lease thay vì đóng/mở lại
+        cam = camera_leases.lease(cam, "tagdata", timeout=float(getattr(settings, "CAMERA_LEASE_TIMEOUT_S", 5.0)))
+        if cam is None:
+            return {"ok": False, "running": False, "error": "camera busy"}
+
     cfg = TagEngineConfig(
         calib_file=getattr(settings, "TAG_CALIB_FILE", "/app/models/camera_calib2.npz"),
         tag_size_m=float(getattr(settings, "TAG_SIZE_M", 0.135)),
@@ -32,12 +60,15 @@ def start_tag_uc(service, *, settings=settings, overrides: Optional[Dict[str, An
         alpha_pos=float(getattr(settings, "TAG_ALPHA_POS", 0.25)),
         alpha_dist=float(getattr(settings, "TAG_ALPHA_DIST", 0.25)),
         alpha_angle=float(getattr(settings, "TAG_ALPHA_ANGLE", 0.25)),
+        gray_reduce=gray_reduce,
     )
     engine = TagEngine(cfg)
 
     service.start(rs=cam, engine=engine)
+    if not service.is_running():
+        cam.close()  # trả lease / huỷ subscription nếu service không start được
     log.info("tagdata start | dev=%s %dx%d@%dfps | calib=%s | size=%.3fm | family=%s",
-             getattr(settings, "TAG_RGB_DEVICE", 0),
+             device,
              getattr(settings, "TAG_RGB_WIDTH", 640),
              getattr(settings, "TAG_RGB_HEIGHT", 480),
              getattr(settings, "TAG_RGB_FPS", 30),
@@ -5,21 +5,44 @@ import logging
 
 from app.configs.settings import settings
 from app.hardware.rgb_camera import OpenCVCamera
+from app.hardware.frame_bus import frame_buses
+from app.core.camera_pool import camera_leases
+from app.hardware.watchdog import watch_camera
 from app.plugins.unphysics_engine import UnphysicsEngine
 
 log = logging.getLogger("vision.uc.unphysics")
 
 def start_unphysics_uc(service, *, settings=settings, overrides: Optional[Dict[str, Any]] = None):
     # FIX cứng 640x480@30 và thiết bị RGB từ settings (đã set 640x480)
+    o = overrides or {}
+    device = o.get("rgb_device", getattr(settings, "UNPHYSICS_RGB_DEVICE", "/dev/video0"))
     cam = OpenCVCamera(
-        device=getattr(settings, "UNPHYSICS_RGB_DEVICE", "/dev/video0"),
+        device=device,
         width=getattr(settings, "UNPHYSICS_RGB_WIDTH", 640),
         height=getattr(settings, "UNPHYSICS_RGB_HEIGHT", 480),
         fps=getattr(settings, "UNPHYSICS_RGB_FPS", 30),
         use_mjpg=getattr(settings, "RGB_USE_MJPEG", True),
         buffer_size=getattr(settings, "RGB_BUFFERSIZE", 2),
+        threaded=getattr(settings, "RGB_THREADED_CAPTURE", False),
+        wait_timeout_s=getattr(settings, "RGB_WAIT_TIMEOUT_S", 0.1),
+        # rgb_device có thể là video / thư mục ảnh / glob -> phát lại footage đã ghi
+        loop=bool(o.get("rgb_loop", True)),
+        realtime=bool(o.get("rgb_realtime", True)),
     )
 
+    cam = watch_camera(cam, "control_unphysics")
+
+    if getattr(settings, "FRAME_BUS_ENABLED", False):
+        # dùng chung capture với các engine RGB khác trên cùng thiết bị
+        cam = frame_buses.subscribe(cam, "control_unphysics",
+                                    maxlen=int(getattr(settings, "FRAME_BUS_QUEUE", 2)),
+                                    drop_policy=getattr(settings, "FRAME_BUS_DROP_POLICY", "drop_oldest"))
+    elif getattr(settings, "CAMERA_WARM_POOL", True):
+        # giữ thiết bị mở giữa các lần đổi method, trao tay qua lease thay vì đóng/mở lại
+        cam = camera_leases.lease(cam, "control_unphysics", timeout=float(getattr(settings, "CAMERA_LEASE_TIMEOUT_S", 5.0)))
+        if cam is None:
+            return {"ok": False, "running": False, "error": "camera busy"}
+
     # Engine không cần overrides — dùng default theo unphysics.py
     engine = UnphysicsEngine(config={
         "center_radius": 40,
@@ -32,9 +55,11 @@ def start_unphysics_uc(service, *, settings=settings, overrides: Optional[Dict[s
     })
 
     service.start(rs=cam, engine=engine)
+    if not service.is_running():
+        cam.close()  # trả lease / huỷ subscription nếu service không start được
     log.info(
         "Unphysics start | dev=%s %dx%d@%dfps | cooldown=1100ms | CENTER by stationary tip 150ms, pull=70px",
-        getattr(settings, "UNPHYSICS_RGB_DEVICE", "/dev/video0"),
+        device,
         getattr(settings, "UNPHYSICS_RGB_WIDTH", 640),
         getattr(settings, "UNPHYSICS_RGB_HEIGHT", 480),
         getattr(settings, "UNPHYSICS_RGB_FPS", 30),
@@ -0,0 +1,74 @@
+# app/utils/box_flow.py
+from __future__ import annotations
+
+from typing import Dict, Tuple
+
+import cv2
+import numpy as np
+
+Box = Tuple[int, int, int, int]
+
+
+class BoxFlow:
+    """
+    Đẩy bbox từ frame trước sang frame hiện tại bằng Lucas-Kanade thưa: lấy góc
+    (goodFeaturesToTrack) trong từng box, 1 lần calcOpticalFlowPyrLK xuôi + 1 lần ngược
+    cho mọi điểm, giữ điểm có sai số forward-backward nhỏ, dịch box theo median độ dời.
+    conf = tỉ lệ điểm tốt của box (0 nếu quá ít điểm -> box giữ nguyên).
+    """
+
+    def __init__(self, *, max_corners: int = 30, min_points: int = 5, fb_err_px: float = 1.5,
+                 win: int = 15, levels: int = 2, quality: float = 0.01, min_distance: int = 4):
+        self.max_corners = int(max_corners)
+        self.min_points = int(min_points)
+        self.fb_err_px = float(fb_err_px)
+        self.lk = dict(winSize=(int(win), int(win)), maxLevel=int(levels),
+                       criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+        self.quality = float(quality)
+        self.min_distance = int(min_distance)
+
+    def _features(self, gray: np.ndarray, box: Box) -> np.ndarray:
+        h, w = gray.shape[:2]
+        x1, y1, x2, y2 = max(0, box[0]), max(0, box[1]), min(w, box[2]), min(h, box[3])
+        if x2 - x1 < 8 or y2 - y1 < 8:
+            return np.empty((0, 2), np.float32)
+        pts = cv2.goodFeaturesToTrack(gray[y1:y2, x1:x2], self.max_corners, self.quality, self.min_distance)
+        if pts is None:
+            return np.empty((0, 2), np.float32)
+        return pts.reshape(-1, 2) + np.float32((x1, y1))
+
+    def propagate(self, prev_gray: np.ndarray, gray: np.ndarray,
+                  boxes: Dict[int, Box]) -> Dict[int, Tuple[Box, float]]:
+        out: Dict[int, Tuple[Box, float]] = {k: (b, 0.0) for k, b in boxes.items()}
+        if not boxes or prev_gray is None or prev_gray.shape != gray.shape:
+            return out
+        ids, feats = [], []
+        for k, b in boxes.items():
+            p = self._features(prev_gray, b)
+            ids.append(np.full(len(p), k))
+            feats.append(p)
+        p0 = np.concatenate(feats).astype(np.float32)
+        if len(p0) == 0:
+            return out
+        owner = np.concatenate(ids)
+        p1, st, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, p0.reshape(-1, 1, 2), None, **self.lk)
+        pb, st_b, _ = cv2.calcOpticalFlowPyrLK(gray, prev_gray, p1, None, **self.lk)
+        p1 = p1.reshape(-1, 2)
+        fb_err = np.linalg.norm(pb.reshape(-1, 2) - p0, axis=1)
+        good = (st.ravel() == 1) & (st_b.ravel() == 1) & (fb_err < self.fb_err_px)
+        d = p1 - p0
+        h, w = gray.shape[:2]
+        for k, b in boxes.items():
+            m = owner == k
+            n = int(m.sum())
+            g = m & good
+            ng = int(g.sum())
+            if ng < self.min_points:
+                continue
+            dx, dy = np.median(d[g], axis=0)
+            x1, y1, x2, y2 = b
+            bw, bh = x2 - x1, y2 - y1
+            nx1 = int(round(min(max(x1 + dx, -bw / 2), w - bw / 2)))
+            ny1 = int(round(min(max(y1 + dy, -bh / 2), h - bh / 2)))
+            out[k] = ((nx1, ny1, nx1 + bw, ny1 + bh), ng / max(1, n))
+        return out
@@ -0,0 +1,58 @@
+# app/utils/buffer_pool.py
+from __future__ import annotations
+
+import threading
+from typing import Dict, Tuple
+
+import numpy as np
+
+
+class BufferPool:
+    """
+    Pool buffer dùng lại cho các phép chuyển đổi ảnh trong hot loop (ghi qua dst=).
+    Mỗi (tag, dtype) giữ 1 buffer phẳng; get() trả view C-contiguous đúng shape.
+    Shape cố định (full frame) luôn hit; ROI đổi kích thước giữa các frame vẫn dùng
+    lại vùng nhớ cũ miễn là không lớn hơn, lớn hơn thì cấp phát lại (miss).
+
+    Nội dung buffer bị ghi đè ở lần get() kế tiếp cùng tag -> không giữ qua frame.
+    """
+
+    def __init__(self, name: str = "") -> None:
+        self.name = name
+        self._bufs: Dict[Tuple[str, str], np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_allocated = 0
+
+    def get(self, tag: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        dt = np.dtype(dtype)
+        shape = tuple(int(s) for s in shape)
+        n = int(np.prod(shape)) if shape else 1
+        key = (tag, dt.str)
+        with self._lock:
+            flat = self._bufs.get(key)
+            if flat is not None and flat.size >= n:
+                self.hits += 1
+            else:
+                flat = np.empty(n, dtype=dt)
+                self._bufs[key] = flat
+                self.misses += 1
+                self.bytes_allocated += flat.nbytes
+        return flat[:n].reshape(shape)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "bytes_allocated": self.bytes_allocated,
+                "bytes_held": sum(b.nbytes for b in self._bufs.values()),
+                "buffers": len(self._bufs),
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._bufs.clear()
@@ -0,0 +1,99 @@
+# app/utils/motion_gate.py
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+MOTION_METHODS = ("diff", "mog2")
+
+
+class MotionGate:
+    """
+    Cổng chuyển động rẻ tiền cho 1 camera: chỉ xét dải dọc quanh line (band_ratio * width),
+    trên gray thu nhỏ 1/reduce. method="diff": sai khác với frame trước; "mog2": background
+    subtractor MOG2. Có chuyển động (tỉ lệ pixel đổi >= min_area) -> mở cổng, giữ mở thêm
+    hold_s sau lần chuyển động cuối. stats(): thời gian gated / active, số lần thức dậy.
+    """
+
+    def __init__(self, *, method: str = "diff", band_ratio: float = 0.3, reduce: int = 4,
+                 min_area: float = 0.005, diff_thresh: int = 25, hold_s: float = 1.0):
+        if method not in MOTION_METHODS:
+            raise ValueError(f"motion method '{method}' không hỗ trợ (hỗ trợ: {', '.join(MOTION_METHODS)})")
+        self.method = method
+        self.band_ratio = float(band_ratio)
+        self.reduce = max(1, int(reduce))
+        self.min_area = float(min_area)
+        self.diff_thresh = int(diff_thresh)
+        self.hold_s = float(hold_s)
+        self._prev: Optional[np.ndarray] = None
+        self._mog = (cv2.createBackgroundSubtractorMOG2(history=300, varThreshold=16, detectShadows=False)
+                     if method == "mog2" else None)
+        self.active = True   # frame đầu luôn detect
+        self.last_motion = time.monotonic()
+        self._last_ts: Optional[float] = None
+        self.score = 0.0
+        self.gated_s = 0.0
+        self.active_s = 0.0
+        self.gated_frames = 0
+        self.active_frames = 0
+        self.wakeups = 0
+
+    def _band(self, gray: np.ndarray, line_x_ratio: float) -> np.ndarray:
+        if self.band_ratio >= 1.0:
+            return gray
+        w = gray.shape[1]
+        half = max(4, int(w * self.band_ratio / 2))
+        cx = int(w * line_x_ratio)
+        return gray[:, max(0, cx - half):min(w, cx + half)]
+
+    def _score(self, band: np.ndarray) -> float:
+        band = cv2.GaussianBlur(band, (5, 5), 0)
+        if self._mog is not None:
+            fg = self._mog.apply(band)
+        else:
+            prev, self._prev = self._prev, band
+            if prev is None or prev.shape != band.shape:
+                return 1.0
+            fg = cv2.threshold(cv2.absdiff(band, prev), self.diff_thresh, 255, cv2.THRESH_BINARY)[1]
+        return cv2.countNonZero(fg) / float(fg.size or 1)
+
+    def update(self, fb, line_x_ratio: float, now: Optional[float] = None) -> bool:
+        """fb: FrameBundle (gray_reduced được cache / decode thẳng từ JPEG). Trả True nếu cần detect."""
+        now = time.monotonic() if now is None else now
+        if self._last_ts is not None:
+            dt = now - self._last_ts
+            if self.active:
+                self.active_s += dt
+            else:
+                self.gated_s += dt
+        self._last_ts = now
+
+        self.score = self._score(self._band(fb.gray_reduced(self.reduce), line_x_ratio))
+        if self.score >= self.min_area:
+            self.last_motion = now
+        active = (now - self.last_motion) <= self.hold_s
+        if active and not self.active:
+            self.wakeups += 1
+        self.active = active
+        if active:
+            self.active_frames += 1
+        else:
+            self.gated_frames += 1
+        return active
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.gated_s + self.active_s
+        return {
+            "method": self.method,
+            "active": self.active,
+            "score": round(self.score, 4),
+            "gated_s": round(self.gated_s, 1),
+            "active_s": round(self.active_s, 1),
+            "gated_ratio": round(self.gated_s / total, 3) if total > 0 else None,
+            "gated_frames": self.gated_frames,
+            "active_frames": self.active_frames,
+            "wakeups": self.wakeups,
+        }
@@ -0,0 +1,85 @@
+# app/utils/roi.py
+from __future__ import annotations
+
+from typing import Any, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+# (ox, oy): box_frame = box_crop + (ox, oy)
+RoiTransform = Tuple[int, int]
+
+
+class DetectRoi:
+    """
+    Vùng detect của 1 camera cửa: dải dọc quanh line (band_ratio * width) hoặc polygon
+    (toạ độ tỉ lệ 0..1, vd [[0.3,0],[0.7,0],[0.7,1],[0.3,1]]). Detector chỉ nhận crop
+    bao quanh vùng ở độ phân giải gốc (ngoài polygon tô xám 114 như letterbox); imgsz > 0 là
+    kích thước inference truyền cho detector (ultralytics imgsz= / ONNX export H/W động) thay
+    cho 640 mặc định. to_frame() đưa box về toạ độ frame gốc cho tracker.
+    """
+
+    def __init__(self, *, band_ratio: Optional[float] = None,
+                 polygon: Optional[Sequence[Sequence[float]]] = None, imgsz: int = 0):
+        if polygon is not None and len(polygon) < 3:
+            raise ValueError("ROI polygon cần >= 3 điểm")
+        self.band_ratio = None if band_ratio is None else float(band_ratio)
+        self.polygon = None if polygon is None else np.asarray(polygon, dtype=np.float32).reshape(-1, 2)
+        self.imgsz = max(0, int(imgsz))
+        self._mask_key: Optional[Tuple[int, int, float]] = None
+        self._rect = (0, 0, 0, 0)
+        self._mask: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_config(cls, cfg: Any, *, band_ratio: float = 0.4, imgsz: int = 0) -> Optional["DetectRoi"]:
+        """cfg: ""/None -> tắt, "band" -> dải quanh line, list điểm -> polygon, dict -> kwargs."""
+        if cfg is None or cfg == "" or cfg is False:
+            return None
+        if isinstance(cfg, str):
+            if cfg.lower() != "band":
+                raise ValueError(f"ROI '{cfg}' không hỗ trợ (band | polygon)")
+            return cls(band_ratio=band_ratio, imgsz=imgsz)
+        if isinstance(cfg, dict):
+            return cls(**{"imgsz": imgsz, **cfg})
+        return cls(polygon=cfg, imgsz=imgsz)
+
+    def _rect_mask(self, h: int, w: int, line_x_ratio: float):
+        key = (h, w, float(line_x_ratio))
+        if self._mask_key == key:
+            return self._rect, self._mask
+        mask = None
+        if self.polygon is not None:
+            pts = np.round(self.polygon * (w, h)).astype(np.int32)
+            x, y, rw, rh = cv2.boundingRect(pts)
+            x1, y1, x2, y2 = max(0, x), max(0, y), min(w, x + rw), min(h, y + rh)
+            mask = np.zeros((y2 - y1, x2 - x1), np.uint8)
+            cv2.fillPoly(mask, [pts - (x1, y1)], 255)
+            if cv2.countNonZero(mask) == mask.size:
+                mask = None   # polygon là hình chữ nhật -> chỉ cần crop
+        else:
+            half = int(w * float(self.band_ratio or 1.0) / 2)
+            cx = int(w * line_x_ratio)
+            x1, y1, x2, y2 = max(0, cx - half), 0, min(w, cx + half), h
+        self._mask_key, self._rect, self._mask = key, (x1, y1, x2, y2), mask
+        return self._rect, mask
+
+    def crop(self, frame: np.ndarray, line_x_ratio: float = 0.5) -> Tuple[np.ndarray, RoiTransform]:
+        h, w = frame.shape[:2]
+        (x1, y1, x2, y2), mask = self._rect_mask(h, w, line_x_ratio)
+        img = frame[y1:y2, x1:x2]
+        if mask is not None:
+            img = img.copy()
+            img[mask == 0] = 114
+        return img, (x1, y1)
+
+    @staticmethod
+    def to_frame(boxes: np.ndarray, tf: RoiTransform) -> np.ndarray:
+        """(N,4) xyxy trong crop -> toạ độ frame (int32)."""
+        ox, oy = tf
+        if len(boxes) == 0:
+            return boxes
+        return np.asarray(boxes, dtype=np.int32) + np.int32((ox, oy, ox, oy))
+
+    def describe(self) -> str:
+        kind = "polygon" if self.polygon is not None else f"band={self.band_ratio:.2f}"
+        return f"{kind} imgsz={self.imgsz or 'native'}"